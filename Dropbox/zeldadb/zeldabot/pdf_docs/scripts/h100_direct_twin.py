@@ -8,7 +8,7 @@ import sys
 import json
 import psycopg2
 import tempfile
-import base64
+import binascii
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 import requests
@@ -34,8 +34,8 @@ Identifiera namn på personer och företag.
 ENDAST JSON - Respond ONLY with a SINGLE minified JSON object:
 {"chairman": "", "board_members": [], "auditor_name": "", "audit_firm": "", "annual_meeting_date": ""}"""
 
-def pdf_to_images(pdf_binary: bytes) -> List[str]:
-    """Convert PDF to base64 encoded images"""
+def pdf_to_images(pdf_binary: bytes) -> List[bytes]:
+    """Convert PDF to base64 encoded images (ASCII bytes, ready for tools.payload.Blob)"""
     try:
         import fitz  # PyMuPDF
         doc = fitz.open(stream=pdf_binary, filetype="pdf")
@@ -45,8 +45,7 @@ def pdf_to_images(pdf_binary: bytes) -> List[str]:
             page = doc[page_num]
             pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))  # 2x zoom
             img_data = pix.tobytes("png")
-            b64_img = base64.b64encode(img_data).decode()
-            images.append(b64_img)
+            images.append(binascii.b2a_base64(img_data, newline=False))
         
         doc.close()
         return images
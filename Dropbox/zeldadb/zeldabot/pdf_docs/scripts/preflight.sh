@@ -13,7 +13,8 @@ if ! echo "$DATABASE_URL" | grep -E "zelda_arsredovisning" >/dev/null; then
   echo "❌ DATABASE_URL must target zelda_arsredovisning"; exit 12; fi
 
 # 2) Corpus size must be large enough (≥100, expected 200 on H100)  
-DOCS=$(PGPASSWORD='Zelda4Ever!' psql "$DATABASE_URL" -XtAc "SELECT COUNT(*) FROM arsredovisning_documents;" || echo "0")
+#    Planner estimate floored by an exact count capped at 100, instead of COUNT(*) over the blob table
+DOCS=$(PGPASSWORD='Zelda4Ever!' psql "$DATABASE_URL" -XtAc "SELECT GREATEST(c.reltuples::bigint, (SELECT count(*) FROM (SELECT 1 FROM arsredovisning_documents LIMIT 100) t)) FROM pg_class c WHERE c.oid = 'arsredovisning_documents'::regclass;" || echo "0")
 if [ -z "$DOCS" ] || [ "$DOCS" -lt 100 ]; then
   echo "❌ Expected ≥100 docs in production DB, found: $DOCS"; exit 13; fi
 
@@ -15,6 +15,9 @@ def main():
     parser = argparse.ArgumentParser(description="Run production extraction pipeline")
     parser.add_argument("--run-id", required=True, help="Run ID for tracking")
     parser.add_argument("--limit", type=int, default=1, help="Number of documents to process")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("PROD_WORKERS", "1")), help="Worker processes (documents are sharded across them)")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("PROD_DOC_CONCURRENCY", "1")), help="Documents in flight per worker")
+    parser.add_argument("--continue-on-failure", action="store_true", help="Attempt every document instead of stopping at the first gate failure or error")
     args = parser.parse_args()
     
     # Environment validation
@@ -34,7 +37,8 @@ def main():
     # Import and run
     try:
         from pipeline.prod import run_from_db
-        result = run_from_db(args.run_id, args.limit)
+        result = run_from_db(args.run_id, args.limit, workers=args.workers,
+                             continue_on_failure=args.continue_on_failure, concurrency=args.concurrency)
         sys.exit(result)
     except ImportError as e:
         print(f"❌ Failed to import production pipeline: {e}")
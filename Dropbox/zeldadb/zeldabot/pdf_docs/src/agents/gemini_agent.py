@@ -6,16 +6,18 @@ Gemini agent for BRF extraction (twin mode).
 - Hardened parser for candidates/content/parts
 """
 import os
+import sys
 import time
 import json
 import requests
-import base64
 import fitz
-import io
 from typing import Dict, Any, List
 from google.auth.transport.requests import Request
 from google.oauth2 import service_account
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "orchestrator"))
+from tools.payload import Blob, encode_image, dumps as dump_payload, JSON_HEADERS
+
 
 class GeminiAgent:
     def __init__(self):
@@ -78,8 +80,7 @@ class GeminiAgent:
             if p-1 < 0 or p-1 >= len(doc): 
                 continue
             pix = doc.load_page(p-1).get_pixmap(dpi=150)
-            buf = io.BytesIO(pix.tobytes(output="jpeg"))
-            data = base64.b64encode(buf.getvalue()).decode()
+            data = Blob(encode_image(pix.tobytes(output="jpeg")))  # spliced into the body by dump_payload
             images.append({"inline_data": {"mime_type": "image/jpeg", "data": data}})
         doc.close()
         return images
@@ -122,7 +123,7 @@ class GeminiAgent:
         # Vertex AI format is already correct with role: "user"
         
         try:
-            r = self.session.post(self.endpoint, headers=headers, json=body, timeout=240)
+            r = self.session.post(self.endpoint, headers={**headers, **JSON_HEADERS}, data=dump_payload(body), timeout=240)
             r.raise_for_status()
             latency_ms = int((time.time() - t0) * 1000)
 
@@ -138,6 +139,14 @@ class GeminiAgent:
             }
 
             result = r.json()
+            # Token accounting (usageMetadata is absent on some error/blocked responses)
+            usage = result.get("usageMetadata") or {}
+            receipt.update({
+                "image_bytes": sum(len(i["inline_data"]["data"]) for i in images),
+                "prompt_tokens": usage.get("promptTokenCount"),
+                "completion_tokens": usage.get("candidatesTokenCount"),
+                "total_tokens": usage.get("totalTokenCount")
+            })
             # Robust text extraction
             parts = result.get("candidates", [{}])[0].get("content", {}).get("parts", [])
             content = parts[0].get("text", "{}") if parts else "{}"
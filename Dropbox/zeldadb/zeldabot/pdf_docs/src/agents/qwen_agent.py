@@ -61,6 +61,9 @@ class QwenAgent:
             
             result = response.json()
             response_text = result.get("response", "")
+            # Ollama token counts (prompt_eval_count is omitted when the prompt was fully cached)
+            receipt["prompt_tokens"] = result.get("prompt_eval_count", 0)
+            receipt["completion_tokens"] = result.get("eval_count")
             
             # Try to parse JSON response
             try:
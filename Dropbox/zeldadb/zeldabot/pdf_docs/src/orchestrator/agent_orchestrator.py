@@ -1,75 +1,278 @@
 
 #!/usr/bin/env python3
-import os, json, logging, base64, asyncio
-from typing import List, Dict, Any, Optional
+import os, re, json, logging, asyncio, hashlib, time, contextlib
+from typing import List, Dict, Any, Optional, Tuple, Union
 from pathlib import Path
 import fitz, aiohttp
+from metrics import SECTIONS, DISPATCH_SECONDS, RENDER_SECONDS, IN_FLIGHT, PAGE_REUSE
+from tools.json_scan import first_json
+from tools.payload import encode_image, data_url, dumps as dump_payload, JSON_HEADERS
+from result_merger import ResultMerger, section_schemas
+from page_index import get_index, fingerprint, prompt_sha, ORCH_PAGE_REUSE_KEYS
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('OrchestratorAgent_Final')
 
 QWEN_VL_API_URL = os.getenv('QWEN_VL_API_URL','http://127.0.0.1:5000/v1/chat/completions')
 ORCH_DPI = int(os.getenv('ORCH_DPI','200'))
+# 'prefix': shared system directive, then page images, then the section instruction, so requests over the
+# same pages share a token prefix for vLLM's automatic prefix caching. 'legacy': instruction, then images.
+ORCH_PROMPT_LAYOUT = os.getenv('ORCH_PROMPT_LAYOUT','legacy')
+SYSTEM_DIRECTIVE = ('Du analyserar sidor ur en svensk BRF årsredovisning. Följ instruktionen som kommer efter sidbilderna '
+                    'och svara ENDAST med ett enda minifierat JSON-objekt.')
+ORCH_MAX_IMAGES_PER_REQUEST = int(os.getenv('ORCH_MAX_IMAGES_PER_REQUEST','4'))
+# Request packing: prompt keys sharing a page set go out as one request (image prefill paid once). It rewrites the
+# section prompts into one merged schema, so it stays off until score_final_vs_golden shows no accuracy loss
+# (golden_runner_db with ORCH_PACK=1 against ORCH_PACK=0)
+ORCH_PACK = os.getenv('ORCH_PACK','0') == '1'
+ORCH_PACK_TOKEN_BUDGET = int(os.getenv('ORCH_PACK_TOKEN_BUDGET','6000'))            # prompt text + completion allowance per pack
+ORCH_PACK_COMPLETION_TOKENS = int(os.getenv('ORCH_PACK_COMPLETION_TOKENS','512'))   # completion allowance per packed key
+ORCH_PACK_MAX_IMAGES = int(os.getenv('ORCH_PACK_MAX_IMAGES','8'))
+# VLM requests in flight per event loop when callers share a limiter (sectionizer + orchestrator, all documents)
+ORCH_MAX_INFLIGHT = int(os.getenv('ORCH_MAX_INFLIGHT','16'))
+NOTE_HEADING = re.compile(r'(?m)^\s*not\s+(\d{1,2})\b', re.IGNORECASE)
+
+def segment_note_pages(pages: List[Tuple[int, Optional[str], bool]], max_images: int) -> List[Tuple[int, int, str]]:
+    """Group note pages into (start, end, prompt_key) runs.
+
+    pages: (page_num, prompt key from the page text, page starts a note) in page order. A page
+    without a note heading continues the previous note and inherits its key; contiguous pages
+    with the same key form one run, split every max_images pages."""
+    runs: List[List] = []; prev_key = None; prev_page = None
+    for num, key, heading in pages:
+        if not heading and prev_key is not None and prev_page == num - 1: key = prev_key
+        if key is not None:
+            last = runs[-1] if runs else None
+            if last and last[2] == key and last[1] == num - 1 and last[1] - last[0] + 1 < max(1, max_images): last[1] = num
+            else: runs.append([num, num, key])
+        prev_key, prev_page = key, num
+    return [tuple(r) for r in runs]
+
+def make_limiter(n: Optional[int] = None) -> Optional[asyncio.Semaphore]:
+    """Shared cap on in-flight VLM requests (None when n, default ORCH_MAX_INFLIGHT, is <= 0)."""
+    n = ORCH_MAX_INFLIGHT if n is None else n
+    return asyncio.Semaphore(n) if n > 0 else None
+
+def build_messages(prompt: str, images: List[bytes], layout: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Chat messages for one extraction request in the given (default ORCH_PROMPT_LAYOUT) layout.
+    Images are base64 bytes, carried as Blobs; serialize with tools.payload.dumps."""
+    parts = [{'type':'image_url','image_url':{'url':data_url(img)}} for img in images]
+    if (layout or ORCH_PROMPT_LAYOUT) == 'prefix':
+        return [{'role':'system','content':SYSTEM_DIRECTIVE}, {'role':'user','content':parts + [{'type':'text','text':prompt}]}]
+    return [{'role':'user','content':[{'type':'text','text':prompt}] + parts}]
+
+def _split_example(prompt: str) -> Optional[Tuple[str, Any]]:
+    """(instructions, JSON example) of a section prompt; the line introducing the example is dropped."""
+    hit = first_json(prompt)
+    if hit is None or not isinstance(hit[2], dict): return None
+    start, end, example = hit
+    head = prompt[:start].rstrip().split('\n')
+    if head and head[-1].rstrip().endswith(':'): head = head[:-1]
+    return ('\n'.join(head).strip() + '\n' + prompt[end:].strip()).strip(), example
+
+def pack_prompt(keys: List[str], prompts: Dict[str, str]) -> str:
+    """One prompt asking for every key's JSON under its own top-level key (merged schema)."""
+    parts = {k: _split_example(prompts[k]) for k in keys}
+    schema = json.dumps({k: parts[k][1] for k in keys}, ensure_ascii=False, separators=(',', ':'))
+    body = '\n\n'.join(f'### {k}\n{parts[k][0]}' for k in keys)
+    return (f'Denna begäran omfattar {len(keys)} extraktioner från samma sidor. Besvara var och en under sin egen nyckel.\n\n{body}\n\n'
+            f'ENDAST JSON - Respond ONLY with a SINGLE minified JSON object with exactly the top-level keys {", ".join(keys)}:\n{schema}')
+
+def plan_packs(keys: List[str], prompts: Dict[str, str], n_images: int) -> List[List[str]]:
+    """Greedily group keys that share a page set into packs within the token/image budget.
+    Keys without a JSON example in their prompt (nothing to merge into a schema) stay alone."""
+    if not ORCH_PACK or n_images > ORCH_PACK_MAX_IMAGES: return [[k] for k in keys]
+    packs: List[List[str]] = []; cur: List[str] = []; cost = 0
+    for k in keys:
+        if _split_example(prompts[k]) is None: packs.append([k]); continue
+        c = len(prompts[k]) // 4 + ORCH_PACK_COMPLETION_TOKENS
+        if cur and (cost + c > ORCH_PACK_TOKEN_BUDGET or k in cur): packs.append(cur); cur = []; cost = 0
+        cur.append(k); cost += c
+    if cur: packs.append(cur)
+    return packs
+
+class PromptRegistry:
+    """registry.json plus its templates, loaded and validated once.
+
+    Templates shared by several keys (e.g. notes.sv.tpl) are read once; each key exposes a content
+    hash; coaching suffixes are applied when prompts are built. maybe_reload() re-stats the files at
+    most every check_interval seconds and reloads only if an mtime changed."""
+    def __init__(self, path: str, coaching=None, check_interval: float = 2.0):
+        self.path = Path(path); self.coaching = coaching; self.check_interval = check_interval
+        self.generation = 0; self._built = None; self._built_key = None
+        self._load()
+
+    def _load(self):
+        with open(self.path,'r',encoding='utf-8') as f:
+            registry = json.load(f)
+        base_dir = self.path.parent.parent
+        texts: Dict[Path, Optional[str]] = {}
+        self.templates: Dict[str, str] = {}; self.sections: Dict[str, str] = {}; self.problems: List[str] = []
+        for key, config in registry.items():
+            if isinstance(config, dict) and "template_path" in config:
+                template_path = base_dir / config["template_path"]
+                if template_path not in texts:
+                    texts[template_path] = template_path.read_text(encoding='utf-8') if template_path.exists() else None
+                text = texts[template_path]
+                if text is None:
+                    print(f"⚠️  Template not found: {template_path}")
+                    self.problems.append(f"{key}: template not found"); text = f"Template missing for {key}"
+                self.templates[key] = text
+                # coaching section: explicit "section", else the template stem (balance_sheet.sv.tpl -> balance_sheet)
+                self.sections[key] = config.get("section") or template_path.name.split('.')[0]
+            else:
+                # Fallback for direct prompt content
+                self.templates[key] = str(config); self.sections[key] = key
+        self.hashes = {k: hashlib.sha256(v.encode('utf-8')).hexdigest() for k, v in self.templates.items()}
+        self.content_hash = hashlib.sha256(json.dumps(sorted(self.hashes.items())).encode()).hexdigest()
+        self._mtimes = {p: self._mtime(p) for p in [self.path, *texts]}
+        self._checked = time.monotonic(); self.generation += 1
+
+    @staticmethod
+    def _mtime(p: Path) -> Optional[float]:
+        try: return p.stat().st_mtime
+        except OSError: return None
+
+    def maybe_reload(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked < self.check_interval: return False
+        self._checked = now
+        if any(self._mtime(p) != m for p, m in self._mtimes.items()):
+            logger.info(f'Prompt registry changed on disk, reloading {self.path}')
+            self._load(); return True
+        return False
+
+    @property
+    def prompts(self) -> Dict[str, str]:
+        """Prompt per key with coaching suffixes applied; rebuilt only after a reload or new coaching"""
+        self.maybe_reload()
+        key = (self.generation, getattr(self.coaching, 'version', 0))
+        if self._built_key != key:
+            if self.coaching is None: self._built = dict(self.templates)
+            else: self._built = {k: t + self.coaching.prompt_suffix(self.sections[k]) for k, t in self.templates.items()}
+            self._built_key = key
+        return self._built
+
+    def __len__(self): return len(self.templates)
+
+_REGISTRIES: Dict[Tuple[str, int], PromptRegistry] = {}
+
+def get_registry(path: str, coaching=None) -> PromptRegistry:
+    """Process-wide shared registry per (path, coaching system)"""
+    k = (os.path.abspath(path), id(coaching))
+    reg = _REGISTRIES.get(k)
+    if reg is None: reg = _REGISTRIES[k] = PromptRegistry(path, coaching=coaching)
+    return reg
 
 def load_prompts(path: str) -> Dict[str, str]:
     """Load prompts from registry.json with template file resolution"""
-    with open(path,'r',encoding='utf-8') as f:
-        registry = json.load(f)
-    
-    prompts = {}
-    base_dir = Path(path).parent.parent
-    
-    for key, config in registry.items():
-        if isinstance(config, dict) and "template_path" in config:
-            template_path = base_dir / config["template_path"]
-            if template_path.exists():
-                with open(template_path, 'r', encoding='utf-8') as tf:
-                    prompts[key] = tf.read()
-            else:
-                print(f"⚠️  Template not found: {template_path}")
-                prompts[key] = f"Template missing for {key}"
-        else:
-            # Fallback for direct prompt content
-            prompts[key] = str(config)
-    
-    return prompts
+    return dict(get_registry(path).prompts)
 
 class OrchestratorAgent:
-    def __init__(self, pdf_path: str, prompts: Dict[str, str]):
+    def __init__(self, pdf_path: str, prompts: Dict[str, str], session: Optional[aiohttp.ClientSession] = None,
+                 limiter: Optional[asyncio.Semaphore] = None, dpi: Optional[int] = None):
         self.pdf_path=pdf_path; self.doc=fitz.open(pdf_path); self.prompts=prompts
+        self.dpi=dpi or ORCH_DPI  # ORCH_DPI is read at import; callers with a --dpi pass it here
+        # Optional caller-owned session and request limiter, shared with the sectionizer and other documents
+        self.session=session; self.limiter=limiter
+        self._page_cache: Dict[int, bytes] = {}  # page number -> base64 JPEG, so overlapping tasks render a page once
+        self.schemas = section_schemas(prompts); self.merger: Optional[ResultMerger] = None
+        # Page fingerprint index (ORCH_PAGE_REUSE=1): tasks whose pages match another document's reuse its result
+        self.page_index = get_index(); self._page_fps: Dict[int, Any] = {}
+        self.document_key: Optional[str] = None  # sha256 of the file, set on the first index lookup
+        # Resource accounting for this document; per-section counters are keyed by prompt key
+        self.usage: Dict[str, Any] = {'pages': len(self.doc), 'pages_rendered': 0, 'pixels': 0, 'render_s': 0.0, 'requests': 0, 'failed_requests': 0,
+                                      'image_bytes': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'request_s': 0.0, 'wall_s': 0.0,
+                                      'reuse_eligible': 0, 'reused_tasks': 0, 'sections': {}}
 
-    def _page_images_b64(self, start: int, end: int) -> List[str]:
-        return [base64.b64encode(self.doc[i].get_pixmap(dpi=ORCH_DPI).tobytes('jpeg')).decode('utf-8') for i in range(start-1,end)]
+    def _account(self, section: Union[str, List[str]], **counts):
+        # A packed request (list of prompt keys) counts once in the totals and is shared evenly between its keys
+        keys = [section] if isinstance(section, str) else section
+        for k, v in counts.items(): self.usage[k] += v
+        for key in keys:
+            sec = self.usage['sections'].setdefault(key, {'requests': 0, 'failed_requests': 0, 'image_bytes': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'request_s': 0.0})
+            for k, v in counts.items(): sec[k] += v / len(keys) if len(keys) > 1 else v
 
-    @staticmethod
-    def _deep_merge(d1: Dict, d2: Dict) -> Dict:
-        if not isinstance(d2, dict): return d1
-        for k,v in d2.items():
-            if k in d1 and isinstance(d1[k],dict) and isinstance(v,dict): d1[k]=OrchestratorAgent._deep_merge(d1[k],v)
-            elif k in d1 and isinstance(d1[k],list) and isinstance(v,list): d1[k].extend(v)
-            else: d1[k]=v
-        return d1
-
-    async def _dispatch(self, session: aiohttp.ClientSession, name: str, prompt: str, images: List[str]) -> Dict:
+    def _page_images_b64(self, start: int, end: int) -> List[bytes]:
+        t0 = time.perf_counter()
+        for n in range(start,end+1):
+            if n in self._page_cache: continue
+            with RENDER_SECONDS.time():
+                pix = self.doc[n-1].get_pixmap(dpi=self.dpi)
+                self._page_cache[n] = encode_image(pix.tobytes('jpeg'))
+            self.usage['pages_rendered'] += 1; self.usage['pixels'] += pix.width * pix.height
+        self.usage['render_s'] += time.perf_counter() - t0
+        return [self._page_cache[n] for n in range(start,end+1)]
+
+    async def _post(self, session: aiohttp.ClientSession, payload: Dict[str, Any]) -> Dict:
+        """POST one chat completion, waiting for a slot on the shared limiter first."""
+        async with self.limiter or contextlib.nullcontext():
+            IN_FLIGHT.inc()
+            try:
+                async with session.post(QWEN_VL_API_URL,data=dump_payload(payload),headers=JSON_HEADERS,timeout=180) as resp:
+                    resp.raise_for_status(); return await resp.json()
+            finally:
+                IN_FLIGHT.dec()
+
+    async def _dispatch(self, session: aiohttp.ClientSession, name: str, prompt: str, images: List[bytes], section: Union[str, List[str], None] = None, max_tokens: int = 2048) -> Dict:
         model_name = os.getenv('QWEN_MODEL_TAG', 'qwen2.5vl:7b')
-        payload={'model':model_name,'messages':[{'role':'user','content':[{'type':'text','text':prompt}] +                      [{'type':'image_url','image_url':{'url':f'data:image/jpeg;base64,{img}'}} for img in images]}],
-                 'max_tokens':2048,'temperature':0.0}
+        payload={'model':model_name,'messages':build_messages(prompt, images),
+                 'max_tokens':max_tokens,'temperature':0.0}
+        section = section or name; t0 = time.perf_counter()
+        self._account(section, requests=1, image_bytes=sum(len(i) for i in images))
+        status = 'failed'
         try:
-            async with session.post(QWEN_VL_API_URL,json=payload,timeout=180) as resp:
-                resp.raise_for_status(); content=(await resp.json())['choices'][0]['message']['content']
-                # Strip markdown code fences if present (handle text before fence)
-                if '```json' in content:
-                    import re
-                    match = re.search(r'```(?:json)?\s*\n(.*?)\n```', content, re.DOTALL)
-                    if match:
-                        content = match.group(1).strip()
-                elif content.strip().startswith('```'):
-                    lines = content.strip().split('\n')
-                    if len(lines) >= 3 and lines[0].startswith('```') and lines[-1] == '```':
-                        content = '\n'.join(lines[1:-1])
-                return json.loads(content)
+            body=await self._post(session,payload); content=body['choices'][0]['message']['content']
+            usage = body.get('usage') or {}
+            self._account(section, prompt_tokens=usage.get('prompt_tokens') or 0, completion_tokens=usage.get('completion_tokens') or 0)
+            # Strip markdown code fences if present (handle text before fence)
+            if '```json' in content:
+                import re
+                match = re.search(r'```(?:json)?\s*\n(.*?)\n```', content, re.DOTALL)
+                if match:
+                    content = match.group(1).strip()
+            elif content.strip().startswith('```'):
+                lines = content.strip().split('\n')
+                if len(lines) >= 3 and lines[0].startswith('```') and lines[-1] == '```':
+                    content = '\n'.join(lines[1:-1])
+            parsed = json.loads(content); status = 'ok'
+            return parsed
         except Exception as e:
+            self._account(section, failed_requests=1)
             logger.error(f"Task '{name}' failed: {e}"); return {'error': f'Task {name} failed: {e}'}
+        finally:
+            elapsed = time.perf_counter() - t0
+            self._account(section, request_s=elapsed)
+            for key in ([section] if isinstance(section, str) else section):
+                DISPATCH_SECONDS.observe(elapsed, section=key); SECTIONS.inc(section=key, status=status)
+
+    def _reuse_fingerprints(self, prompt_key: str, start: int, end: int) -> Optional[List[Any]]:
+        """Page fingerprints of a reuse-eligible task, or None (key not allowlisted, a page without text)."""
+        if prompt_key not in ORCH_PAGE_REUSE_KEYS: return None
+        for n in range(start, end+1):
+            if n not in self._page_fps: self._page_fps[n] = fingerprint(self.doc[n-1].get_text('text'))
+        fps = [self._page_fps[n] for n in range(start, end+1)]
+        return None if any(f is None for f in fps) else fps
+
+    def _page_reuse(self, groups: List[Tuple[int, int, List[Tuple[int, str, str, str]]]]) -> Tuple[Dict[int, Dict], Dict[int, List[Any]]]:
+        """Index lookups for the uncached tasks of a workflow; blocking (file hash, MinHash, SQLite), so run in a thread.
+        Returns slot -> reused result, and slot -> page fingerprints of the eligible tasks that missed."""
+        if self.document_key is None: self.document_key = hashlib.sha256(Path(self.pdf_path).read_bytes()).hexdigest()
+        hits, fps = {}, {}
+        for start, end, todo in groups:
+            for slot, key, name, pk in todo:
+                page_fps = self._reuse_fingerprints(pk, start, end)
+                if page_fps is None: continue
+                self.usage['reuse_eligible'] += 1
+                hit = self.page_index.lookup(self.document_key, pk, prompt_sha(self.prompts[pk]), self.dpi, page_fps)
+                PAGE_REUSE.inc(section=pk, result='hit' if hit is not None else 'miss')
+                if hit is None: fps[slot] = page_fps
+                else: hits[slot] = hit; self.usage['reused_tasks'] += 1
+        return hits, fps
+
+    async def _reused(self, key: str, res: Dict, on_result) -> List[Tuple[int, Dict]]:
+        if on_result is not None: await asyncio.to_thread(on_result, key, res)
+        return []
 
     def _map_note_to_prompt_key(self, page_num: int) -> Optional[str]:
         text=self.doc[page_num-1].get_text('text').lower()
@@ -80,28 +283,96 @@ class OrchestratorAgent:
         if any(k in text for k in ['kostnader','fastighetssköt','reparation','taxebundna kostnader','övriga externa kostnader','personalkostnader','räntekostnader']): return 'note_cost_breakdown'
         return None
 
-    async def run_workflow(self, section_map: Dict[str, Any]) -> Dict:
-        results={}; tasks=[]
-        async with aiohttp.ClientSession() as session:
-            for _, meta in section_map.items():
-                start,end,name=meta['start_page'],meta['end_page'],meta['canonical_name']
-                images=self._page_images_b64(start,end)
+    def _note_segments(self, start: int, end: int) -> List[Tuple[int, int, str]]:
+        pages = [(p, self._map_note_to_prompt_key(p), bool(NOTE_HEADING.search(self.doc[p-1].get_text('text')))) for p in range(start, end+1)]
+        return segment_note_pages(pages, ORCH_MAX_IMAGES_PER_REQUEST)
+
+    async def _run_task(self, session: aiohttp.ClientSession, slot: int, key: str, name: str, prompt_key: str, images: List[bytes], on_result) -> List[Tuple[int, Dict]]:
+        res = await self._dispatch(session, name, self.prompts[prompt_key], images, section=prompt_key)
+        if on_result is not None and not (isinstance(res, dict) and list(res) == ['error']):
+            await asyncio.to_thread(on_result, key, res)
+        return [(slot, res)]
+
+    async def _run_pack(self, session: aiohttp.ClientSession, items: List[Tuple[int, str, str, str]], images: List[bytes], on_result) -> List[Tuple[int, Dict]]:
+        """One request for several prompt keys over the same pages, split back per key.
+        If the reply doesn't carry every key as an object, the keys are re-sent one by one."""
+        keys = [pk for *_, pk in items]
+        res = await self._dispatch(session, 'pack_' + '+'.join(keys), pack_prompt(keys, self.prompts), images,
+                                   section=keys, max_tokens=max(2048, ORCH_PACK_COMPLETION_TOKENS * len(keys)))
+        if isinstance(res, dict) and all(isinstance(res.get(k), dict) for k in keys):
+            out = []
+            for slot, key, name, pk in items:
+                if on_result is not None: await asyncio.to_thread(on_result, key, res[pk])
+                out.append((slot, res[pk]))
+            return out
+        logger.warning(f"Packed request {'+'.join(keys)} did not return every key; retrying individually")
+        parts = await asyncio.gather(*(self._run_task(session, slot, key, name, pk, images, on_result) for slot, key, name, pk in items))
+        return [x for p in parts for x in p]
+
+    async def run_workflow(self, section_map: Dict[str, Any], on_result=None, cached: Optional[Dict[str, Dict]] = None) -> Dict:
+        """Extract every mapped section, merging each task's result as it completes (see ResultMerger).
+
+        self.merger.data holds the partial document while the workflow runs; failed tasks are listed
+        under 'errors' and field provenance is in self.merger.provenance_table().
+        With ORCH_PACK=1, prompt keys that share a page set are packed into one request (see plan_packs).
+        on_result(key, result) is called for each task that succeeded; tasks whose key is in cached
+        are not dispatched (nor their pages rendered) and reuse the cached result. Keys are
+        '<task index>:<task name>', stable for the same section map and prompts.
+        With the page index on, allowlisted tasks whose pages match another document's already
+        extracted pages take that result (counted in usage reused_tasks / reuse_eligible), and
+        successful ones are added to the index.
+        Requests go through self.session and self.limiter when the caller provided them.
+        Cancelling the workflow cancels every task still in flight before it returns."""
+        task_meta={}  # slot -> (task name, prompt key, first page, last page)
+        tasks=[]; groups=[]; cached=cached or {}; t0=time.perf_counter(); slots=[0]
+        merger=self.merger=ResultMerger(self.schemas)
+        async with (contextlib.nullcontext(self.session) if self.session is not None else aiohttp.ClientSession()) as session:
+            def add_group(items, start, end):
+                # items: [(task name, prompt key)] over pages start..end
+                todo=[]
+                for name,pk in items:
+                    slot=slots[0]; slots[0]+=1; key=f'{slot}:{name}'; task_meta[slot]=(name,pk,start,end)
+                    if key in cached: merger.add(slot,*task_meta[slot],cached[key]); continue
+                    todo.append((slot,key,name,pk))
+                if todo: groups.append((start,end,todo))
+            for _, sec in section_map.items():
+                start,end,name=sec['start_page'],sec['end_page'],sec['canonical_name']
                 if name=='management_report':
-                    for key in ['general_property','governance','maintenance']:
-                        if key in self.prompts: tasks.append(self._dispatch(session,f'extract_{key}',self.prompts[key],images))
+                    add_group([(f'extract_{key}',key) for key in ['general_property','governance','maintenance'] if key in self.prompts],start,end)
                 elif name in ['income_statement','balance_sheet']:
-                    if 'financial_statement' in self.prompts: tasks.append(self._dispatch(session,f'extract_{name}',self.prompts['financial_statement'],images))
+                    if 'financial_statement' in self.prompts: add_group([(f'extract_{name}','financial_statement')],start,end)
                 elif name=='multi_year_overview':
-                    if 'multi_year_overview' in self.prompts: tasks.append(self._dispatch(session,'extract_multi_year',self.prompts['multi_year_overview'],images))
+                    if 'multi_year_overview' in self.prompts: add_group([('extract_multi_year','multi_year_overview')],start,end)
                 elif name=='notes':
-                    for p in range(start,end+1):
-                        pk=self._map_note_to_prompt_key(p)
-                        if pk and pk in self.prompts:
-                            img=self._page_images_b64(p,p)
-                            tasks.append(self._dispatch(session,f'note_p{p}_{pk}',self.prompts[pk],img))
-            batches=await asyncio.gather(*tasks)
-            for b in batches: results=self._deep_merge(results,b)
-        self.doc.close(); return results
+                    # one multi-image request per run of pages belonging to the same note type
+                    for s,e,pk in self._note_segments(start,end):
+                        if pk in self.prompts:
+                            add_group([(f'note_p{s}_{pk}' if s==e else f'note_p{s}-{e}_{pk}',pk)],s,e)
+            hits,fps=await asyncio.to_thread(self._page_reuse,groups) if self.page_index is not None and groups else ({},{})
+            for start,end,todo in groups:
+                pending={}
+                for slot,key,name,pk in todo:
+                    if slot in hits: merger.add(slot,*task_meta[slot],hits[slot]); tasks.append(self._reused(key,hits[slot],on_result))
+                    else: pending.setdefault(pk,[]).append((slot,key,name,pk))
+                for pack in plan_packs([t[3] for t in todo if t[0] not in hits],self.prompts,end-start+1):
+                    its=[pending[pk].pop(0) for pk in pack]
+                    if len(its)==1: tasks.append(self._run_task(session,*its[0],self._page_images_b64(start,end),on_result))
+                    else: tasks.append(self._run_pack(session,its,self._page_images_b64(start,end),on_result))
+            running=[asyncio.ensure_future(t) for t in tasks]
+            try:
+                for fut in asyncio.as_completed(running):
+                    for slot,res in await fut:
+                        merger.add(slot,*task_meta[slot],res)
+                        if slot in fps and not (isinstance(res, dict) and list(res) == ['error']):
+                            name,pk,start,_=task_meta[slot]
+                            await asyncio.to_thread(self.page_index.add,self.document_key,pk,prompt_sha(self.prompts[pk]),self.dpi,start,fps[slot],res)
+            finally:
+                # Cancelled (e.g. the caller lost its job lease) or failed: stop the requests still in flight,
+                # so they neither hit the VLM nor report results through on_result
+                for t in running: t.cancel()
+                await asyncio.gather(*running, return_exceptions=True)
+        self.usage['wall_s'] += time.perf_counter() - t0
+        self._page_cache.clear(); self.doc.close(); return merger.result()
 
 if __name__=='__main__':
     import argparse, asyncio as _asyncio
@@ -1,14 +1,16 @@
 
 #!/usr/bin/env python3
-import os, json, logging, base64, re
-from typing import List, Dict, Any, Optional
-import fitz, requests
+import os, json, logging, re, asyncio, contextlib, time
+from typing import List, Dict, Any, Optional, Union
+import fitz, requests, aiohttp
+from tools.payload import encode_image, data_url, dumps as dump_payload, JSON_HEADERS
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('SectionizerAgent')
 
 QWEN_VL_API_URL = os.getenv('QWEN_VL_API_URL', 'http://127.0.0.1:5000/v1/chat/completions')
 SECTIONIZER_MODE = os.getenv('SECTIONIZER_MODE', 'heuristic').strip().lower()
+SECTIONIZER_DPI = 150
 
 def _sectionizer_system_prompt() -> str:
     return """
@@ -22,7 +24,15 @@ class SectionizerAgent:
     def __init__(self, pdf_path: str, mode: Optional[str] = None):
         self.pdf_path = pdf_path
         self.mode = (mode or SECTIONIZER_MODE).lower()
-        self.headers = {'Content-Type': 'application/json'}
+        self.headers = JSON_HEADERS
+        # LLM-mode request accounting, same counters as one OrchestratorAgent.usage['sections'] entry
+        self.usage: Dict[str, Any] = {'requests': 0, 'failed_requests': 0, 'image_bytes': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'request_s': 0.0}
+
+    def _account(self, t0: float, image: Union[bytes, str], body: Optional[Dict[str, Any]], ok: bool):
+        tokens = (body or {}).get('usage') or {}
+        self.usage['requests'] += 1; self.usage['image_bytes'] += len(image); self.usage['failed_requests'] += not ok
+        self.usage['prompt_tokens'] += tokens.get('prompt_tokens') or 0; self.usage['completion_tokens'] += tokens.get('completion_tokens') or 0
+        self.usage['request_s'] += time.perf_counter() - t0
 
     @staticmethod
     def _heuristic_classify_page_text(text: str, page_number: int) -> Dict[str, Any]:
@@ -59,43 +69,85 @@ class SectionizerAgent:
             return {'section_name':'auditors_report','page_number':page_number,'confidence':0.95}
         return {'section_name':'other','page_number':page_number,'confidence':0.5}
 
-    def _call_qwen_vl_api(self, page_image_base64: str, page_number: int) -> Dict[str, Any]:
+    @staticmethod
+    def _payload(page_image_base64: Union[bytes, str], page_number: int) -> Dict[str, Any]:
         model_name = os.getenv('QWEN_MODEL_TAG', 'qwen2.5vl:7b')
-        payload = {'model':model_name,'messages':[
+        return {'model':model_name,'messages':[
             {'role':'system','content':_sectionizer_system_prompt()},
             {'role':'user','content':[{'type':'text','text':f'Analyze page number {page_number}.'},
-                                      {'type':'image_url','image_url':{'url':f'data:image/jpeg;base64,{page_image_base64}'}}]}],
+                                      {'type':'image_url','image_url':{'url':data_url(page_image_base64)}}]}],
             'max_tokens':150,'temperature':0.0}
+
+    @staticmethod
+    def _parse_reply(content: str) -> Dict[str, Any]:
+        # Strip markdown code fences if present (handle text before fence)
+        if '```json' in content:
+            match = re.search(r'```(?:json)?\s*\n(.*?)\n```', content, re.DOTALL)
+            if match:
+                content = match.group(1).strip()
+        elif content.strip().startswith('```'):
+            lines = content.strip().split('\n')
+            if len(lines) >= 3 and lines[0].startswith('```') and lines[-1] == '```':
+                content = '\n'.join(lines[1:-1])
+        return json.loads(content.strip())
+
+    def _call_qwen_vl_api(self, page_image_base64: Union[bytes, str], page_number: int) -> Dict[str, Any]:
+        t0 = time.perf_counter(); body = None; ok = False
+        try:
+            r = requests.post(QWEN_VL_API_URL, headers=self.headers, data=dump_payload(self._payload(page_image_base64, page_number)), timeout=90)
+            r.raise_for_status(); body = r.json()
+            item = self._parse_reply(body['choices'][0]['message']['content']); ok = True
+            return item
+        except Exception as e:
+            logger.error(f'LLM classification failed on page {page_number}: {e}')
+            return {'section_name':'other','page_number':page_number,'confidence':0.0}
+        finally:
+            self._account(t0, page_image_base64, body, ok)
+
+    async def _call_qwen_vl_api_async(self, session: aiohttp.ClientSession, page_image_base64: Union[bytes, str], page_number: int,
+                                      limiter: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
+        """Non-blocking _call_qwen_vl_api on a caller-owned session, holding a limiter slot (if any) for the request."""
+        t0 = time.perf_counter(); body = None; ok = False
         try:
-            r = requests.post(QWEN_VL_API_URL, headers=self.headers, json=payload, timeout=90)
-            r.raise_for_status()
-            content = r.json()['choices'][0]['message']['content']
-            # Strip markdown code fences if present (handle text before fence)
-            if '```json' in content:
-                import re
-                match = re.search(r'```(?:json)?\s*\n(.*?)\n```', content, re.DOTALL)
-                if match:
-                    content = match.group(1).strip()
-            elif content.strip().startswith('```'):
-                lines = content.strip().split('\n')
-                if len(lines) >= 3 and lines[0].startswith('```') and lines[-1] == '```':
-                    content = '\n'.join(lines[1:-1])
-            return json.loads(content.strip())
+            async with limiter or contextlib.nullcontext():
+                async with session.post(QWEN_VL_API_URL, headers=self.headers, data=dump_payload(self._payload(page_image_base64, page_number)),
+                                        timeout=aiohttp.ClientTimeout(total=90)) as r:
+                    r.raise_for_status(); body = await r.json()
+            item = self._parse_reply(body['choices'][0]['message']['content']); ok = True
+            return item
         except Exception as e:
             logger.error(f'LLM classification failed on page {page_number}: {e}')
             return {'section_name':'other','page_number':page_number,'confidence':0.0}
+        finally:
+            self._account(t0, page_image_base64, body, ok)
 
     def analyze_document(self) -> Dict[str, Any]:
         doc = fitz.open(self.pdf_path); classifications=[]
         for i, page in enumerate(doc, start=1):
             if self.mode=='llm':
-                b64 = base64.b64encode(page.get_pixmap(dpi=150).tobytes('jpeg')).decode('utf-8')
+                b64 = encode_image(page.get_pixmap(dpi=SECTIONIZER_DPI).tobytes('jpeg'))
                 item = self._call_qwen_vl_api(b64, i)
             else:
                 item = self._heuristic_classify_page_text(page.get_text('text'), i)
             classifications.append(item)
         doc.close(); return self._aggregate_classifications(classifications)
 
+    def _render_pages(self) -> List[bytes]:
+        with fitz.open(self.pdf_path) as doc:
+            return [encode_image(page.get_pixmap(dpi=SECTIONIZER_DPI).tobytes('jpeg')) for page in doc]
+
+    async def analyze_document_async(self, session: Optional[aiohttp.ClientSession] = None,
+                                     limiter: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
+        """analyze_document without blocking the event loop: pages are rendered (or, in heuristic mode,
+        classified) in a worker thread and LLM calls run concurrently on session, bounded by limiter.
+        Pass the orchestrator's session/limiter so sectionizing and extraction of many documents share
+        one connection pool and one cap on in-flight requests."""
+        if self.mode!='llm': return await asyncio.to_thread(self.analyze_document)
+        pages = await asyncio.to_thread(self._render_pages)
+        async with (contextlib.nullcontext(session) if session is not None else aiohttp.ClientSession()) as s:
+            classifications = await asyncio.gather(*(self._call_qwen_vl_api_async(s, b64, i, limiter) for i, b64 in enumerate(pages, start=1)))
+        return self._aggregate_classifications(list(classifications))
+
     @staticmethod
     def _aggregate_classifications(classifications: List[Dict[str, Any]]) -> Dict[str, Any]:
         if not classifications: return {}
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Local stand-in for the VLM endpoints, for benchmarking without the H100.
+
+Serves OpenAI-compatible /v1/chat/completions and Ollama /api/generate. Responses are replayed
+from NDJSON recordings keyed by request hash; a miss is forwarded to --upstream (and recorded)
+when given, else answered with the JSON example embedded in the prompt (or {}). Latency is
+drawn from a configurable distribution and a fraction of requests can be failed on purpose.
+
+An optional block-level prefix cache mimics vLLM's automatic prefix caching: prefill time is
+charged only for the uncached part of the prompt, chat requests can stream (time to first token
+= prefill), and /metrics exposes vLLM-named prefix cache counters."""
+import os, sys, json, argparse, hashlib, random, asyncio, time
+from collections import Counter, OrderedDict
+from aiohttp import web, ClientSession, ClientTimeout
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from tools.json_scan import first_json
+from metrics import Registry
+
+def request_key(endpoint: str, body: dict) -> str:
+    """Stable hash of a request; the model tag and sampling knobs don't change the key."""
+    canon = {k: v for k, v in body.items() if k not in ('model', 'temperature', 'max_tokens', 'stream', 'stream_options', 'options')}
+    return hashlib.sha256(f'{endpoint}\n{json.dumps(canon, sort_keys=True, ensure_ascii=False)}'.encode('utf-8')).hexdigest()[:32]
+
+def parse_latency(spec: str):
+    """'const:S' | 'uniform:A,B' | 'normal:MEAN,SD' | 'lognormal:MU,SIGMA' (seconds) -> sampler."""
+    kind, _, args = spec.partition(':'); a = [float(x) for x in args.split(',') if x]
+    samplers = {'const': lambda: a[0], 'uniform': lambda: random.uniform(a[0], a[1]),
+                'normal': lambda: max(0.0, random.gauss(a[0], a[1])), 'lognormal': lambda: random.lognormvariate(a[0], a[1])}
+    if kind not in samplers: raise ValueError(f'unknown latency distribution: {spec}')
+    return samplers[kind]
+
+def _texts_and_images(endpoint: str, body: dict):
+    if endpoint == 'generate': return [body.get('prompt') or ''], len(body.get('images') or [])
+    texts = []; images = 0
+    for m in body.get('messages') or []:
+        c = m.get('content')
+        if isinstance(c, str): texts.append(c); continue
+        for part in c or []:
+            if part.get('type') == 'text': texts.append(part.get('text') or '')
+            elif part.get('type') == 'image_url': images += 1
+    return texts, images
+
+def _blocks(endpoint: str, body: dict, chars: int = 64):
+    """The prompt as chained (hash, tokens) blocks in order: ~16-token text blocks, one 256-token block per image."""
+    segs = []
+    if endpoint == 'generate':
+        segs = [('t', body.get('prompt') or '')] + [('i', img) for img in body.get('images') or []]
+    else:
+        for m in body.get('messages') or []:
+            segs.append(('t', f"<|{m.get('role')}|>")); c = m.get('content')
+            if isinstance(c, str): segs.append(('t', c)); continue
+            for part in c or []:
+                if part.get('type') == 'text': segs.append(('t', part.get('text') or ''))
+                elif part.get('type') == 'image_url': segs.append(('i', (part.get('image_url') or {}).get('url') or ''))
+    out = []; h = hashlib.sha256()
+    for kind, v in segs:
+        for piece in ([v[i:i + chars] for i in range(0, len(v), chars)] if kind == 't' else [v]):
+            h.update(kind.encode() + piece.encode('utf-8'))
+            out.append((h.hexdigest()[:16], max(1, len(piece) // 4) if kind == 't' else 256))
+    return out
+
+class PrefixCache:
+    """LRU of chained block hashes; a request hits on its longest cached leading run of blocks."""
+    def __init__(self, capacity: int):
+        self.capacity = capacity; self.blocks = OrderedDict()
+
+    def lookup(self, blocks) -> int:
+        """Cached tokens for this prompt; its blocks are inserted as a side effect."""
+        if not self.capacity: return 0
+        hit = 0; missed = False
+        for h, n in blocks:
+            if not missed and h in self.blocks: self.blocks.move_to_end(h); hit += n
+            else: missed = True; self.blocks[h] = None
+        while len(self.blocks) > self.capacity: self.blocks.popitem(last=False)
+        return hit
+
+    def reset(self): self.blocks.clear()
+
+def synthesize(endpoint: str, body: dict) -> str:
+    """Fallback answer: the JSON example from the prompt, so downstream merging sees realistic keys."""
+    texts, _ = _texts_and_images(endpoint, body)
+    for t in texts:
+        if 'section_name' in t and 'canonical' in t.lower():
+            return json.dumps({'section_name': 'other', 'page_number': 0, 'confidence': 0.0})
+        hit = first_json(t)
+        if hit: return json.dumps(hit[2], ensure_ascii=False)
+    return '{}'
+
+class MockVLM:
+    def __init__(self, recordings=None, record_to=None, upstream=None, latency='const:0', per_image=0.0,
+                 error_rate=0.0, error_status=500, seed=None, prefill_per_1k=0.0, cache_blocks=0):
+        self.replay = {}; self.record_to = record_to; self.upstream = upstream.rstrip('/') if upstream else None
+        self.latency = parse_latency(latency); self.per_image = per_image
+        self.error_rate = error_rate; self.error_status = error_status
+        self.stats = Counter(); self.in_flight = 0
+        self.prefill_per_1k = prefill_per_1k; self.cache = PrefixCache(cache_blocks)
+        self.metrics = Registry()
+        self.m_queries = self.metrics.counter('vllm:prefix_cache_queries_total', 'Prompt tokens looked up in the prefix cache')
+        self.m_hits = self.metrics.counter('vllm:prefix_cache_hits_total', 'Prompt tokens served from the prefix cache')
+        self.m_ttft = self.metrics.histogram('vllm:time_to_first_token_seconds', 'Time to first token',
+                                             buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+        if seed is not None: random.seed(seed)
+        for path in recordings or []:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        r = json.loads(line); self.replay[r['key']] = r['response']
+        self._session = None
+
+    async def _forward(self, endpoint, body):
+        path = '/v1/chat/completions' if endpoint == 'chat' else '/api/generate'
+        if self._session is None: self._session = ClientSession(timeout=ClientTimeout(total=300))
+        async with self._session.post(self.upstream + path, json=body) as r:
+            r.raise_for_status(); return await r.json()
+
+    def _wrap(self, endpoint, body, content, prompt_tokens):
+        completion_tokens = max(1, len(content) // 4)
+        if endpoint == 'generate':
+            return {'model': body.get('model'), 'response': content, 'done': True,
+                    'prompt_eval_count': prompt_tokens, 'eval_count': completion_tokens}
+        return {'id': 'mock', 'object': 'chat.completion', 'model': body.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens}}
+
+    async def _answer(self, endpoint, body, key, prompt_tokens):
+        if key in self.replay:
+            self.stats['replayed'] += 1; return self.replay[key]
+        if self.upstream:
+            resp = await self._forward(endpoint, {k: v for k, v in body.items() if k not in ('stream', 'stream_options')})
+            self.stats['forwarded'] += 1; self.replay[key] = resp
+            if self.record_to:
+                with open(self.record_to, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': key, 'endpoint': endpoint, 'recorded_at': time.time(), 'response': resp}, ensure_ascii=False) + '\n')
+            return resp
+        self.stats['synthesized'] += 1
+        return self._wrap(endpoint, body, synthesize(endpoint, body), prompt_tokens)
+
+    async def _stream(self, request, body, resp, decode_s):
+        """Send a chat completion as SSE chunks; the first chunk goes out at time to first token."""
+        content = resp['choices'][0]['message']['content']; pieces = [content[i:i + 32] for i in range(0, len(content), 32)] or ['']
+        out = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'}); await out.prepare(request)
+        def chunk(delta, finish=None, **extra):
+            return ('data: ' + json.dumps({'id': 'mock', 'object': 'chat.completion.chunk', 'model': resp.get('model'),
+                                           'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish}], **extra}, ensure_ascii=False) + '\n\n').encode('utf-8')
+        for i, piece in enumerate(pieces):
+            if i: await asyncio.sleep(decode_s / len(pieces))
+            await out.write(chunk({'role': 'assistant', 'content': piece} if i == 0 else {'content': piece}))
+        usage = {'usage': resp['usage']} if (body.get('stream_options') or {}).get('include_usage') and 'usage' in resp else {}
+        await out.write(chunk({}, 'stop', **usage)); await out.write(b'data: [DONE]\n\n'); await out.write_eof()
+        return out
+
+    async def handle(self, request, endpoint):
+        body = await request.json(); key = request_key(endpoint, body)
+        self.in_flight += 1; self.stats['requests'] += 1; t0 = time.perf_counter()
+        try:
+            _, images = _texts_and_images(endpoint, body)
+            blocks = _blocks(endpoint, body); prompt_tokens = sum(n for _, n in blocks); cached = self.cache.lookup(blocks)
+            self.m_queries.inc(prompt_tokens); self.m_hits.inc(cached)
+            # per-image cost is prefill work, so the cached share of the prompt skips it too
+            uncached = 1 - cached / prompt_tokens if prompt_tokens else 1
+            await asyncio.sleep(self.prefill_per_1k * (prompt_tokens - cached) / 1000 + self.per_image * images * uncached)
+            if self.error_rate and random.random() < self.error_rate:
+                self.stats['injected_errors'] += 1
+                return web.json_response({'error': 'injected failure'}, status=self.error_status)
+            resp = await self._answer(endpoint, body, key, prompt_tokens)
+            if endpoint == 'chat' and isinstance(resp.get('usage'), dict):
+                resp = {**resp, 'usage': {**resp['usage'], 'prompt_tokens_details': {'cached_tokens': cached}}}
+            decode_s = self.latency(); self.m_ttft.observe(time.perf_counter() - t0)
+            if endpoint == 'chat' and body.get('stream'): return await self._stream(request, body, resp, decode_s)
+            await asyncio.sleep(decode_s)
+            return web.json_response(resp)
+        finally:
+            self.in_flight -= 1
+
+    def app(self):
+        app = web.Application(client_max_size=256 * 1024 * 1024)
+        app.router.add_post('/v1/chat/completions', lambda r: self.handle(r, 'chat'))
+        app.router.add_post('/api/generate', lambda r: self.handle(r, 'generate'))
+        app.router.add_get('/stats', lambda r: web.json_response({**self.stats, 'in_flight': self.in_flight, 'recordings': len(self.replay),
+                                                                  'cached_blocks': len(self.cache.blocks)}))
+        app.router.add_get('/metrics', lambda r: web.Response(text=self.metrics.exposition(), content_type='text/plain'))
+        async def reset(_):
+            self.cache.reset(); return web.json_response({'ok': True})
+        app.router.add_post('/reset_prefix_cache', reset)
+        async def close(_):
+            if self._session is not None: await self._session.close()
+        app.on_cleanup.append(close)
+        return app
+
+def add_args(ap):
+    ap.add_argument('--recordings', nargs='*', default=[], help='NDJSON files of {"key","response"} to replay')
+    ap.add_argument('--record-to', help='append upstream responses for misses to this NDJSON file')
+    ap.add_argument('--upstream', help='real server base URL to forward misses to, e.g. http://h100:8000')
+    ap.add_argument('--latency', default='const:0', help="const:S | uniform:A,B | normal:MEAN,SD | lognormal:MU,SIGMA")
+    ap.add_argument('--per-image-latency', type=float, default=0.0, help='extra seconds per image in the request')
+    ap.add_argument('--error-rate', type=float, default=0.0); ap.add_argument('--error-status', type=int, default=500)
+    ap.add_argument('--seed', type=int)
+    ap.add_argument('--prefill-ms-per-1k', type=float, default=0.0, help='simulated prefill time (ms) per 1k uncached prompt tokens')
+    ap.add_argument('--prefix-cache-blocks', type=int, default=0, help='simulated prefix cache capacity in blocks (0 = off)')
+
+def from_args(a) -> MockVLM:
+    return MockVLM(a.recordings, a.record_to, a.upstream, a.latency, a.per_image_latency, a.error_rate, a.error_status, a.seed,
+                   a.prefill_ms_per_1k / 1000, a.prefix_cache_blocks)
+
+def main():
+    ap = argparse.ArgumentParser(description='Mock VLM server (OpenAI chat + Ollama generate) for offline benchmarks')
+    ap.add_argument('--host', default='127.0.0.1'); ap.add_argument('--port', type=int, default=5055)
+    add_args(ap); a = ap.parse_args()
+    print(f'🧪 Mock VLM on http://{a.host}:{a.port} (latency {a.latency}, error rate {a.error_rate})', flush=True)
+    web.run_app(from_args(a).app(), host=a.host, port=a.port, print=None, access_log=None)
+
+if __name__ == '__main__': main()
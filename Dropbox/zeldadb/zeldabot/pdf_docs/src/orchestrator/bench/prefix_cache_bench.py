@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Prefix-cache benchmark: the orchestrator's 'legacy' vs 'prefix' prompt layouts.
+
+For each page set, every prompt key is sent over the same page images (as the orchestrator does
+for management reports), streamed so time to first token can be measured. Hit rate comes from
+the server's /metrics (vLLM prefix cache counters) and from usage.prompt_tokens_details when
+the server reports it (vLLM --enable-prompt-tokens-details). Runs against the mock VLM server
+by default or a real vLLM with --api-url; the cache is reset between layouts where supported."""
+import os, sys, json, time, argparse, asyncio, statistics, urllib.request
+from collections import Counter
+import aiohttp
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(HERE, '..')))
+from bench import mock_vlm_server
+from bench.replay_bench import start_mock, _pdfs
+from agent_orchestrator import OrchestratorAgent, build_messages, get_registry
+from tools.payload import dumps as dump_payload, JSON_HEADERS
+
+# (hits, queries) counter pairs across vLLM versions; older releases only export a hit-rate gauge
+HIT_COUNTERS = [('vllm:prefix_cache_hits_total', 'vllm:prefix_cache_queries_total'),
+                ('vllm:gpu_prefix_cache_hits_total', 'vllm:gpu_prefix_cache_queries_total')]
+
+def scrape(base) -> Counter:
+    """Sum of every sample in /metrics by metric name (labels dropped)."""
+    try: text = urllib.request.urlopen(base + '/metrics', timeout=5).read().decode('utf-8')
+    except OSError: return Counter()
+    out = Counter()
+    for line in text.splitlines():
+        if not line or line.startswith('#'): continue
+        name, _, val = line.rpartition(' ')
+        try: out[name.split('{')[0]] += float(val)
+        except ValueError: pass
+    return out
+
+def hit_rate(before: Counter, after: Counter):
+    for hits, queries in HIT_COUNTERS:
+        q = after[queries] - before[queries]
+        if q: return round((after[hits] - before[hits]) / q, 4)
+    return round(after['vllm:gpu_prefix_cache_hit_rate'], 4) if 'vllm:gpu_prefix_cache_hit_rate' in after else None
+
+def reset_cache(base):
+    try: urllib.request.urlopen(urllib.request.Request(base + '/reset_prefix_cache', method='POST'), timeout=10); return True
+    except OSError: return False
+
+def page_sets(path, pages, per_doc):
+    """Evenly spaced runs of `pages` consecutive pages (1-based, inclusive)."""
+    orch = OrchestratorAgent(path, {}); n = len(orch.doc); last = max(1, n - pages + 1)
+    step = max(1, (last - 1) // max(1, per_doc - 1))
+    starts = sorted({min(last, 1 + i * step) for i in range(per_doc)})
+    return orch, [(s, min(n, s + pages - 1)) for s in starts]
+
+async def one_request(session, url, model, messages, max_tokens):
+    """Stream one completion -> (ttft_s, total_s, prompt_tokens, cached_tokens)."""
+    payload = {'model': model, 'messages': messages, 'max_tokens': max_tokens, 'temperature': 0.0,
+               'stream': True, 'stream_options': {'include_usage': True}}
+    t0 = time.perf_counter(); ttft = None; usage = {}
+    async with session.post(url, data=dump_payload(payload), headers=JSON_HEADERS, timeout=aiohttp.ClientTimeout(total=600)) as resp:
+        resp.raise_for_status()
+        async for raw in resp.content:
+            line = raw.decode('utf-8').strip()
+            if not line.startswith('data:') or line == 'data: [DONE]': continue
+            chunk = json.loads(line[5:])
+            if ttft is None and any((c.get('delta') or {}).get('content') for c in chunk.get('choices') or []): ttft = time.perf_counter() - t0
+            usage = chunk.get('usage') or usage
+    total = time.perf_counter() - t0
+    return ttft if ttft is not None else total, total, usage.get('prompt_tokens'), (usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+
+async def run_layout(a, layout, sets, prompts, url, model):
+    samples = []
+    async with aiohttp.ClientSession() as session:
+        for images in sets:
+            reqs = [build_messages(prompts[k], images, layout) for k in a.keys]
+            if a.warm_first:
+                samples.append(await one_request(session, url, model, reqs[0], a.max_tokens)); reqs = reqs[1:]
+            samples += await asyncio.gather(*(one_request(session, url, model, m, a.max_tokens) for m in reqs))
+    return samples
+
+def summarize(samples, hr):
+    ttft = [s[0] for s in samples]; total = [s[1] for s in samples]
+    prompt = sum(s[2] or 0 for s in samples); cached = [s[3] for s in samples if s[3] is not None]
+    pct = lambda v, q: round(sorted(v)[int(q * (len(v) - 1))], 4)
+    return {'requests': len(samples), 'ttft_s': {'mean': round(statistics.mean(ttft), 4), 'p50': pct(ttft, 0.5), 'p95': pct(ttft, 0.95)},
+            'latency_s': {'mean': round(statistics.mean(total), 4), 'p50': pct(total, 0.5), 'p95': pct(total, 0.95)},
+            'prefix_cache_hit_rate': hr, 'cached_token_share': round(sum(cached) / prompt, 4) if cached and prompt else None}
+
+def main():
+    ap = argparse.ArgumentParser(description='Measure prefix-cache hit rate and TTFT for the orchestrator prompt layouts')
+    ap.add_argument('--pdfs', required=True, help='directory (searched recursively) or glob of PDFs')
+    ap.add_argument('--prompts', required=True); ap.add_argument('--limit', type=int, default=5)
+    ap.add_argument('--keys', nargs='+', default=['general_property', 'governance', 'maintenance'], help='prompt keys sent per page set')
+    ap.add_argument('--pages', type=int, default=2, help='pages per page set'); ap.add_argument('--sets-per-doc', type=int, default=2)
+    ap.add_argument('--layouts', nargs='+', default=['legacy', 'prefix'], choices=['legacy', 'prefix'])
+    ap.add_argument('--warm-first', action='store_true', help='send the first key alone before the rest of the page set (else all at once, like the orchestrator)')
+    ap.add_argument('--max-tokens', type=int, default=512)
+    ap.add_argument('--model', default=os.getenv('QWEN_MODEL_TAG', 'qwen2.5vl:7b'))
+    ap.add_argument('--api-url', help='real server base URL (e.g. http://h100:8000) instead of starting the mock')
+    ap.add_argument('--mock-port', type=int, default=0); ap.add_argument('--out', help='write the JSON report here')
+    mock_vlm_server.add_args(ap)
+    ap.set_defaults(prefill_ms_per_1k=50.0, prefix_cache_blocks=20000)
+    a = ap.parse_args()
+
+    prompts = get_registry(a.prompts).prompts
+    missing = [k for k in a.keys if k not in prompts]
+    if missing: print(f"❌ Unknown prompt keys: {', '.join(missing)}"); sys.exit(1)
+    pdfs = _pdfs(a.pdfs, a.limit)
+    if not pdfs: print(f'❌ No PDFs under {a.pdfs}'); sys.exit(1)
+    sets = []
+    for path in pdfs:
+        orch, ranges = page_sets(path, a.pages, a.sets_per_doc)
+        sets += [orch._page_images_b64(s, e) for s, e in ranges]; orch.doc.close()
+
+    proc = None
+    if a.api_url: base = a.api_url.split('/v1/')[0].rstrip('/')
+    else: proc, base = start_mock(a)
+    url = base + '/v1/chat/completions'; report = {}
+    try:
+        for layout in a.layouts:
+            was_reset = reset_cache(base); before = scrape(base)
+            samples = asyncio.run(run_layout(a, layout, sets, prompts, url, a.model))
+            report[layout] = {**summarize(samples, hit_rate(before, scrape(base))), 'cache_reset': was_reset}
+            r = report[layout]
+            print(f"{layout:<7} ttft p50 {r['ttft_s']['p50']*1000:>8.1f} ms  p95 {r['ttft_s']['p95']*1000:>8.1f} ms  "
+                  f"hit rate {r['prefix_cache_hit_rate'] if r['prefix_cache_hit_rate'] is not None else 'n/a'}  ({r['requests']} requests)")
+    finally:
+        if proc: proc.terminate(); proc.wait(5)
+    report['config'] = {k: v for k, v in vars(a).items() if k != 'pdfs'}
+    report['page_sets'] = len(sets)
+    if a.out:
+        with open(a.out, 'w', encoding='utf-8') as f: json.dump(report, f, indent=2)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Benchmark PDF page rendering and encoding choices used across the codebase.
+
+Each variant splits per-page time into rasterize / encode / base64 and records output size and
+the Python heap high-water mark (tracemalloc; MuPDF's own C allocations are not traced, so RSS
+growth is reported too). Variants mirror the call sites: orchestrator (dpi jpeg), sectionizer
+(150 dpi jpeg), h100_direct_twin (Matrix(2,2) png), GeminiAgent (BytesIO copy) and pdf2image."""
+import os, sys, io, json, csv, glob, time, base64, binascii, random, argparse, statistics, tracemalloc, resource
+import fitz
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# name -> render config: dpi or zoom, fmt, optional quality / gray / alpha / bytesio copy / base64 impl / engine
+VARIANTS = {
+    'orchestrator_jpeg_200':   {'dpi': 200, 'fmt': 'jpeg'},
+    'sectionizer_jpeg_150':    {'dpi': 150, 'fmt': 'jpeg'},
+    'h100_twin_png_zoom2':     {'zoom': 2.0, 'fmt': 'png'},
+    'gemini_jpeg_150_bytesio': {'dpi': 150, 'fmt': 'jpeg', 'bytesio': True},
+    'jpeg_200_noalpha':        {'dpi': 200, 'fmt': 'jpeg', 'alpha': False},
+    'jpeg_200_gray':           {'dpi': 200, 'fmt': 'jpeg', 'gray': True},
+    'jpeg_200_q75':            {'dpi': 200, 'fmt': 'jpeg', 'quality': 75},
+    'jpeg_200_q60':            {'dpi': 200, 'fmt': 'jpeg', 'quality': 60},
+    'jpeg_150_q85':            {'dpi': 150, 'fmt': 'jpeg', 'quality': 85},
+    'png_200':                 {'dpi': 200, 'fmt': 'png'},
+    'jpeg_200_b2a':            {'dpi': 200, 'fmt': 'jpeg', 'b64': 'binascii'},
+    'pdf2image_jpeg_200':      {'dpi': 200, 'fmt': 'jpeg', 'engine': 'pdf2image'},
+}
+
+def _pixmap(page, cfg):
+    kw = {'alpha': cfg.get('alpha', False)} if 'alpha' in cfg else {}
+    if cfg.get('gray'): kw['colorspace'] = fitz.csGRAY
+    if 'zoom' in cfg: return page.get_pixmap(matrix=fitz.Matrix(cfg['zoom'], cfg['zoom']), **kw)
+    return page.get_pixmap(dpi=cfg['dpi'], **kw)
+
+def _encode(pix, cfg):
+    if cfg['fmt'] == 'jpeg' and 'quality' in cfg: return pix.tobytes('jpeg', jpg_quality=cfg['quality'])
+    return pix.tobytes(cfg['fmt'])
+
+def _b64(data, cfg):
+    if cfg.get('b64') == 'binascii': return binascii.b2a_base64(data, newline=False).decode('ascii')
+    return base64.b64encode(data).decode('utf-8')
+
+def render_page_fitz(page, cfg):
+    t0 = time.perf_counter(); pix = _pixmap(page, cfg)
+    t1 = time.perf_counter(); data = _encode(pix, cfg)
+    if cfg.get('bytesio'): data = io.BytesIO(data).getvalue()  # GeminiAgent's extra copy
+    t2 = time.perf_counter(); b64 = _b64(data, cfg); t3 = time.perf_counter()
+    return t1 - t0, t2 - t1, t3 - t2, len(data), len(b64), pix.width * pix.height
+
+def run_pdf2image(pdf_bytes, pages, cfg):
+    from pdf2image import convert_from_bytes
+    out = []
+    for p in pages:
+        t0 = time.perf_counter(); img = convert_from_bytes(pdf_bytes, dpi=cfg['dpi'], first_page=p + 1, last_page=p + 1)[0]
+        t1 = time.perf_counter(); buf = io.BytesIO(); img.save(buf, format='JPEG', quality=cfg.get('quality', 95)); data = buf.getvalue()
+        t2 = time.perf_counter(); b64 = _b64(data, cfg); t3 = time.perf_counter()
+        out.append((t1 - t0, t2 - t1, t3 - t2, len(data), len(b64), img.width * img.height))
+    return out
+
+def bench_variant(name, cfg, docs, repeat):
+    """docs: [(label, pdf_bytes, page indexes)] -> summary row for one variant."""
+    samples = []; rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    for _ in range(repeat):
+        for _, pdf_bytes, pages in docs:
+            if cfg.get('engine') == 'pdf2image':
+                samples += run_pdf2image(pdf_bytes, pages, cfg); continue
+            doc = fitz.open(stream=pdf_bytes, filetype='pdf')
+            samples += [render_page_fitz(doc[p], cfg) for p in pages]
+            doc.close()
+    peak = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+    col = lambda i: [s[i] for s in samples]
+    ms = lambda v: round(statistics.mean(v) * 1000, 2)
+    total = [a + b + c for a, b, c, *_ in samples]
+    return {'variant': name, 'pages': len(samples),
+            'raster_ms': ms(col(0)), 'encode_ms': ms(col(1)), 'base64_ms': ms(col(2)),
+            'total_ms_mean': ms(total), 'total_ms_p50': round(statistics.median(total) * 1000, 2),
+            'total_ms_p95': round(sorted(total)[int(0.95 * (len(total) - 1))] * 1000, 2),
+            'bytes_mean': int(statistics.mean(col(3))), 'b64_bytes_mean': int(statistics.mean(col(4))),
+            'megapixels_mean': round(statistics.mean(col(5)) / 1e6, 2),
+            'py_heap_peak_kb': peak // 1024, 'rss_growth_kb': max(0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0),
+            'config': cfg}
+
+def load_docs(a):
+    """Sample PDFs (from --pdfs or the documents table) and pages per PDF, reproducibly."""
+    rng = random.Random(a.seed); blobs = []
+    if a.from_db:
+        from db.db import fetch_docs
+        blobs = [(str(r['stem'] or r['id']), bytes(r['pdf_bytes'])) for r in fetch_docs(filter_sql=a.filter, limit=a.docs)]
+    else:
+        paths = sorted(glob.glob(os.path.join(a.pdfs, '**', '*.pdf'), recursive=True)) if os.path.isdir(a.pdfs) else sorted(glob.glob(a.pdfs))
+        blobs = [(os.path.basename(p), open(p, 'rb').read()) for p in rng.sample(paths, min(a.docs, len(paths)))]
+    docs = []
+    for label, data in blobs:
+        n = fitz.open(stream=data, filetype='pdf').page_count
+        docs.append((label, data, sorted(rng.sample(range(n), min(a.pages_per_doc, n)))))
+    return docs
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmark rasterization / encoding / base64 choices over sample BRF PDFs')
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument('--pdfs', help='directory (recursive) or glob'); src.add_argument('--from-db', action='store_true')
+    ap.add_argument('--filter', default='training_set = true'); ap.add_argument('--docs', type=int, default=10)
+    ap.add_argument('--pages-per-doc', type=int, default=4); ap.add_argument('--repeat', type=int, default=1)
+    ap.add_argument('--variants', nargs='*', default=None, help=f'subset of: {", ".join(VARIANTS)}')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--out-json'); ap.add_argument('--out-csv')
+    a = ap.parse_args()
+
+    docs = load_docs(a)
+    if not docs: print('❌ No PDFs to benchmark'); sys.exit(1)
+    rows = []
+    for name in a.variants or VARIANTS:
+        cfg = VARIANTS[name]
+        if cfg.get('engine') == 'pdf2image':
+            try: import pdf2image  # noqa: F401
+            except ImportError: print(f'⏭️  {name}: pdf2image not installed'); continue
+        # warm-up pass so font/cache loading isn't billed to the first variant
+        bench_variant(name, cfg, docs[:1], 1)
+        rows.append(bench_variant(name, cfg, docs, a.repeat))
+        r = rows[-1]
+        print(f"{name:<26} {r['total_ms_mean']:>8.1f} ms/page (raster {r['raster_ms']:.1f}, encode {r['encode_ms']:.1f}, b64 {r['base64_ms']:.1f})"
+              f"  {r['bytes_mean']/1024:>7.0f} KiB  heap peak {r['py_heap_peak_kb']} KiB")
+    rows.sort(key=lambda r: r['total_ms_mean'])
+    meta = {'docs': [(l, p) for l, _, p in docs], 'repeat': a.repeat, 'pymupdf': fitz.VersionBind}
+    if a.out_json:
+        with open(a.out_json, 'w', encoding='utf-8') as f: json.dump({'meta': meta, 'results': rows}, f, indent=2)
+    if a.out_csv:
+        cols = [k for k in rows[0] if k != 'config']
+        with open(a.out_csv, 'w', newline='', encoding='utf-8') as f:
+            w = csv.writer(f); w.writerow(cols); [w.writerow([r[c] for c in cols]) for r in rows]
+    print(f"🏁 Fastest: {rows[0]['variant']} ({rows[0]['total_ms_mean']} ms/page over {rows[0]['pages']} pages)")
+
+if __name__ == '__main__': main()
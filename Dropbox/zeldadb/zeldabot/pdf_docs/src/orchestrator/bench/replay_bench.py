@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Throughput benchmark: Sectionizer + Orchestrator (or db_runner.process_doc) over local PDFs
+against the mock VLM server, reporting docs/s, CPU per stage and memory.
+
+The mock runs in a subprocess so its CPU is not charged to the pipeline. The agents read
+QWEN_VL_API_URL at import time, so it is set before they are imported."""
+import os, sys, json, glob, argparse, asyncio, time, subprocess, socket, resource, tracemalloc, tempfile, statistics
+import urllib.request
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(HERE, '..')))
+from bench import mock_vlm_server
+
+def _free_port():
+    with socket.socket() as s: s.bind(('127.0.0.1', 0)); return s.getsockname()[1]
+
+def start_mock(a):
+    port = a.mock_port or _free_port()
+    cmd = [sys.executable, os.path.join(HERE, 'mock_vlm_server.py'), '--port', str(port), '--latency', a.latency,
+           '--per-image-latency', str(a.per_image_latency), '--error-rate', str(a.error_rate), '--error-status', str(a.error_status)]
+    if a.recordings: cmd += ['--recordings', *a.recordings]
+    if a.upstream: cmd += ['--upstream', a.upstream]
+    if a.record_to: cmd += ['--record-to', a.record_to]
+    if a.seed is not None: cmd += ['--seed', str(a.seed)]
+    cmd += ['--prefill-ms-per-1k', str(a.prefill_ms_per_1k), '--prefix-cache-blocks', str(a.prefix_cache_blocks)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try: urllib.request.urlopen(base + '/stats', timeout=0.5); return proc, base
+        except OSError: time.sleep(0.1)
+    proc.kill(); raise RuntimeError('mock VLM server did not start')
+
+def _pdfs(spec, limit):
+    paths = sorted(glob.glob(os.path.join(spec, '**', '*.pdf'), recursive=True)) if os.path.isdir(spec) else sorted(glob.glob(spec))
+    return paths[:limit] if limit else paths
+
+async def bench(a, pdfs):
+    # Imported here: both agent modules bind QWEN_VL_API_URL at import
+    from agent_sectionizer import SectionizerAgent
+    from agent_orchestrator import OrchestratorAgent, get_registry
+    prompts = get_registry(a.prompts).prompts
+    if a.via_db_runner:
+        from runners.db_runner import process_doc, CompiledLearnings
+        learnings = CompiledLearnings(); tmpdir = tempfile.mkdtemp(prefix='replay_bench_')
+    sem = asyncio.Semaphore(a.concurrency); per_doc = []
+
+    async def one(path):
+        async with sem:
+            rec = {'pdf': os.path.basename(path)}; t0 = time.perf_counter()
+            if a.via_db_runner:
+                row = {'id': rec['pdf'], 'stem': os.path.splitext(rec['pdf'])[0], 'pdf_bytes': open(path, 'rb').read()}
+                usage = {}
+                sm, _ = await process_doc(row, tmpdir, prompts, a.sectionizer_mode, a.dpi, learnings, None, usage)
+                rec.update(sections=len(sm), requests=usage.get('requests'), render_s=usage.get('render_s'))
+            else:
+                def sectionize():
+                    c0 = time.thread_time(); sm = SectionizerAgent(path, mode=a.sectionizer_mode).analyze_document()
+                    return sm, time.thread_time() - c0
+                sm, rec['sectionize_cpu_s'] = await asyncio.to_thread(sectionize)
+                rec['sectionize_s'] = time.perf_counter() - t0; t1 = time.perf_counter()
+                orch = OrchestratorAgent(path, prompts, dpi=a.dpi)
+                await orch.run_workflow(sm)
+                rec.update(orchestrate_s=time.perf_counter() - t1, sections=len(sm), requests=orch.usage['requests'],
+                           failed_requests=orch.usage['failed_requests'], render_s=orch.usage['render_s'], pixels=orch.usage['pixels'])
+            rec['wall_s'] = time.perf_counter() - t0; per_doc.append(rec)
+
+    await asyncio.gather(*(one(p) for p in pdfs))
+    return per_doc
+
+def summarize(per_doc, wall, cpu, stats):
+    def s(key):
+        v = [d[key] for d in per_doc if d.get(key) is not None]
+        return {'sum': round(sum(v), 3), 'p50': round(statistics.median(v), 3), 'max': round(max(v), 3)} if v else None
+    sect_cpu = sum(d.get('sectionize_cpu_s') or 0 for d in per_doc)
+    return {'docs': len(per_doc), 'wall_s': round(wall, 3), 'docs_per_s': round(len(per_doc) / wall, 3) if wall else None,
+            # render is timed as wall clock; rasterizing is CPU-bound so it stands in for render CPU
+            'cpu_s': {'total': round(cpu, 3), 'sectionize': round(sect_cpu, 3), 'render': (s('render_s') or {}).get('sum'),
+                      'orchestrate_other': round(cpu - sect_cpu - ((s('render_s') or {}).get('sum') or 0), 3)},
+            'stage_wall_s': {k: s(k) for k in ('sectionize_s', 'orchestrate_s', 'render_s', 'wall_s')},
+            'requests': sum(d.get('requests') or 0 for d in per_doc), 'failed_requests': sum(d.get('failed_requests') or 0 for d in per_doc),
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'python_heap_peak_mb': round(tracemalloc.get_traced_memory()[1] / 1e6, 1) if tracemalloc.is_tracing() else None,
+            'server': stats}
+
+def main():
+    ap = argparse.ArgumentParser(description='Replay benchmark of the extraction pipeline against a mock VLM')
+    ap.add_argument('--pdfs', required=True, help='directory (searched recursively) or glob of PDFs')
+    ap.add_argument('--prompts', required=True); ap.add_argument('--limit', type=int, default=0)
+    ap.add_argument('--concurrency', type=int, default=1, help='documents in flight')
+    ap.add_argument('--sectionizer-mode', default='heuristic', choices=['heuristic', 'llm'])
+    ap.add_argument('--dpi', type=int, default=int(os.getenv('ORCH_DPI', '200')))
+    ap.add_argument('--via-db-runner', action='store_true', help='drive runners.db_runner.process_doc end to end (no per-stage split)')
+    ap.add_argument('--api-url', help='use an already running server instead of starting the mock')
+    ap.add_argument('--mock-port', type=int, default=0)
+    ap.add_argument('--tracemalloc', action='store_true', help='track Python heap peak (slows the run)')
+    ap.add_argument('--out', help='write the JSON report here')
+    mock_vlm_server.add_args(ap)
+    a = ap.parse_args()
+
+    pdfs = _pdfs(a.pdfs, a.limit)
+    if not pdfs: print(f'❌ No PDFs under {a.pdfs}'); sys.exit(1)
+    proc = None
+    if a.api_url: base = a.api_url.split('/v1/')[0]
+    else: proc, base = start_mock(a)
+    os.environ['QWEN_VL_API_URL'] = base + '/v1/chat/completions'
+    try:
+        if a.tracemalloc: tracemalloc.start()
+        c0 = time.process_time(); t0 = time.perf_counter()
+        per_doc = asyncio.run(bench(a, pdfs))
+        wall = time.perf_counter() - t0; cpu = time.process_time() - c0
+        try: stats = json.loads(urllib.request.urlopen(base + '/stats', timeout=2).read())
+        except OSError: stats = None
+        report = {**summarize(per_doc, wall, cpu, stats), 'config': {k: v for k, v in vars(a).items() if k not in ('pdfs',)}, 'per_doc': per_doc}
+    finally:
+        if proc: proc.terminate(); proc.wait(5)
+    if a.out:
+        with open(a.out, 'w', encoding='utf-8') as f: json.dump(report, f, indent=2)
+    print(json.dumps({k: v for k, v in report.items() if k not in ('per_doc', 'config')}, indent=2))
+
+if __name__ == '__main__': main()
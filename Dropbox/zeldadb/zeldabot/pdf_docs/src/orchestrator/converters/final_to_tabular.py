@@ -1,35 +1,144 @@
 
 #!/usr/bin/env python3
-import os, json, argparse, csv, pathlib
+import os, json, argparse, csv, pathlib, re, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+def _list(v): return v if isinstance(v, list) else []
+def _dict(v): return v if isinstance(v, dict) else {}
+# unit suffix -> scale; percentages keep the number as written ('3,5 %' -> 3.5)
+_UNITS = {'': 1, '%': 1, 'kr': 1, 'sek': 1, 'tkr': 1e3, 'ksek': 1e3, 'mkr': 1e6, 'msek': 1e6}
+_AMOUNT = re.compile(r'^([-+]?)(\d[\d.,]*)(%|[a-z]*)\.?$')
+def _num(x):
+    """Coerce extracted amounts ('1 234 567', '3,79', '3,5 %', '1 234 tkr', '−12', '(450)', 12) to float; None if not numeric."""
+    if x is None or isinstance(x, bool): return None
+    if isinstance(x, (int, float)): return float(x)
+    t = re.sub(r'\s', '', str(x)).lower().replace('\u2212', '-').replace('\u2013', '-')  # \s covers nbsp/thin spaces
+    neg = t.startswith('(') and t.endswith(')')
+    m = _AMOUNT.match(t[1:-1] if neg else t)
+    if not m or m.group(3) not in _UNITS: return None
+    digits = m.group(2)
+    if ',' in digits: digits = digits.replace('.', '').replace(',', '.') if digits.count(',') == 1 else digits.replace(',', '')
+    elif digits.count('.') > 1: digits = digits.replace('.', '')
+    try: v = float(digits) * _UNITS[m.group(3)]
+    except ValueError: return None
+    return -v if neg or m.group(1) == '-' else v
+def _str(x): return None if x is None else str(x)
+
+# table -> (csv columns, row extractor). Extractors return tuples in column order; shared by CSV and columnar output.
+TABLES = {
+    'financial_statement': (['item','note','current_year','previous_year'],
+        lambda d: [(i.get('item'),i.get('note'),i.get('current_year'),i.get('previous_year')) for i in _list(_dict(d.get('financial_statement')).get('items')) if isinstance(i,dict)]),
+    'revenue_breakdown': (['item','current_year','previous_year'],
+        lambda d: [(i.get('item'),i.get('current_year'),i.get('previous_year')) for i in _list(_dict(d.get('revenue_breakdown')).get('items')) if isinstance(i,dict)]),
+    'cost_breakdown': (['note_title','item','current_year','previous_year'],
+        lambda d: [(_dict(d.get('cost_breakdown')).get('note_title'),i.get('item'),i.get('current_year'),i.get('previous_year')) for i in _list(_dict(d.get('cost_breakdown')).get('items')) if isinstance(i,dict)]),
+    'asset_depreciation': (['asset_type','group','item','value'],
+        lambda d: [(_dict(d.get('asset_depreciation')).get('asset_type'),i.get('group'),i.get('item'),i.get('value')) for i in _list(_dict(d.get('asset_depreciation')).get('items')) if isinstance(i,dict)]),
+    'financial_loans': (['lender','amount','interest_rate','maturity_date'],
+        lambda d: [(i.get('lender'),i.get('amount'),i.get('interest_rate'),i.get('maturity_date')) for i in _list(d.get('financial_loans')) if isinstance(i,dict)]),
+    'pledged_assets': (['item','amount_current_year','amount_previous_year'],
+        lambda d: [(i.get('item'),i.get('amount_current_year'),i.get('amount_previous_year')) for i in _list(d.get('pledged_assets')) if isinstance(i,dict)]),
+}
+# multi_year_overview has per-document headers, so the columnar form is long: one row per (row, header) cell
+def multi_year_cells(d):
+    m=_dict(d.get('multi_year_overview')); headers=_list(m.get('headers'))
+    return [(ri, h, v) for ri, r in enumerate(_list(m.get('rows'))) if isinstance(r, dict) for h, v in ((h, r.get(h)) for h in headers)]
+
 def write_csv(path, header, rows):
     pathlib.Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
     with open(path,'w',newline='',encoding='utf-8') as f:
         w=csv.writer(f); w.writerow(header); [w.writerow(r) for r in rows]
-def main():
-    ap=argparse.ArgumentParser(description='Convert final_extraction.json to CSV tables')
-    ap.add_argument('--final',required=True); ap.add_argument('--out',required=True); a=ap.parse_args()
-    d=json.load(open(a.final,'r',encoding='utf-8')); os.makedirs(a.out, exist_ok=True)
-    if 'financial_statement' in d:
-        items=d['financial_statement'].get('items',[]); rows=[(i.get('item'),i.get('note'),i.get('current_year'),i.get('previous_year')) for i in items]
-        write_csv(os.path.join(a.out,'financial_statement.csv'), ['item','note','current_year','previous_year'], rows)
+
+def to_csv(d, out):
+    os.makedirs(out, exist_ok=True)
+    for name, (cols, rows) in TABLES.items():
+        if name in d: write_csv(os.path.join(out, f'{name}.csv'), cols, rows(d))
     if 'multi_year_overview' in d:
-        headers=d['multi_year_overview'].get('headers',[]); rows=d['multi_year_overview'].get('rows',[])
-        out_rows=[[r.get(h) if isinstance(r,dict) else '' for h in headers] for r in rows]
-        write_csv(os.path.join(a.out,'multi_year_overview.csv'), headers, out_rows)
-    if 'revenue_breakdown' in d:
-        rows=[(i.get('item'),i.get('current_year'),i.get('previous_year')) for i in d['revenue_breakdown'].get('items',[])]
-        write_csv(os.path.join(a.out,'revenue_breakdown.csv'), ['item','current_year','previous_year'], rows)
-    if 'cost_breakdown' in d:
-        title=d['cost_breakdown'].get('note_title'); rows=[(title,i.get('item'),i.get('current_year'),i.get('previous_year')) for i in d['cost_breakdown'].get('items',[])]
-        write_csv(os.path.join(a.out,'cost_breakdown.csv'), ['note_title','item','current_year','previous_year'], rows)
-    if 'asset_depreciation' in d:
-        rows=[(d['asset_depreciation'].get('asset_type'),i.get('group'),i.get('item'),i.get('value')) for i in d['asset_depreciation'].get('items',[])]
-        write_csv(os.path.join(a.out,'asset_depreciation.csv'), ['asset_type','group','item','value'], rows)
-    if 'financial_loans' in d:
-        rows=[(i.get('lender'),i.get('amount'),i.get('interest_rate'),i.get('maturity_date')) for i in d.get('financial_loans',[])]
-        write_csv(os.path.join(a.out,'financial_loans.csv'), ['lender','amount','interest_rate','maturity_date'], rows)
-    if 'pledged_assets' in d:
-        rows=[(i.get('item'),i.get('amount_current_year'),i.get('amount_previous_year')) for i in d.get('pledged_assets',[])]
-        write_csv(os.path.join(a.out,'pledged_assets.csv'), ['item','amount_current_year','amount_previous_year'], rows)
+        headers=_list(d['multi_year_overview'].get('headers')); rows=_list(d['multi_year_overview'].get('rows'))
+        write_csv(os.path.join(out,'multi_year_overview.csv'), headers, [[r.get(h) if isinstance(r,dict) else '' for h in headers] for r in rows])
+
+# ---- columnar (Parquet/Arrow) batch export over the extractions table ----
+KEY_COLS = [('document_id','string'), ('extraction_id','string')]
+NUMERIC = {'current_year','previous_year','value','amount','interest_rate','amount_current_year','amount_previous_year'}
+# each numeric column is followed by <col>_raw: the extracted text when it could not be parsed, else null
+
+def _columns(name):
+    return [x for c in TABLES[name][0] for x in ([(c, 'float64'), (c + '_raw', 'string')] if c in NUMERIC else [(c, 'string')])]
+
+def _raw(v):
+    return None if v is None or v == '' or _num(v) is not None else str(v)
+
+def arrow_schema(name):
+    import pyarrow as pa
+    cols = KEY_COLS + ([('row', 'int32'), ('header', 'string'), ('value', 'float64'), ('value_text', 'string')] if name == 'multi_year_overview'
+                       else _columns(name))
+    return pa.schema([(c, getattr(pa, t)()) for c, t in cols])
+
+def typed_rows(name, d):
+    """Normalized rows for one document: numeric columns as float (plus <col>_raw text when unparseable), everything else as text."""
+    if name == 'multi_year_overview':
+        return [(ri, _str(h), _num(v), _str(v)) for ri, h, v in multi_year_cells(d)]
+    cols = TABLES[name][0]
+    return [tuple(x for c, v in zip(cols, r) for x in ((_num(v), _raw(v)) if c in NUMERIC else (_str(v),))) for r in TABLES[name][1](d)]
+
+class ColumnarWriter:
+    """Buffers normalized rows per table and flushes them as numbered part files (<out>/<table>/part-NNNNN.parquet|.arrow).
+
+    Memory is bounded by rows_per_part per table; each flush writes one self-contained part."""
+    def __init__(self, out, fmt='parquet', rows_per_part=250_000):
+        import pyarrow as pa
+        self.pa = pa; self.out = out; self.fmt = fmt; self.rows_per_part = rows_per_part
+        self.buffers = {n: [] for n in list(TABLES) + ['multi_year_overview']}; self.parts = {n: 0 for n in self.buffers}; self.rows = {n: 0 for n in self.buffers}
+
+    def add(self, document_id, extraction_id, d):
+        for name, buf in self.buffers.items():
+            key = (_str(document_id), _str(extraction_id))
+            buf.extend(key + r for r in typed_rows(name, d))
+            if len(buf) >= self.rows_per_part: self.flush(name)
+
+    def flush(self, name):
+        buf = self.buffers[name]
+        if not buf: return
+        schema = arrow_schema(name); cols = list(zip(*buf))
+        table = self.pa.Table.from_arrays([self.pa.array(c, type=f.type) for c, f in zip(cols, schema)], schema=schema)
+        d = os.path.join(self.out, name); os.makedirs(d, exist_ok=True)
+        path = os.path.join(d, f'part-{self.parts[name]:05d}.{self.fmt}')
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, path, compression='zstd')
+        else:
+            with self.pa.OSFile(path, 'wb') as sink, self.pa.ipc.new_file(sink, schema) as w: w.write_table(table)
+        self.parts[name] += 1; self.rows[name] += len(buf); buf.clear()
+
+    def close(self):
+        for name in self.buffers: self.flush(name)
+        return dict(self.rows)
+
+LATEST_SQL = """SELECT DISTINCT ON (document_id) id, document_id, final_json FROM extractions
+                WHERE status = 'DONE' ORDER BY document_id, created_at DESC"""
+
+def export_db(out, fmt='parquet', rows_per_part=250_000, fetch_size=500):
+    """Stream the latest DONE final_json per document into partitioned columnar files."""
+    from db.db import get_conn
+    w = ColumnarWriter(out, fmt, rows_per_part); docs = 0
+    with get_conn() as conn:
+        with conn.cursor(name='final_to_tabular') as cur:  # server-side cursor: rows arrive fetch_size at a time
+            cur.itersize = fetch_size; cur.execute(LATEST_SQL)
+            for eid, did, fj in cur:
+                d = json.loads(fj) if isinstance(fj, (str, bytes)) else (fj or {})
+                if isinstance(d, dict): w.add(did, eid, d); docs += 1
+    return docs, w.close()
+
+def main():
+    ap=argparse.ArgumentParser(description='Convert final_extraction.json to CSV tables, or all latest extractions to Parquet/Arrow')
+    ap.add_argument('--final'); ap.add_argument('--out',required=True)
+    ap.add_argument('--from-db', action='store_true', help='export latest final_json of every document as columnar files')
+    ap.add_argument('--format', choices=['parquet','arrow'], default='parquet'); ap.add_argument('--rows-per-part', type=int, default=250_000)
+    a=ap.parse_args()
+    if a.from_db:
+        docs, rows = export_db(a.out, a.format, a.rows_per_part)
+        print(f'✅ {docs} documents exported to {a.out} ({a.format}): ' + ', '.join(f'{k}={v}' for k,v in rows.items())); return
+    if not a.final: ap.error('--final is required unless --from-db is given')
+    to_csv(json.load(open(a.final,'r',encoding='utf-8')), a.out)
     print(f'✅ CSVs written to {a.out}')
 if __name__=='__main__': main()
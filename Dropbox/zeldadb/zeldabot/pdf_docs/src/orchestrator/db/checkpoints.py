@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Per-document checkpoints so interrupted backfills resume instead of redoing GPU work.
+
+A checkpoint is keyed by (document_id, prompt_hash, dpi): changing prompts or DPI starts fresh.
+It records the stage reached, the section map and every extraction task result that succeeded,
+so a restart skips the sectionizer and re-dispatches only the tasks that never finished."""
+import os, sys, json, hashlib, argparse
+import psycopg2.extras
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from db.db import get_conn
+
+DDL = """
+CREATE TABLE IF NOT EXISTS extraction_checkpoints (
+    document_id text NOT NULL,
+    prompt_hash text NOT NULL,
+    dpi         integer NOT NULL,
+    status      text NOT NULL DEFAULT 'RUNNING',   -- RUNNING | DONE | FAILED
+    stage       text NOT NULL,                     -- sectionized | extracting | stored
+    section_map jsonb,
+    partial     jsonb NOT NULL DEFAULT '{}'::jsonb,
+    message     text,
+    updated_at  timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (document_id, prompt_hash, dpi)
+);
+"""
+
+def ensure_schema():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(DDL)
+        conn.commit()
+
+def done_ids(document_ids, prompt_hash, dpi):
+    """Subset of document_ids that already have a DONE extraction for this prompt hash and DPI (one query).
+    The ids go in as untyped literals, so Postgres reads them as the column's type and can use its index."""
+    ids = tuple(str(d) for d in document_ids)
+    if not ids: return set()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""SELECT DISTINCT document_id::text FROM extractions
+                           WHERE document_id IN %s AND status = 'DONE' AND prompt_hash = %s AND dpi = %s""",
+                        (ids, prompt_hash, dpi))
+            return {r[0] for r in cur.fetchall()}
+
+class Checkpoint:
+    """Checkpoint of one (document, prompt_hash, dpi); loads any earlier state on construction."""
+    def __init__(self, document_id, prompt_hash, dpi):
+        self.key = (str(document_id), prompt_hash, dpi)
+        with get_conn() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                cur.execute("""SELECT status, stage, section_map, partial FROM extraction_checkpoints
+                               WHERE document_id = %s AND prompt_hash = %s AND dpi = %s""", self.key)
+                row = cur.fetchone()
+        self.status, self.stage = (row["status"], row["stage"]) if row else (None, None)
+        self.section_map = row["section_map"] if row and row["stage"] != "stored" else None
+        self.partial = dict(row["partial"] or {}) if row and row["stage"] != "stored" else {}
+
+    def _write(self, sql, params):
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+            conn.commit()
+
+    def sectionized(self, section_map):
+        self.section_map = section_map; self.partial = {}; self.stage = "sectionized"; self.status = "RUNNING"
+        self._write("""INSERT INTO extraction_checkpoints (document_id, prompt_hash, dpi, status, stage, section_map, partial)
+                       VALUES (%s, %s, %s, 'RUNNING', 'sectionized', %s, '{}'::jsonb)
+                       ON CONFLICT (document_id, prompt_hash, dpi) DO UPDATE SET status = 'RUNNING', stage = 'sectionized',
+                           section_map = EXCLUDED.section_map, partial = '{}'::jsonb, message = NULL, updated_at = now()""",
+                    (*self.key, json.dumps(section_map)))
+
+    def save_partial(self, task, result):
+        """Persist one finished extraction task (jsonb merge, so concurrent tasks don't overwrite each other)."""
+        self.partial[task] = result; self.stage = "extracting"
+        self._write("""UPDATE extraction_checkpoints SET stage = 'extracting', partial = partial || jsonb_build_object(%s, %s::jsonb), updated_at = now()
+                       WHERE document_id = %s AND prompt_hash = %s AND dpi = %s""", (task, json.dumps(result), *self.key))
+
+    def finish(self, status="DONE", message=None):
+        # DONE drops the partials (the extraction row now holds the result); FAILED keeps them for the retry
+        self.status = status
+        if status == "DONE": self.stage = "stored"
+        self._write("""UPDATE extraction_checkpoints SET status = %s, message = %s, updated_at = now(),
+                           stage = CASE WHEN %s = 'DONE' THEN 'stored' ELSE stage END,
+                           partial = CASE WHEN %s = 'DONE' THEN '{}'::jsonb ELSE partial END
+                       WHERE document_id = %s AND prompt_hash = %s AND dpi = %s""", (status, message, status, status, *self.key))
+
+def rehash(old_hash, new_hash):
+    """Relabel extractions and checkpoints stored under old_hash as new_hash; returns (extractions, checkpoints) updated."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE extractions SET prompt_hash = %s WHERE prompt_hash = %s", (new_hash, old_hash))
+            n_ext = cur.rowcount
+            cur.execute("""UPDATE extraction_checkpoints c SET prompt_hash = %s WHERE prompt_hash = %s
+                           AND NOT EXISTS (SELECT 1 FROM extraction_checkpoints n
+                                           WHERE n.document_id = c.document_id AND n.prompt_hash = %s AND n.dpi = c.dpi)""",
+                        (new_hash, old_hash, new_hash))
+            n_ckpt = cur.rowcount
+        conn.commit()
+    return n_ext, n_ckpt
+
+def main():
+    ap = argparse.ArgumentParser(description="Extraction checkpoints")
+    ap.add_argument("cmd", choices=["init", "stats", "rehash"])
+    ap.add_argument("--prompts",
+                    help="rehash: registry whose file sha256 (the prompt_hash db_runner stored before PromptRegistry) "
+                         "is relabelled as its content hash. Only valid if its templates are unchanged since those runs")
+    a = ap.parse_args()
+    if a.cmd == "init":
+        ensure_schema(); print("✅ extraction_checkpoints ready"); return
+    if a.cmd == "rehash":
+        if not a.prompts: ap.error("rehash needs --prompts")
+        from agent_orchestrator import PromptRegistry
+        with open(a.prompts, "rb") as f: old = hashlib.sha256(f.read()).hexdigest()
+        new = PromptRegistry(a.prompts).content_hash
+        n_ext, n_ckpt = rehash(old, new)
+        print(f"✅ {n_ext} extraction(s) and {n_ckpt} checkpoint(s) relabelled {old[:12]} -> {new[:12]}"); return
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT status, stage, count(*) FROM extraction_checkpoints GROUP BY status, stage ORDER BY 1, 2")
+            for status, stage, n in cur.fetchall(): print(f"{status:8s} {stage:12s} {n}")
+
+if __name__ == "__main__":
+    main()
@@ -64,9 +64,13 @@ def add_learning(lesson_type, pattern, action, source_review_id=None):
             cur.execute(sql, (lesson_type, json.dumps(pattern), json.dumps(action), str(source_review_id) if source_review_id else None))
             conn.commit()
 
-def fetch_learnings():
-    sql = "SELECT lesson_type, pattern, action FROM learning_memory WHERE active = true ORDER BY created_at DESC"
+def fetch_learnings(since=None):
+    """Active learnings, newest first; with since, only rows created at or after it (inclusive, callers dedup)."""
+    sql = "SELECT lesson_type, pattern, action, created_at FROM learning_memory WHERE active = true"
+    params = ()
+    if since is not None:
+        sql += " AND created_at >= %s"; params = (since,)
     with get_conn() as conn:
         with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute(sql)
+            cur.execute(sql + " ORDER BY created_at DESC", params)
             return [dict(r) for r in cur.fetchall()]
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Duplicate detection for stored PDFs, so a re-uploaded report reuses the extraction of its twin.
+
+document_hashes holds a sha256 per blob plus short hashes of each page's normalized text.
+Exact duplicates share the sha256 and reuse their twin's DONE extraction. Near duplicates (same
+report re-saved, re-exported or with a few corrected pages) are found through shared page
+hashes: any document with at least one shared page is a candidate, and it matches when the
+Jaccard similarity of the two page-hash sets reaches DEDUP_NEAR_THRESHOLD. Near duplicates are
+only recorded, never reused: the pages that differ are exactly the ones that may carry new
+figures. Both kinds are recorded in document_aliases against their twin.
+
+Backfill hashes blobs inside Postgres (sha256(bytea)), so they never cross the wire; page hashes
+stream one PDF at a time through a named cursor."""
+import os, sys, re, json, hashlib, argparse
+import fitz
+import psycopg2.extras
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from db.db import get_conn
+
+NEAR_THRESHOLD = float(os.getenv("DEDUP_NEAR_THRESHOLD", "0.9"))
+MIN_PAGE_CHARS = 40  # blank/near-blank pages (covers, separators) are not evidence of identity
+
+# source -> (table, id column, blob column)
+SOURCES = {"documents": ("documents", "id", "pdf_bytes"),
+           "arsredovisning_documents": ("arsredovisning_documents", "id", "pdf_binary")}
+
+DDL = """
+CREATE TABLE IF NOT EXISTS document_hashes (
+    source      text NOT NULL,
+    document_id text NOT NULL,
+    sha256      text NOT NULL,
+    bytes       bigint,
+    page_hashes text[],
+    hashed_at   timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (source, document_id)
+);
+CREATE INDEX IF NOT EXISTS document_hashes_sha_idx ON document_hashes (sha256);
+CREATE INDEX IF NOT EXISTS document_hashes_pages_idx ON document_hashes USING gin (page_hashes);
+CREATE TABLE IF NOT EXISTS document_aliases (
+    source       text NOT NULL,
+    document_id  text NOT NULL,
+    canonical_id text NOT NULL,
+    kind         text NOT NULL,     -- exact | near
+    similarity   real NOT NULL,
+    created_at   timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (source, document_id)
+);
+"""
+
+def ensure_schema():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(DDL)
+        conn.commit()
+
+def page_hashes(pdf_bytes) -> list:
+    """Short hashes of each page's normalized text (case and whitespace folded), in page order."""
+    out = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            text = re.sub(r"\s+", " ", page.get_text("text")).strip().lower()
+            if len(text) >= MIN_PAGE_CHARS: out.append(hashlib.sha1(text.encode("utf-8")).hexdigest()[:16])
+    return out
+
+def jaccard(a, b) -> float:
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+def sha256_of(buf, chunk=1 << 20) -> str:
+    """sha256 of a bytes-like blob (psycopg2 returns bytea as a memoryview), fed in chunks of a view so it is never copied."""
+    view = memoryview(buf).cast("B"); h = hashlib.sha256()
+    for i in range(0, len(view), chunk): h.update(view[i:i + chunk])
+    return h.hexdigest()
+
+def register(document_id, pdf_bytes, source="documents"):
+    """Hash one blob already in memory (the runner holds it anyway), without copying it -> (sha256, page hashes)."""
+    sha = sha256_of(pdf_bytes); pages = page_hashes(pdf_bytes)
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""INSERT INTO document_hashes (source, document_id, sha256, bytes, page_hashes) VALUES (%s, %s, %s, %s, %s)
+                           ON CONFLICT (source, document_id) DO UPDATE SET sha256 = EXCLUDED.sha256, bytes = EXCLUDED.bytes,
+                           page_hashes = EXCLUDED.page_hashes, hashed_at = now()""",
+                        (source, str(document_id), sha, len(pdf_bytes), pages))
+        conn.commit()
+    return sha, pages
+
+def find_exact(document_id, sha, prompt_hash, dpi, source="documents"):
+    """Byte-identical other document with a DONE extraction for this prompt hash/DPI -> (canonical_id, extraction) or None."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT document_id FROM document_hashes WHERE source = %s AND sha256 = %s AND document_id <> %s ORDER BY document_id",
+                        (source, sha, str(document_id)))
+            twins = [r[0] for r in cur.fetchall()]
+    if not twins: return None
+    ext = reusable_extraction(twins, prompt_hash, dpi)
+    return (ext.pop("document_id"), ext) if ext else None
+
+def find_near(document_id, sha, pages, source="documents"):
+    """Most similar other document (not byte-identical) at or above NEAR_THRESHOLD -> (canonical_id, similarity) or None."""
+    if not pages: return None
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""SELECT document_id, page_hashes FROM document_hashes
+                           WHERE source = %s AND document_id <> %s AND sha256 <> %s AND page_hashes && %s::text[]""",
+                        (source, str(document_id), sha, pages))
+            rows = cur.fetchall()
+    scored = sorted(((jaccard(pages, r[1] or []), r[0]) for r in rows), key=lambda x: (-x[0], x[1]))
+    if scored and scored[0][0] >= NEAR_THRESHOLD: return scored[0][1], round(scored[0][0], 4)
+    return None
+
+def reusable_extraction(canonical_ids, prompt_hash, dpi):
+    """Latest DONE extraction among canonical_ids for this prompt hash/DPI (document_id, section_map, final_json), or None.
+    Ids are passed as untyped literals so Postgres compares them in extractions.document_id's own type (index-friendly)."""
+    ids = tuple(str(i) for i in (canonical_ids if isinstance(canonical_ids, (list, tuple)) else [canonical_ids]))
+    with get_conn() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            cur.execute("""SELECT document_id::text AS document_id, section_map, final_json FROM extractions WHERE document_id IN %s
+                           AND status = 'DONE' AND prompt_hash = %s AND dpi = %s ORDER BY created_at DESC LIMIT 1""", (ids, prompt_hash, dpi))
+            row = cur.fetchone()
+    return dict(row) if row else None
+
+def record_alias(document_id, canonical_id, kind, similarity, source="documents"):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""INSERT INTO document_aliases (source, document_id, canonical_id, kind, similarity) VALUES (%s, %s, %s, %s, %s)
+                           ON CONFLICT (source, document_id) DO UPDATE SET canonical_id = EXCLUDED.canonical_id, kind = EXCLUDED.kind,
+                           similarity = EXCLUDED.similarity, created_at = now()""",
+                        (source, str(document_id), str(canonical_id), kind, similarity))
+        conn.commit()
+
+def backfill(source, pages=False, batch=200):
+    """Hash every blob of a source not hashed yet; with pages, also fill missing page hashes."""
+    table, idc, blob = SOURCES[source]
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""INSERT INTO document_hashes (source, document_id, sha256, bytes)
+                            SELECT %s, t.{idc}::text, encode(sha256(t.{blob}), 'hex'), octet_length(t.{blob}) FROM {table} t
+                            WHERE t.{blob} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM document_hashes h WHERE h.source = %s AND h.document_id = t.{idc}::text)
+                            ON CONFLICT DO NOTHING""", (source, source))
+            hashed = cur.rowcount
+        conn.commit()
+    paged = 0
+    if pages:
+        with get_conn() as conn, get_conn() as wconn:
+            with conn.cursor(name="dedup_pages") as cur, wconn.cursor() as wcur:
+                cur.itersize = 1  # one PDF in memory at a time
+                cur.execute(f"""SELECT h.document_id, t.{blob} FROM document_hashes h JOIN {table} t ON t.{idc}::text = h.document_id
+                                WHERE h.source = %s AND h.page_hashes IS NULL""", (source,))
+                for did, data in cur:
+                    try: ph = page_hashes(bytes(data))
+                    except Exception as e: print(f"⚠️  {source}/{did}: {e}"); continue
+                    wcur.execute("UPDATE document_hashes SET page_hashes = %s WHERE source = %s AND document_id = %s", (ph, source, did))
+                    paged += 1
+                    if paged % batch == 0: wconn.commit()
+            wconn.commit()
+    return hashed, paged
+
+def report(source):
+    """Exact duplicate groups and recorded aliases for a source."""
+    with get_conn() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            cur.execute("""SELECT sha256, array_agg(document_id ORDER BY document_id) AS ids, max(bytes) AS bytes FROM document_hashes
+                           WHERE source = %s GROUP BY sha256 HAVING count(*) > 1 ORDER BY count(*) DESC""", (source,))
+            groups = [dict(r) for r in cur.fetchall()]
+            cur.execute("SELECT kind, count(*) AS n FROM document_aliases WHERE source = %s GROUP BY kind", (source,))
+            aliases = {r["kind"]: r["n"] for r in cur.fetchall()}
+    return {"source": source, "exact_groups": len(groups), "redundant_copies": sum(len(g["ids"]) - 1 for g in groups),
+            "aliases": aliases, "groups": groups}
+
+def main():
+    ap = argparse.ArgumentParser(description="Content-hash deduplication of stored PDFs")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("init")
+    b = sub.add_parser("backfill"); b.add_argument("--source", choices=[*SOURCES, "all"], default="all")
+    b.add_argument("--pages", action="store_true", help="also compute page text hashes (reads each PDF once)")
+    r = sub.add_parser("report"); r.add_argument("--source", choices=[*SOURCES, "all"], default="all")
+    r.add_argument("--json", action="store_true")
+    a = ap.parse_args()
+    if a.cmd == "init":
+        ensure_schema(); print("✅ document_hashes / document_aliases ready"); return
+    sources = list(SOURCES) if a.source == "all" else [a.source]
+    if a.cmd == "backfill":
+        ensure_schema()
+        for s in sources:
+            hashed, paged = backfill(s, a.pages); print(f"✅ {s}: {hashed} blobs hashed, {paged} page-hashed")
+    else:
+        for s in sources:
+            rep = report(s)
+            if a.json: print(json.dumps(rep, indent=2, default=str)); continue
+            print(f"📊 {s}: {rep['exact_groups']} duplicate groups, {rep['redundant_copies']} redundant copies, aliases {rep['aliases']}")
+            for g in rep["groups"][:20]: print(f"   {g['sha256'][:12]}  {len(g['ids'])}x  {(g['bytes'] or 0)/1e6:.1f} MB  {', '.join(g['ids'][:6])}")
+
+if __name__ == "__main__": main()
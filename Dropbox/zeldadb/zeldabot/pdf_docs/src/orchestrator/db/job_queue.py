@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Postgres-backed extraction job queue: priorities, leases, heartbeats and retries.
+
+Workers claim with FOR UPDATE SKIP LOCKED, so any number of runners on any number of hosts can
+pull from the same table without coordinating. A claim is a lease; a worker that stops
+heartbeating loses it and the job is claimed again once the lease expires."""
+import os, sys, json, argparse, socket
+import psycopg2.extras
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from db.db import get_conn
+
+PRIORITY = {"hitl": 100, "canary": 50, "normal": 0}
+LEASE_S = int(os.getenv("JOB_LEASE_S", "600"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_S = int(os.getenv("JOB_RETRY_BACKOFF_S", "60"))
+
+DDL = """
+CREATE TABLE IF NOT EXISTS extraction_jobs (
+    document_id  text PRIMARY KEY,
+    priority     integer NOT NULL DEFAULT 0,
+    status       text NOT NULL DEFAULT 'PENDING',   -- PENDING | RUNNING | DONE | FAILED
+    attempts     integer NOT NULL DEFAULT 0,
+    max_attempts integer NOT NULL DEFAULT 3,
+    worker       text,
+    lease_until  timestamptz,
+    not_before   timestamptz NOT NULL DEFAULT now(),
+    last_error   text,
+    enqueued_at  timestamptz NOT NULL DEFAULT now(),
+    updated_at   timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS extraction_jobs_claim_idx ON extraction_jobs (priority DESC, enqueued_at)
+    WHERE status IN ('PENDING', 'RUNNING');
+"""
+
+# On conflict a job is only raised in priority; with requeue, finished jobs go back to PENDING with fresh attempts
+_UPSERT = """INSERT INTO extraction_jobs (document_id, priority, max_attempts) {source}
+ON CONFLICT (document_id) DO UPDATE SET priority = GREATEST(extraction_jobs.priority, EXCLUDED.priority), updated_at = now()
+{requeue}"""
+_REQUEUE = """, status = CASE WHEN extraction_jobs.status = 'RUNNING' THEN 'RUNNING' ELSE 'PENDING' END,
+  attempts = CASE WHEN extraction_jobs.status = 'RUNNING' THEN extraction_jobs.attempts ELSE 0 END,
+  max_attempts = EXCLUDED.max_attempts, not_before = now(), last_error = NULL"""
+
+CLAIM_SQL = """
+WITH c AS (
+    UPDATE extraction_jobs j SET status = 'RUNNING', worker = %(worker)s, attempts = j.attempts + 1,
+           lease_until = now() + make_interval(secs => %(lease)s), updated_at = now()
+    FROM (SELECT document_id FROM extraction_jobs
+          WHERE (status = 'PENDING' OR (status = 'RUNNING' AND lease_until < now()))
+            AND attempts < max_attempts AND not_before <= now()
+          ORDER BY priority DESC, enqueued_at
+          LIMIT %(n)s FOR UPDATE SKIP LOCKED) q
+    WHERE j.document_id = q.document_id
+    RETURNING j.document_id, j.attempts, j.priority
+)
+SELECT d.id, d.stem, d.pdf_bytes, c.attempts, c.priority FROM c JOIN documents d ON d.id::text = c.document_id
+ORDER BY c.priority DESC
+"""
+
+# Expired leases that have used up their attempts would otherwise stay RUNNING forever
+REAP_SQL = """UPDATE extraction_jobs SET status = 'FAILED', worker = NULL, lease_until = NULL, updated_at = now(),
+                  last_error = COALESCE(last_error, 'lease expired')
+              WHERE status = 'RUNNING' AND lease_until < now() AND attempts >= max_attempts"""
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def ensure_schema():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(DDL)
+        conn.commit()
+
+def _upsert(cur, source, params, requeue):
+    cur.execute(_UPSERT.format(source=source, requeue=_REQUEUE if requeue else ""), params)
+    return cur.rowcount
+
+def enqueue(document_ids, priority=PRIORITY["normal"], requeue=True, max_attempts=MAX_ATTEMPTS):
+    rows = [(str(d), priority, max_attempts) for d in document_ids]
+    if not rows: return 0
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            psycopg2.extras.execute_values(cur, _UPSERT.format(source="VALUES %s", requeue=_REQUEUE if requeue else ""), rows, page_size=1000)
+        conn.commit()
+    return len(rows)
+
+def enqueue_filter(filter_sql="training_set = true", priority=PRIORITY["normal"], requeue=False, max_attempts=MAX_ATTEMPTS):
+    """Enqueue every document matching filter_sql (a WHERE clause on documents, as for fetch_docs)."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            n = _upsert(cur, f"SELECT id::text, %s, %s FROM documents WHERE {filter_sql}", (priority, max_attempts), requeue)
+        conn.commit()
+    return n
+
+def enqueue_hitl(priority=PRIORITY["hitl"], max_attempts=MAX_ATTEMPTS):
+    """Re-run documents with HITL items newer than their job's last update."""
+    source = """SELECT h.document_id::text, %s, %s FROM hitl_queue h
+                LEFT JOIN extraction_jobs j ON j.document_id = h.document_id::text
+                GROUP BY h.document_id, j.updated_at
+                HAVING j.updated_at IS NULL OR max(h.created_at) > j.updated_at"""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            n = _upsert(cur, source, (priority, max_attempts), requeue=True)
+        conn.commit()
+    return n
+
+def claim(worker, n=1, lease_s=LEASE_S):
+    """Lease up to n jobs, highest priority first. Returns fetch_docs-shaped rows plus attempts/priority."""
+    with get_conn() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            cur.execute(REAP_SQL)
+            cur.execute(CLAIM_SQL, {"worker": worker, "lease": lease_s, "n": n})
+            rows = [dict(r) for r in cur.fetchall()]
+        conn.commit()
+    return rows
+
+def heartbeat(document_id, worker, lease_s=LEASE_S):
+    """Extend the lease; False means it was lost (expired and claimed by another worker)."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""UPDATE extraction_jobs SET lease_until = now() + make_interval(secs => %s), updated_at = now()
+                           WHERE document_id = %s AND worker = %s AND status = 'RUNNING'""", (lease_s, str(document_id), worker))
+            ok = cur.rowcount == 1
+        conn.commit()
+    return ok
+
+def complete(document_id, worker):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""UPDATE extraction_jobs SET status = 'DONE', lease_until = NULL, last_error = NULL, updated_at = now()
+                           WHERE document_id = %s AND worker = %s AND status = 'RUNNING'""", (str(document_id), worker))
+            ok = cur.rowcount == 1
+        conn.commit()
+    return ok
+
+def fail(document_id, worker, error, backoff_s=RETRY_BACKOFF_S):
+    """Release a failed job: back to PENDING after an exponential backoff, or FAILED once attempts are used up."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""UPDATE extraction_jobs SET
+                               status = CASE WHEN attempts >= max_attempts THEN 'FAILED' ELSE 'PENDING' END,
+                               not_before = now() + make_interval(secs => %s * power(2, greatest(attempts - 1, 0))),
+                               worker = NULL, lease_until = NULL, last_error = %s, updated_at = now()
+                           WHERE document_id = %s AND worker = %s AND status = 'RUNNING'
+                           RETURNING status""", (backoff_s, str(error)[:2000], str(document_id), worker))
+            row = cur.fetchone()
+        conn.commit()
+    return row[0] if row else None
+
+def depth():
+    """Jobs that a worker could claim now (PENDING and due, or RUNNING with an expired lease)."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""SELECT count(*) FROM extraction_jobs
+                           WHERE (status = 'PENDING' OR (status = 'RUNNING' AND lease_until < now()))
+                             AND attempts < max_attempts AND not_before <= now()""")
+            return cur.fetchone()[0]
+
+def stats():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""SELECT status, count(*), count(*) FILTER (WHERE status = 'RUNNING' AND lease_until < now())
+                           FROM extraction_jobs GROUP BY status""")
+            return {s: {"jobs": n, "expired_leases": x} for s, n, x in cur.fetchall()}
+
+def main():
+    ap = argparse.ArgumentParser(description="Manage the extraction job queue")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("init", help="create extraction_jobs if missing")
+    e = sub.add_parser("enqueue", help="enqueue documents by filter or id")
+    e.add_argument("--filter"); e.add_argument("--ids", nargs="*")
+    e.add_argument("--priority", default="normal", help="hitl | canary | normal | <int>")
+    e.add_argument("--requeue", action="store_true", help="reset DONE/FAILED jobs to PENDING")
+    e.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    sub.add_parser("hitl", help="re-run documents with new HITL items at hitl priority")
+    sub.add_parser("stats")
+    a = ap.parse_args()
+    if a.cmd == "init":
+        ensure_schema(); print("✅ extraction_jobs ready")
+    elif a.cmd == "enqueue":
+        prio = PRIORITY[a.priority] if a.priority in PRIORITY else int(a.priority)
+        n = (enqueue(a.ids, prio, requeue=True, max_attempts=a.max_attempts) if a.ids
+             else enqueue_filter(a.filter or "training_set = true", prio, requeue=a.requeue, max_attempts=a.max_attempts))
+        print(f"✅ Enqueued {n} job(s) at priority {prio}")
+    elif a.cmd == "hitl":
+        print(f"✅ Enqueued {enqueue_hitl()} HITL re-run(s)")
+    else:
+        print(json.dumps(stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Per-document resource accounting, stored next to each extraction (see tools/cost_report.py)."""
+import os, sys, json
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from db.db import get_conn
+
+DDL = """
+CREATE TABLE IF NOT EXISTS extraction_usage (
+    id                bigserial PRIMARY KEY,
+    document_id       text NOT NULL,
+    prompt_hash       text,
+    dpi               integer,
+    status            text,
+    pages             integer,
+    pages_rendered    integer,
+    pixels            bigint,
+    image_bytes       bigint,
+    prompt_tokens     bigint,
+    completion_tokens bigint,
+    requests          integer,
+    failed_requests   integer,
+    retries           integer,
+    render_s          double precision,
+    request_s         double precision,
+    wall_s            double precision,
+    sections          jsonb,
+    created_at        timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS extraction_usage_doc_idx ON extraction_usage (document_id, created_at DESC);
+"""
+
+COLUMNS = ("pages", "pages_rendered", "pixels", "image_bytes", "prompt_tokens", "completion_tokens",
+           "requests", "failed_requests", "render_s", "request_s", "wall_s")
+
+def ensure_schema():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(DDL)
+        conn.commit()
+
+def store_usage(document_id, usage, status="DONE", prompt_hash=None, dpi=None, retries=0):
+    """usage: OrchestratorAgent.usage; db_runner adds LLM sectionizer requests to the totals and under
+    sections['sectionizer'], and sets wall_s to the whole document. Not recorded here: Gemini calls
+    (pipeline/prod.py twin agent), whose usageMetadata only reaches the receipts, since prod stores no usage rows."""
+    sql = f"""INSERT INTO extraction_usage (document_id, prompt_hash, dpi, status, retries, sections, {', '.join(COLUMNS)})
+              VALUES (%s, %s, %s, %s, %s, %s, {', '.join(['%s'] * len(COLUMNS))})"""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (str(document_id), prompt_hash, dpi, status, retries, json.dumps(usage.get("sections") or {}),
+                              *(usage.get(c) for c in COLUMNS)))
+            conn.commit()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Minimal Prometheus-style metrics for extraction workers (stdlib only).
+
+Counters, gauges and histograms live in a process-wide REGISTRY. serve(port) exposes them at
+/metrics from a daemon thread; dump(path) writes the same text exposition for offline runs."""
+import os, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Tuple, Optional
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _esc(v) -> str:
+    return str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+class _Metric:
+    kind = 'untyped'
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name; self.help = help; self.labels = tuple(labels)
+        self._lock = threading.Lock(); self._values: Dict[tuple, object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> tuple:
+        if set(labels) != set(self.labels): raise ValueError(f'{self.name} expects labels {self.labels}, got {tuple(labels)}')
+        return tuple(str(labels[k]) for k in self.labels)
+
+    def _fmt(self, key: tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, key)) + ([extra] if extra else [])
+        return '{' + ','.join(f'{k}="{_esc(v)}"' for k, v in pairs) + '}' if pairs else ''
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def exposition(self) -> str:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            lines += [f'{n}{lbl} {v:g}' if isinstance(v, float) else f'{n}{lbl} {v}' for n, lbl, v in self._samples()]
+        return '\n'.join(lines)
+
+class Counter(_Metric):
+    kind = 'counter'
+    def inc(self, n: float = 1, **labels):
+        k = self._key(labels)
+        with self._lock: self._values[k] = self._values.get(k, 0) + n
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+    def _samples(self):
+        return [(self.name, self._fmt(k), float(v)) for k, v in self._values.items()]
+
+class Gauge(Counter):
+    kind = 'gauge'
+    def set(self, v: float, **labels):
+        k = self._key(labels)
+        with self._lock: self._values[k] = v
+    def dec(self, n: float = 1, **labels): self.inc(-n, **labels)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels); self.buckets = tuple(sorted(buckets))
+    def observe(self, v: float, **labels):
+        k = self._key(labels)
+        with self._lock:
+            counts, s = self._values.get(k) or ([0] * (len(self.buckets) + 1), 0.0)
+            for i, b in enumerate(self.buckets):
+                if v <= b: counts[i] += 1; break
+            else: counts[-1] += 1
+            self._values[k] = (counts, s + v)
+    def time(self, **labels):
+        """Context manager observing the elapsed seconds of its block."""
+        hist = self
+        class _T:
+            def __enter__(self): self.t0 = time.perf_counter(); return self
+            def __exit__(self, *exc): hist.observe(time.perf_counter() - self.t0, **labels)
+        return _T()
+    def _samples(self):
+        out = []
+        for k, (counts, s) in self._values.items():
+            acc = 0
+            for b, c in zip(self.buckets + (float('inf'),), counts):
+                acc += c; out.append((f'{self.name}_bucket', self._fmt(k, ('le', '+Inf' if b == float('inf') else f'{b:g}')), acc))
+            out += [(f'{self.name}_sum', self._fmt(k), float(s)), (f'{self.name}_count', self._fmt(k), acc)]
+        return out
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}; self._lock = threading.Lock(); self._server = None
+
+    def _get(self, cls, name, help, labels, **kw):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None: m = self._metrics[name] = cls(name, help, labels, **kw)
+            return m
+
+    def counter(self, name, help, labels=()) -> Counter: return self._get(Counter, name, help, labels)
+    def gauge(self, name, help, labels=()) -> Gauge: return self._get(Gauge, name, help, labels)
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram: return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def exposition(self) -> str:
+        return '\n'.join(m.exposition() for m in list(self._metrics.values())) + '\n'
+
+    def serve(self, port: int, addr: str = '0.0.0.0'):
+        """Serve /metrics on a daemon thread (idempotent per process)."""
+        if self._server is not None: return self._server
+        reg = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = reg.exposition().encode('utf-8')
+                self.send_response(200 if self.path.split('?')[0] in ('/', '/metrics') else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'); self.send_header('Content-Length', str(len(body)))
+                self.end_headers(); self.wfile.write(body)
+            def log_message(self, *args): pass
+        self._server = ThreadingHTTPServer((addr, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        return self._server
+
+    def dump(self, path: str):
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f: f.write(self.exposition())
+        os.replace(tmp, path)
+
+REGISTRY = Registry()
+serve = REGISTRY.serve
+dump = REGISTRY.dump
+
+# Worker metrics shared by the orchestrator, db_runner and the prod pipeline
+DOCS = REGISTRY.counter('extraction_docs_total', 'Documents finished, by status (done/failed/skipped/deduped)', ('status',))
+SECTIONS = REGISTRY.counter('extraction_sections_total', 'Extraction requests finished, by prompt key and status (ok/failed)', ('section', 'status'))
+DISPATCH_SECONDS = REGISTRY.histogram('extraction_dispatch_seconds', 'VLM request latency by prompt key', ('section',))
+RENDER_SECONDS = REGISTRY.histogram('extraction_page_render_seconds', 'Time to rasterize and encode one page',
+                                    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+IN_FLIGHT = REGISTRY.gauge('extraction_requests_in_flight', 'VLM requests currently awaiting a response')
+QUEUE_DEPTH = REGISTRY.gauge('extraction_queue_depth', 'Documents waiting to be processed')
+PAGE_REUSE = REGISTRY.counter('extraction_page_reuse_total', 'Reuse-eligible tasks looked up in the page index, by prompt key and result (hit/miss)', ('section', 'result'))
@@ -1,6 +1,8 @@
 
 #!/usr/bin/env python3
-import os, json, argparse, copy
+import os, json, argparse, copy, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from tools.json_scan import first_json
 DIRECTIVES = """You are an information extraction model. Follow STRICTLY:
 1) Respond ONLY with a SINGLE minified JSON object. No prose, no markdown.
 2) Currency is SEK. Amounts MUST be numeric (no spaces/units). Use integers when possible.
@@ -12,15 +14,8 @@ DIRECTIVES = """You are an information extraction model. Follow STRICTLY:
 8) No comments/explanations.
 """
 def split_prompt(text):
-    last_json=None; last_span=None; opens=[i for i,ch in enumerate(text) if ch=='{']; closes=[i for i,ch in enumerate(text) if ch=='}']
-    for i in opens:
-        for j in reversed(closes):
-            if j>i:
-                cand=text[i:j+1]
-                try: obj=json.loads(cand); last_json=cand; last_span=(i,j+1); break
-                except: pass
-        if last_json: break
-    if last_json and last_span: return (text[:last_span[0]].strip(), last_json.strip())
+    m=first_json(text)
+    if m: return (text[:m[0]].strip(), text[m[0]:m[1]].strip())
     return (text,None)
 def main():
     ap=argparse.ArgumentParser(description='Normalize prompts (rule-based)')
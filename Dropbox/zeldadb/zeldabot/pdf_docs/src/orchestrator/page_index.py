@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Page fingerprint index: reuse a task's extraction when its pages were already extracted elsewhere.
+
+Each page's normalized text (case and whitespace folded, digits kept, so year-specific figures
+never match) is cut into word 5-gram shingles and summarized by a 256-value MinHash. LSH bands
+(32 x 8) find candidate pages, kept when every page of the task has an estimated Jaccard >=
+ORCH_PAGE_REUSE_THRESHOLD with the matching page of a stored task. A candidate is only reused
+when every page's normalized text is also identical (sha1): a page that differs in a single
+board member or figure must never take another year's result. The stored task must be from
+another document, with the same prompt key, prompt text, DPI and page count. Pages without a
+text layer are never matched.
+
+The index is a SQLite file (ORCH_PAGE_INDEX, WAL mode, safe for several local workers). Reuse
+is opt-in (ORCH_PAGE_REUSE=1) and limited to ORCH_PAGE_REUSE_KEYS, the prompt keys whose
+sections are boilerplate across years."""
+import os, re, json, zlib, sqlite3, hashlib, argparse, threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+ORCH_PAGE_REUSE = os.getenv('ORCH_PAGE_REUSE', '0') == '1'
+ORCH_PAGE_INDEX = os.getenv('ORCH_PAGE_INDEX', 'artifacts/page_index.sqlite')
+ORCH_PAGE_REUSE_KEYS = {k.strip() for k in os.getenv('ORCH_PAGE_REUSE_KEYS', 'governance,general_property').split(',') if k.strip()}
+ORCH_PAGE_REUSE_THRESHOLD = float(os.getenv('ORCH_PAGE_REUSE_THRESHOLD', '0.95'))
+
+SCHEMA_VERSION = 2  # bumped when fingerprints change; an older index file is rebuilt empty
+NUM_PERM, BANDS = 256, 32
+ROWS = NUM_PERM // BANDS
+SHINGLE = 5
+MIN_WORDS = 12  # shorter pages (covers, separators) carry too little text to identify
+_P = np.uint64(4294967311)  # prime > 2**32
+_rng = np.random.RandomState(20240901)
+_A = _rng.randint(1, 2**32 - 1, NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 2**32 - 1, NUM_PERM, dtype=np.uint64)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id           INTEGER PRIMARY KEY,
+    document_key TEXT NOT NULL,
+    page_no      INTEGER NOT NULL,
+    sig          BLOB NOT NULL,
+    text_sha     TEXT NOT NULL,
+    UNIQUE (document_key, page_no)
+);
+CREATE TABLE IF NOT EXISTS bands (band_key INTEGER NOT NULL, page_id INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS bands_key_idx ON bands (band_key);
+CREATE TABLE IF NOT EXISTS tasks (
+    document_key TEXT NOT NULL,
+    prompt_key   TEXT NOT NULL,
+    prompt_sha   TEXT NOT NULL,
+    dpi          INTEGER NOT NULL,
+    first_page   INTEGER NOT NULL,
+    n_pages      INTEGER NOT NULL,
+    result       TEXT NOT NULL,
+    created_at   TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (document_key, prompt_key, prompt_sha, dpi, first_page, n_pages)
+);
+"""
+
+def normalize(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+def shingles(text: str) -> np.ndarray:
+    words = normalize(text).split(' ')
+    if len(words) < MIN_WORDS: return np.empty(0, dtype=np.uint64)
+    grams = {' '.join(words[i:i + SHINGLE]) for i in range(len(words) - SHINGLE + 1)}
+    return np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams))
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash signature of a page's text, or None when the page has too little text."""
+    x = shingles(text)
+    if not len(x): return None
+    return ((np.outer(_A, x) + _B[:, None]) % _P).min(axis=1).astype(np.uint32)
+
+Fingerprint = Tuple[np.ndarray, str]  # (MinHash signature, sha1 of the normalized text)
+
+def fingerprint(text: str) -> Optional[Fingerprint]:
+    sig = minhash(text)
+    return None if sig is None else (sig, hashlib.sha1(normalize(text).encode('utf-8')).hexdigest())
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard of the shingle sets behind two signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+def band_keys(sig: np.ndarray) -> List[int]:
+    return [(b << 32) | zlib.crc32(sig[b * ROWS:(b + 1) * ROWS].tobytes()) for b in range(BANDS)]
+
+def prompt_sha(prompt: str) -> str:
+    return hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:16]
+
+class PageIndex:
+    def __init__(self, path: str = ORCH_PAGE_INDEX, threshold: float = ORCH_PAGE_REUSE_THRESHOLD):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.threshold = threshold; self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.db.executescript('DROP TABLE IF EXISTS pages; DROP TABLE IF EXISTS bands; DROP TABLE IF EXISTS tasks;')
+            self.db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self.db.executescript(SCHEMA)
+
+    def _page_id(self, document_key: str, page_no: int, fp: Fingerprint) -> int:
+        row = self.db.execute('SELECT id FROM pages WHERE document_key = ? AND page_no = ?', (document_key, page_no)).fetchone()
+        if row: return row[0]
+        sig, text_sha = fp
+        pid = self.db.execute('INSERT INTO pages (document_key, page_no, sig, text_sha) VALUES (?, ?, ?, ?)',
+                              (document_key, page_no, sig.tobytes(), text_sha)).lastrowid
+        self.db.executemany('INSERT INTO bands (band_key, page_id) VALUES (?, ?)', [(k, pid) for k in band_keys(sig)])
+        return pid
+
+    def add(self, document_key: str, prompt_key: str, psha: str, dpi: int, first_page: int, fps: Sequence[Fingerprint], result: Dict[str, Any]):
+        """Index a successful task over pages first_page.. (one fingerprint per page)."""
+        with self._lock, self.db:
+            for i, fp in enumerate(fps): self._page_id(document_key, first_page + i, fp)
+            self.db.execute('INSERT OR REPLACE INTO tasks (document_key, prompt_key, prompt_sha, dpi, first_page, n_pages, result) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (document_key, prompt_key, psha, dpi, first_page, len(fps), json.dumps(result, ensure_ascii=False)))
+
+    def lookup(self, document_key: str, prompt_key: str, psha: str, dpi: int, fps: Sequence[Fingerprint]) -> Optional[Dict[str, Any]]:
+        """Stored result of a task from another document whose pages all have the same normalized text as fps, or None."""
+        keys = band_keys(fps[0][0])
+        with self._lock:
+            rows = self.db.execute(f"""SELECT DISTINCT t.document_key, t.first_page, t.result FROM bands b
+                                       JOIN pages p ON p.id = b.page_id
+                                       JOIN tasks t ON t.document_key = p.document_key AND t.first_page = p.page_no
+                                       WHERE b.band_key IN ({','.join('?' * len(keys))}) AND t.document_key <> ?
+                                         AND t.prompt_key = ? AND t.prompt_sha = ? AND t.dpi = ? AND t.n_pages = ?""",
+                                   (*keys, document_key, prompt_key, psha, dpi, len(fps))).fetchall()
+            for doc, first, result in rows:
+                stored = self.db.execute('SELECT sig, text_sha FROM pages WHERE document_key = ? AND page_no BETWEEN ? AND ? ORDER BY page_no',
+                                         (doc, first, first + len(fps) - 1)).fetchall()
+                if len(stored) == len(fps) and all(similarity(np.frombuffer(s[0], dtype=np.uint32), sig) >= self.threshold and s[1] == text_sha
+                                                   for s, (sig, text_sha) in zip(stored, fps)):
+                    return json.loads(result)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        q = lambda sql: self.db.execute(sql).fetchone()[0]
+        return {'pages': q('SELECT count(*) FROM pages'), 'documents': q('SELECT count(DISTINCT document_key) FROM pages'),
+                'tasks': q('SELECT count(*) FROM tasks'),
+                'tasks_by_key': dict(self.db.execute('SELECT prompt_key, count(*) FROM tasks GROUP BY prompt_key').fetchall())}
+
+_INDEX = None
+
+def get_index() -> Optional[PageIndex]:
+    """Process-wide index when ORCH_PAGE_REUSE is on, else None."""
+    global _INDEX
+    if ORCH_PAGE_REUSE and _INDEX is None: _INDEX = PageIndex()
+    return _INDEX
+
+def main():
+    ap = argparse.ArgumentParser(description='Page fingerprint index used for cross-document task reuse')
+    ap.add_argument('--index', default=ORCH_PAGE_INDEX)
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('stats')
+    c = sub.add_parser('compare', help='estimated similarity of two PDF pages'); c.add_argument('a'); c.add_argument('b')
+    a = ap.parse_args()
+    if a.cmd == 'stats':
+        print(json.dumps(PageIndex(a.index).stats(), indent=2)); return
+    import fitz
+    def sig(spec):
+        path, _, page = spec.rpartition(':')
+        with fitz.open(path) as doc: return minhash(doc[int(page) - 1].get_text('text'))
+    sa, sb = sig(a.a), sig(a.b)
+    print('n/a (too little text)' if sa is None or sb is None else f'{similarity(sa, sb):.3f}')
+
+if __name__ == '__main__': main()
@@ -1,11 +1,18 @@
 
 #!/usr/bin/env python3
-import os, json, argparse, glob, csv
+import os, json, argparse, glob, csv, re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np, pandas as pd
+
+SCORER_VERSION = 2  # v2: leaf-level (path, value) scoring; v1 counted a missing subtree as one field
+ABS_TOL, REL_TOL = 1.0, 0.005
+_IDX = re.compile(r'\[\d+\]')
+
 def norm_str(x):
     if x is None: return None
     if not isinstance(x, str): return x
     return ' '.join(x.strip().split()).lower()
-def num_close(a, b, abs_tol=1.0, rel_tol=0.005):
+def num_close(a, b, abs_tol=ABS_TOL, rel_tol=REL_TOL):
     try: a=float(a); b=float(b)
     except: return False
     if abs(a-b) <= abs_tol: return True
@@ -15,6 +22,7 @@ def eq(a,b):
     if isinstance(a,str) or isinstance(b,str): return norm_str(a)==norm_str(b)
     return a==b
 def compare_json(pred,gold):
+    """Reference (recursive) comparison; kept for ad-hoc use. score() is the vectorized path."""
     if isinstance(gold,dict) and isinstance(pred,dict):
         t=c=0; keys=set(gold.keys())|set(pred.keys())
         for k in keys:
@@ -27,30 +35,113 @@ def compare_json(pred,gold):
             tt,cc=compare_json(p,g); t+=tt; c+=cc
         return t,c
     return 1, 1 if eq(pred,gold) else 0
-def main():
-    ap=argparse.ArgumentParser(description='Score outputs vs. goldens')
-    ap.add_argument('--pred-root',required=True); ap.add_argument('--gold-root',required=True); ap.add_argument('--out',required=True)
-    ap.add_argument('--require-sections',nargs='*',default=[])
-    a=ap.parse_args(); os.makedirs(a.out,exist_ok=True)
+
+def flatten_json(obj, prefix=''):
+    """Flatten a document to {path: leaf}. Lists index as [i]; empty containers yield no leaves."""
+    out={}; stack=[(prefix,obj)]
+    while stack:
+        p,o=stack.pop()
+        if isinstance(o,dict):
+            for k,v in o.items(): stack.append((f'{p}.{k}' if p else str(k), v))
+        elif isinstance(o,list):
+            for i,v in enumerate(o): stack.append((f'{p}[{i}]', v))
+        else: out[p]=o
+    return out
+
+def _to_float(x):
+    if isinstance(x,(int,float)): return float(x)
+    try: return float(x)
+    except (TypeError, ValueError): return np.nan
+
+def _columns(pred, gold):
+    """Outer-join two flattened documents into aligned (path, pred, gold) columns."""
+    fp=flatten_json(pred); fg=flatten_json(gold)
+    paths=list(fg.keys()|fp.keys())
+    pv=[fp.get(k) for k in paths]; gv=[fg.get(k) for k in paths]
+    return paths, pv, gv
+
+def compare_columns(pv, gv):
+    """Vectorized eq() over aligned value columns; returns a bool array."""
+    n=len(pv)
+    if n==0: return np.zeros(0, dtype=bool)
+    is_num=np.fromiter((isinstance(a,(int,float)) or isinstance(b,(int,float)) for a,b in zip(pv,gv)), bool, n)
+    is_str=~is_num & np.fromiter((isinstance(a,str) or isinstance(b,str) for a,b in zip(pv,gv)), bool, n)
+    ok=np.zeros(n, dtype=bool)
+    if is_num.any():
+        idx=np.flatnonzero(is_num)
+        a=np.array([_to_float(pv[i]) for i in idx]); b=np.array([_to_float(gv[i]) for i in idx])
+        d=np.abs(a-b); denom=np.maximum(np.maximum(np.abs(a),np.abs(b)),1.0)
+        with np.errstate(invalid='ignore'): ok[idx]=(d<=ABS_TOL)|(d/denom<=REL_TOL)
+    if is_str.any():
+        idx=np.flatnonzero(is_str)
+        a=pd.Series([norm_str(pv[i]) for i in idx], dtype=object); b=pd.Series([norm_str(gv[i]) for i in idx], dtype=object)
+        ok[idx]=(a.values==b.values)
+    rest=np.flatnonzero(~is_num & ~is_str)
+    for i in rest: ok[i]=pv[i]==gv[i]
+    return ok
+
+def score_doc(stem, pred, gold):
+    """Score one pred/gold pair -> DataFrame(stem, path, field, correct)."""
+    paths,pv,gv=_columns(pred or {}, gold or {})
+    return pd.DataFrame({'stem':stem, 'path':paths, 'field':[_IDX.sub('[]',p) for p in paths], 'correct':compare_columns(pv,gv)})
+
+def _score_item(item): return score_doc(*item)
+
+def load_preds(pred_root):
     preds={}
-    for p in glob.glob(os.path.join(a.pred_root,'*','final_extraction.json')):
+    for p in glob.glob(os.path.join(pred_root,'*','final_extraction.json')):
         stem=os.path.basename(os.path.dirname(p)); preds[stem]=json.load(open(p,'r',encoding='utf-8'))
+    return preds
+def load_golds(gold_root):
     golds={}
-    for p in glob.glob(os.path.join(a.gold_root,'*.json')):
+    for p in glob.glob(os.path.join(gold_root,'*.json')):
         stem=os.path.splitext(os.path.basename(p))[0]; golds[stem]=json.load(open(p,'r',encoding='utf-8'))
-    details=[]; covered=0; universe=golds.keys() or preds.keys()
+    return golds
+
+def score(preds, golds, require_sections=(), workers=None):
+    """Score in-memory {stem: json} maps. Returns {'summary','details','fields'}; fields is per-field accuracy."""
+    universe=list(golds.keys() or preds.keys())
+    pairs=[(s,preds[s],golds[s]) for s in universe if preds.get(s) is not None and s in golds]
+    workers=workers or min(os.cpu_count() or 1, 8)
+    if workers>1 and len(pairs)>=4*workers:
+        with ProcessPoolExecutor(max_workers=workers) as ex: frames=list(ex.map(_score_item, pairs, chunksize=max(1,len(pairs)//(workers*4))))
+    else:
+        frames=[_score_item(p) for p in pairs]
+    df=pd.concat(frames, ignore_index=True) if frames else pd.DataFrame({'stem':[],'path':[],'field':[],'correct':np.zeros(0,bool)})
+    per_doc=df.groupby('stem', sort=False)['correct'].agg(['size','sum'])
+    details=[]; covered=0
     for stem in universe:
-        pred=preds.get(stem); cov = pred is not None and (all(k in pred for k in a.require_sections) if a.require_sections else True)
+        pred=preds.get(stem); cov = pred is not None and (all(k in pred for k in require_sections) if require_sections else True)
         covered+=1 if cov else 0
-        if pred is not None and stem in golds:
-            t,c=compare_json(pred,golds[stem]); acc=round((c/max(t,1))*100,2); details.append([stem,'1' if cov else '0',t,c,acc])
+        if stem in per_doc.index:
+            t,c=int(per_doc.at[stem,'size']),int(per_doc.at[stem,'sum']); details.append([stem,'1' if cov else '0',t,c,round((c/max(t,1))*100,2)])
         else:
             details.append([stem,'1' if cov else '0',0,0,0.0])
-    coverage=round((covered/max(len(universe),1))*100.0,2)
-    total=sum(int(r[2]) for r in details); correct=sum(int(r[3]) for r in details)
-    accuracy=round((correct/max(total,1))*100.0,2)
-    json.dump({'docs_total':len(universe),'coverage_pct':coverage,'accuracy_pct':accuracy,'covered_docs':covered,'fields_total':total,'fields_correct':correct}, open(os.path.join(a.out,'metrics_summary.json'),'w',encoding='utf-8'), indent=2)
-    with open(os.path.join(a.out,'metrics_detail.csv'),'w',newline='',encoding='utf-8') as f:
-        w=csv.writer(f); w.writerow(['stem','covered','total_fields','correct_fields','doc_accuracy_pct']); [w.writerow(r) for r in details]
-    print(f'✅ Wrote metrics to {a.out}'); print(f'Coverage: {coverage}% | Accuracy: {accuracy}%')
+    total=int(len(df)); correct=int(df['correct'].sum())
+    fields=df.groupby('field')['correct'].agg(total='size', correct='sum')
+    fields['accuracy_pct']=(fields['correct']/fields['total'].clip(lower=1)*100).round(2)
+    summary={'docs_total':len(universe),'coverage_pct':round((covered/max(len(universe),1))*100.0,2),'accuracy_pct':round((correct/max(total,1))*100.0,2),
+             'covered_docs':covered,'fields_total':total,'fields_correct':correct,'scorer_version':SCORER_VERSION}
+    return {'summary':summary,'details':details,'fields':fields.sort_values(['accuracy_pct','total'], ascending=[True,False])}
+
+def field_accuracy(result):
+    """Per-field accuracy as a plain dict, for baselines and regression checks."""
+    return {k: float(v) for k,v in result['fields']['accuracy_pct'].items()}
+
+def write_metrics(result, out):
+    os.makedirs(out,exist_ok=True)
+    json.dump(result['summary'], open(os.path.join(out,'metrics_summary.json'),'w',encoding='utf-8'), indent=2)
+    with open(os.path.join(out,'metrics_detail.csv'),'w',newline='',encoding='utf-8') as f:
+        w=csv.writer(f); w.writerow(['stem','covered','total_fields','correct_fields','doc_accuracy_pct']); [w.writerow(r) for r in result['details']]
+    result['fields'].reset_index().to_csv(os.path.join(out,'metrics_fields.csv'), index=False, columns=['field','total','correct','accuracy_pct'])
+
+def main():
+    ap=argparse.ArgumentParser(description='Score outputs vs. goldens')
+    ap.add_argument('--pred-root',required=True); ap.add_argument('--gold-root',required=True); ap.add_argument('--out',required=True)
+    ap.add_argument('--require-sections',nargs='*',default=[]); ap.add_argument('--workers',type=int,default=None)
+    a=ap.parse_args()
+    res=score(load_preds(a.pred_root), load_golds(a.gold_root), a.require_sections, a.workers); write_metrics(res, a.out); s=res['summary']
+    print(f'✅ Wrote metrics to {a.out}'); print(f"Coverage: {s['coverage_pct']}% | Accuracy: {s['accuracy_pct']}%")
+    worst=res['fields'][res['fields']['accuracy_pct']<100].head(10)
+    for field,r in worst.iterrows(): print(f"  {field}: {r['accuracy_pct']}% ({int(r['correct'])}/{int(r['total'])})")
 if __name__=='__main__': main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Schema-aware merging of per-task extraction results, in completion order.
+
+Tasks are added as they finish and each result is merged once, yet the outcome does not depend
+on completion order: it is defined per field over the slots (task positions) that supplied it.
+Among non-empty values the later slot's scalar wins, lists concatenate in slot order (a late
+list is inserted at its slot's position) and None/''/[]/{} only fill a field no slot has data
+for. When slots disagree on a field's type (object vs list vs scalar), the lowest slot's type
+is kept and the clash is listed under `errors`; the values of the other types are held back
+(merged among themselves) in case a lower slot arrives later and changes which type wins. The
+JSON example in each section prompt gives the expected shape, so a field that should be a list
+or an object is merged as one even when a single task returns something else. Failed tasks go
+to `errors` instead of overwriting each other under 'error'. Provenance is a side table: field
+path -> slot (the lowest slot for objects, a tuple of slots for lists), and slot -> (task name,
+prompt key, first page, last page)."""
+import bisect
+from typing import Any, Dict, List, Optional, Tuple
+from tools.json_scan import first_json
+
+EMPTY = (None, '', [], {})
+
+def schema_of(example: Any) -> Any:
+    """Shape of a JSON example: nested dicts of 'list' / 'scalar' leaves."""
+    if isinstance(example, dict): return {k: schema_of(v) for k, v in example.items()}
+    return 'list' if isinstance(example, list) else 'scalar'
+
+def section_schemas(prompts: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """Prompt key -> shape of the JSON object its prompt asks for (keys without an example are left out)."""
+    out = {}
+    for key, prompt in prompts.items():
+        hit = first_json(prompt)
+        if hit is not None and isinstance(hit[2], dict): out[key] = schema_of(hit[2])
+    return out
+
+class ResultMerger:
+    def __init__(self, schemas: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.schemas = schemas or {}
+        self.data: Dict[str, Any] = {}
+        self.tasks: Dict[int, Tuple[str, str, int, int]] = {}
+        self._failed: Dict[int, Dict[str, Any]] = {}  # slot -> error entry
+        # path -> {type: state}, one state per type any slot gave the field:
+        #   'object': [slots, dict]  'list': [[(slot, item count)], list]  'scalar': [[(slot, type name)], top slot, value]
+        #   'empty': [slot, value]
+        # The winning type's dict/list object is the one in data, so merging into it updates the document.
+        self._fields: Dict[str, Dict[str, list]] = {}
+
+    def add(self, slot: int, name: str, prompt_key: str, start: int, end: int, result: Any):
+        self.tasks[slot] = (name, prompt_key, start, end)
+        if not isinstance(result, dict) or list(result) == ['error']:
+            err = result.get('error') if isinstance(result, dict) else f'non-object result: {type(result).__name__}'
+            self._failed[slot] = {'task': name, 'prompt_key': prompt_key, 'pages': [start, end], 'error': err}; return
+        self._merge(self.data, result, self.schemas.get(prompt_key), '', slot)
+
+    def _merge(self, into: Dict, new: Dict, schema: Any, prefix: str, slot: int):
+        for k, v in new.items():
+            path = prefix + k; kind = schema.get(k) if isinstance(schema, dict) else None
+            f = self._fields.setdefault(path, {})
+            if v in EMPTY:
+                if slot > f.get('empty', (-1,))[0]: f['empty'] = [slot, v]
+            elif isinstance(v, dict) and (kind is None or isinstance(kind, dict)):
+                st = f.setdefault('object', [[], {}]); bisect.insort(st[0], slot)
+                self._merge(st[1], v, kind, path + '.', slot)
+            elif isinstance(v, list) or kind == 'list':
+                items = v if isinstance(v, list) else [v]; st = f.setdefault('list', [[], []])
+                i = bisect.bisect(st[0], (slot,)); pos = sum(n for _, n in st[0][:i])
+                st[0].insert(i, (slot, len(items))); st[1][pos:pos] = items
+            else:
+                st = f.setdefault('scalar', [[], -1, None]); bisect.insort(st[0], (slot, type(v).__name__))
+                if slot > st[1]: st[1], st[2] = slot, v
+            into[k] = self._value(f)
+
+    @staticmethod
+    def _winner(f: Dict[str, list]) -> Optional[str]:
+        """The non-empty type given by the lowest slot, or None if every slot left the field empty."""
+        first = {t: st[0][0] if t == 'object' else st[0][0][0] for t, st in f.items() if t != 'empty'}
+        return min(first, key=first.get) if first else None
+
+    def _value(self, f: Dict[str, list]) -> Any:
+        t = self._winner(f)
+        return f['empty'][1] if t is None else f[t][2] if t == 'scalar' else f[t][1]
+
+    def _visible(self, node: Dict, prefix: str = ''):
+        """(path, field state, winning type) for every field of the merged document, depth first."""
+        for k, v in node.items():
+            f = self._fields.get(prefix + k)
+            if f is None: continue  # e.g. 'errors' added by result()
+            t = self._winner(f); yield prefix + k, f, t
+            if t == 'object': yield from self._visible(v, prefix + k + '.')
+
+    @property
+    def errors(self) -> List[Dict[str, Any]]:
+        """Failed tasks in slot order, then type conflicts by slot and field."""
+        conflicts = []
+        for path, f, t in self._visible(self.data):
+            if t is None or len(f) - ('empty' in f) < 2: continue
+            st = f[t]; kept_slot = st[0][0] if t == 'object' else st[0][0][0]
+            kept = 'dict' if t == 'object' else 'list' if t == 'list' else type(st[2]).__name__
+            for other, ost in f.items():
+                if other in (t, 'empty'): continue
+                for s, dropped in ([(s, 'dict') for s in ost[0]] if other == 'object' else [(s, 'list') for s, _ in ost[0]] if other == 'list' else ost[0]):
+                    name, pk, start, end = self.tasks[s]
+                    conflicts.append((s, path, {'task': name, 'prompt_key': pk, 'pages': [start, end],
+                                                'error': f'type conflict at {path}: kept {kept} from slot {kept_slot}, dropped {dropped}'}))
+        return [self._failed[s] for s in sorted(self._failed)] + [e for *_, e in sorted(conflicts, key=lambda c: c[:2])]
+
+    @property
+    def provenance(self) -> Dict[str, Any]:
+        out = {}
+        for path, f, t in self._visible(self.data):
+            if t is None: out[path] = f['empty'][0]
+            elif t == 'object': out[path] = f[t][0][0]
+            elif t == 'list': out[path] = tuple(s for s, _ in f[t][0])
+            else: out[path] = f[t][1]
+        return out
+
+    def result(self) -> Dict[str, Any]:
+        """The merged document (live, not a copy); failed tasks and type conflicts are listed under 'errors'."""
+        errors = self.errors
+        if errors: self.data['errors'] = errors
+        return self.data
+
+    def provenance_table(self) -> Dict[str, Any]:
+        return {'tasks': {s: list(t) for s, t in sorted(self.tasks.items())}, 'fields': self.provenance}
@@ -1,8 +1,24 @@
 
 #!/usr/bin/env python3
 import os, json, argparse, sys
+from concurrent.futures import ProcessPoolExecutor
+import psycopg2.extras
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from db.db import latest_extraction, add_learning, get_conn
+from db.db import get_conn
+
+# Every finding with corrections not applied yet (no learning row records its review id), joined to its
+# document's latest extraction (only DONE ones are corrected). Applied findings are already in that extraction.
+FINDINGS_SQL = """
+SELECT rf.id, rf.document_id, rf.suggested_corrections, e.section_map, e.final_json, e.prompt_hash, e.dpi
+FROM review_findings rf
+JOIN LATERAL (SELECT x.section_map, x.final_json, x.status, x.prompt_hash, x.dpi FROM extractions x
+              WHERE x.document_id = rf.document_id ORDER BY x.created_at DESC LIMIT 1) e ON e.status = 'DONE'
+WHERE rf.suggested_corrections IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM learning_memory lm
+                  WHERE lm.lesson_type = 'postprocess_rule' AND lm.source_review_id::text = rf.id::text)
+  AND rf.document_id::text IN (SELECT id::text FROM documents WHERE {filter})
+ORDER BY rf.document_id, rf.id
+"""
 
 def deep_merge(a, b):
     if isinstance(a, dict) and isinstance(b, dict):
@@ -12,35 +28,72 @@ def deep_merge(a, b):
         return res
     return b if b is not None else a
 
+def _loads(v): return json.loads(v) if isinstance(v, (str, bytes)) else v
+
+def merge_document(group):
+    """Fold one document's findings, in review order, into its latest final_json."""
+    doc_id, final, meta, findings = group
+    applied = []
+    for rid, corr in findings:
+        try:
+            final = deep_merge(final, _loads(corr)); applied.append(rid)
+        except Exception:
+            continue
+    return doc_id, final, meta, applied
+
+def _groups(rows):
+    """Group ordered finding rows by document; yields (doc_id, final_json, meta, [(finding_id, corrections)])."""
+    cur = None
+    for rid, doc_id, corr, section_map, final_json, prompt_hash, dpi in rows:
+        if cur is None or cur[0] != doc_id:
+            if cur is not None: yield cur
+            cur = (doc_id, _loads(final_json) or {}, (_loads(section_map) or {}, prompt_hash, dpi), [])
+        cur[3].append((rid, corr))
+    if cur is not None: yield cur
+
+def _write_chunk(conn, merged):
+    ext_rows = []; learn_rows = []
+    for doc_id, corrected, (section_map, prompt_hash, dpi), applied in merged:
+        if not applied: continue
+        ext_rows.append((str(doc_id), json.dumps(section_map), json.dumps(corrected), "DONE", "corrected_by_gemini", prompt_hash, dpi))
+        learn_rows += [("postprocess_rule", json.dumps({"from_review": str(rid)}), json.dumps({"applied": True}), str(rid)) for rid in applied]
+    if not ext_rows: return 0
+    with conn.cursor() as cur:
+        psycopg2.extras.execute_values(cur, """INSERT INTO extractions (document_id, section_map, final_json, status, message, prompt_hash, dpi) VALUES %s""", ext_rows, page_size=len(ext_rows))
+        psycopg2.extras.execute_values(cur, """INSERT INTO learning_memory (lesson_type, pattern, action, source_review_id) VALUES %s""", learn_rows, page_size=len(learn_rows))
+    conn.commit()
+    return len(learn_rows)
+
+def apply_corrections(conn, filter_sql="training_set = true", chunk_size=500, workers=1):
+    """Apply every pending finding; returns (corrections applied, documents). A second run applies nothing."""
+    applied = 0; docs = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def flush(chunk):
+            merged = list(pool.map(merge_document, chunk, chunksize=max(1, len(chunk)//(workers*4))))
+            return _write_chunk(conn, merged)
+        # Named (server-side) cursor streams the join; WITH HOLD keeps it open across the per-chunk commits
+        with conn.cursor(name="apply_corrections", withhold=True) as cur:
+            cur.itersize = 2000
+            cur.execute(FINDINGS_SQL.format(filter=filter_sql))
+            chunk = []
+            for group in _groups(cur):
+                chunk.append(group)
+                if len(chunk) >= chunk_size:
+                    applied += flush(chunk); docs += len(chunk); chunk = []
+            if chunk:
+                applied += flush(chunk); docs += len(chunk)
+    return applied, docs
+
 def main():
     ap = argparse.ArgumentParser(description="Apply Gemini-suggested corrections into extractions")
     ap.add_argument("--filter", default="training_set = true")
+    ap.add_argument("--chunk-size", type=int, default=500, help="documents per worker batch / insert transaction")
+    ap.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, 8))
     args = ap.parse_args()
 
     with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, document_id, suggested_corrections FROM review_findings WHERE suggested_corrections IS NOT NULL")
-            rows = cur.fetchall()
-
-    applied = 0
-    for rid, doc_id, corr in rows:
-        last = latest_extraction(doc_id)
-        if not last or last.get("status") != "DONE":
-            continue
-        final = last.get("final_json") or {}
-        try:
-            corrected = deep_merge(final, corr)
-        except Exception:
-            continue
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""INSERT INTO extractions (document_id, section_map, final_json, status, message, prompt_hash, dpi)
-                               VALUES (%s, %s, %s, %s, %s, %s, %s)""" ,
-                            (str(doc_id), json.dumps(last.get("section_map") or {}), json.dumps(corrected), "DONE", "corrected_by_gemini", last.get("prompt_hash"), last.get("dpi")))
-                conn.commit()
-        add_learning("postprocess_rule", {"from_review": str(rid)}, {"applied": True})
-        applied += 1
-    print(f"✅ Applied {applied} correction(s).")
+        applied, docs = apply_corrections(conn, args.filter, args.chunk_size, args.workers)
+    print(f"✅ Applied {applied} correction(s) across {docs} document(s).")
 
 if __name__ == "__main__":
     main()
@@ -1,5 +1,7 @@
 
-import os, base64, json, requests
+import os, sys, json, requests
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from tools.payload import Blob, encode_image, dumps as dump_payload, JSON_HEADERS
 GEMINI_API_KEY=os.getenv('GEMINI_API_KEY','')
 GEMINI_MODEL=os.getenv('GEMINI_MODEL','gemini-1.5-pro')
 STRICT_SINGLE=os.getenv('GEMINI_STRICT_SINGLE_PAGE','1')=='1'
@@ -11,7 +13,7 @@ Return a SINGLE minified JSON with keys:
 If you disagree, include minimal suggested_corrections as a valid JSON diff for the fields in question.
 Do not include any prose outside the JSON.
 '''
-def b64img(jpeg_bytes): return base64.b64encode(jpeg_bytes).decode('utf-8')
+def b64img(jpeg_bytes): return Blob(encode_image(jpeg_bytes))
 def call_gemini(main_bytes, prev_bytes=None, next_bytes=None, target_json=None):
     if not GEMINI_API_KEY: raise RuntimeError('GEMINI_API_KEY is not set.')
     parts=[{"role":"user","parts":[{"text":INSTRUCT}]}]
@@ -23,7 +25,7 @@ def call_gemini(main_bytes, prev_bytes=None, next_bytes=None, target_json=None):
     parts.append({"role":"user","parts": imgs + ([{"text":json.dumps(target_json)}] if target_json else [])})
     payload={"contents": parts, "generationConfig": {"temperature": 0.0, "maxOutputTokens": 512}}
     url=API.format(model=GEMINI_MODEL, key=GEMINI_API_KEY)
-    r=requests.post(url,json=payload,timeout=60); r.raise_for_status(); data=r.json()
+    r=requests.post(url,data=dump_payload(payload),headers=JSON_HEADERS,timeout=60); r.raise_for_status(); data=r.json()
     text=''
     try: text=data['candidates'][0]['content']['parts'][0]['text']
     except Exception: return {"verdict":"unsure","notes":"No text in response","suggested_corrections":{}}
@@ -1,74 +1,276 @@
 
 #!/usr/bin/env python3
-import os, json, argparse, asyncio, tempfile, time, hashlib, sys
+import os, json, argparse, asyncio, tempfile, time, sys
+from datetime import timedelta
+import aiohttp
 from pathlib import Path
 from dotenv import load_dotenv
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from db.db import fetch_docs, store_extraction, fetch_learnings
+from db import job_queue, checkpoints, dedup
+from db.usage import store_usage, ensure_schema as ensure_usage_schema
 from agent_sectionizer import SectionizerAgent
-from agent_orchestrator import OrchestratorAgent
+from agent_orchestrator import OrchestratorAgent, get_registry, make_limiter
+import metrics
 
-def sha256_file(path):
-    h=hashlib.sha256()
-    with open(path,'rb') as f:
-        for chunk in iter(lambda: f.read(8192), b''):
-            h.update(chunk)
-    return h.hexdigest()
+def _empty(v): return v is None or v == "" or (isinstance(v, (dict, list)) and not v)
 
 def merge_missing_only(dst, patch):
+    """Fill missing/empty keys of dst from patch. Shares unchanged subtrees; only copies dicts on the changed path."""
     if isinstance(dst, dict) and isinstance(patch, dict):
-        out=dict(dst)
+        out=None
         for k,v in patch.items():
-            if k not in out or out[k] in (None, [], {}, ""):
-                out[k]=v
-            elif isinstance(out[k], dict) and isinstance(v, dict):
-                out[k]=merge_missing_only(out[k], v)
-        return out
+            cur=dst.get(k)
+            if k not in dst or _empty(cur): new=v
+            elif isinstance(cur, dict) and isinstance(v, dict): new=merge_missing_only(cur, v)
+            else: continue
+            if k in dst and new is cur: continue
+            if out is None: out=dict(dst)
+            out[k]=new
+        return dst if out is None else out
     return dst
 
+def _learning_patch(L):
+    if L.get("lesson_type")!="postprocess_rule": return None, None
+    patt=L.get("pattern") or {}; action=L.get("action") or {}
+    section=(patt.get("section") if isinstance(patt, dict) else None)
+    apply_obj=(action.get("apply") if isinstance(action, dict) else None)
+    return (section, apply_obj) if section and apply_obj else (None, None)
+
+class CompiledLearnings:
+    """Active postprocess_rule learnings compiled to a section -> patch index.
+
+    Per section, patches are folded newest-first until one fills the section, which is
+    what apply_learnings used to do row by row. refresh() pulls rows created since the
+    watermark minus `overlap` seconds (created_at is the inserting transaction's start, so a
+    row can commit after a later watermark was read), skips rows already compiled, and
+    recompiles the touched sections. Every `rebuild` seconds it recompiles from scratch
+    instead, which also drops learnings that were deactivated since."""
+    def __init__(self, rows=None, overlap=None, rebuild=None):
+        self.overlap=timedelta(seconds=float(os.getenv("LEARNINGS_OVERLAP_S","300")) if overlap is None else overlap)
+        self.rebuild=float(os.getenv("LEARNINGS_REBUILD_S","900")) if rebuild is None else rebuild
+        self._reset()
+        if rows: self._add(rows)
+
+    def _reset(self):
+        self.watermark=None; self._patches={}; self._compiled={}; self._order=[]; self._seen=set(); self._seq=0; self.built_at=time.time()
+
+    @staticmethod
+    def _key(L):
+        return json.dumps([L.get("lesson_type"), L.get("pattern"), L.get("action"), L.get("created_at")], sort_keys=True, default=str)
+
+    def _add(self, rows):
+        touched=set(); added=0
+        # rows arrive newest-first; each section's list is kept newest-first by (created_at, arrival), since
+        # rows picked up through the overlap window can be older than ones already compiled
+        for L in reversed(rows):
+            key=self._key(L)
+            if key in self._seen: continue  # already compiled (overlap window)
+            self._seen.add(key); added+=1; self._seq+=1
+            ts=L.get("created_at")
+            if ts is not None and (self.watermark is None or ts > self.watermark): self.watermark=ts
+            section, apply_obj=_learning_patch(L)
+            if not section: continue
+            self._patches.setdefault(section, []).append(((1, ts, self._seq) if ts is not None else (0, 0, self._seq), apply_obj)); touched.add(section)
+        for section in touched: self._patches[section].sort(key=lambda p: p[0], reverse=True)
+        if touched: self._order=sorted(self._patches, key=lambda sec: self._patches[sec][0][0], reverse=True)
+        for section in touched:
+            combined=full=None
+            for _, patch in self._patches[section]:
+                full=merge_missing_only(full or {}, patch)
+                if combined is None and full.get(section): combined=full
+            # full: every patch, for a falsy-but-present section value (e.g. 0) that never "fills"
+            self._compiled[section]=(full if combined is None else combined, full)
+        return added
+
+    def refresh(self):
+        if self.watermark is None or time.time() - self.built_at >= self.rebuild:
+            rows=fetch_learnings(); self._reset(); return self._add(rows)
+        return self._add(fetch_learnings(since=self.watermark - self.overlap))
+
+    def __len__(self): return len(self._compiled)
+
+    def apply(self, final_json):
+        out=final_json or {}
+        for section in self._order:
+            if out.get(section): continue
+            patch, full=self._compiled[section]
+            out=merge_missing_only(out, full if section in out and not _empty(out[section]) else patch)
+        return out
+
 def apply_learnings(final_json, learnings):
-    out=dict(final_json or {})
-    for L in learnings:
-        if L.get("lesson_type")=="postprocess_rule":
-            patt=L.get("pattern") or {}
-            action=L.get("action") or {}
-            section=(patt.get("section") if isinstance(patt, dict) else None)
-            apply_obj=(action.get("apply") if isinstance(action, dict) else None)
-            if section and apply_obj and (section not in out or not out.get(section)):
-                out = merge_missing_only(out, apply_obj)
-    return out
-
-async def process_doc(row, tmpdir, prompts_path, sectionizer_mode, dpi, learnings):
+    if not isinstance(learnings, CompiledLearnings): learnings=CompiledLearnings(learnings)
+    return learnings.apply(final_json)
+
+async def process_doc(row, tmpdir, prompts, sectionizer_mode, dpi, learnings, checkpoint=None, usage=None, session=None, limiter=None):
+    """Sectionize + orchestrate one document row. If usage is a dict it receives the orchestrator's
+    resource counters (also when the workflow fails), with LLM sectionizer requests added to the totals
+    and under sections['sectionizer']. Both agents send through session/limiter when given."""
     did, stem, pdf_bytes = row["id"], row["stem"], row["pdf_bytes"]
     pdf_path = os.path.join(tmpdir, f"{stem or did}.pdf")
     with open(pdf_path, "wb") as f: f.write(pdf_bytes)
-    sectionizer = SectionizerAgent(pdf_path, mode=sectionizer_mode)
-    section_map = sectionizer.analyze_document()
-    os.environ["ORCH_DPI"] = str(dpi)
-    prompts = json.load(open(prompts_path, "r", encoding="utf-8"))
-    orch = OrchestratorAgent(pdf_path, prompts=prompts)
-    final = await orch.run_workflow(section_map)
+    sectionizer_usage = None
+    if checkpoint is not None and checkpoint.section_map is not None:
+        section_map = checkpoint.section_map  # resumed: sectionizer already ran for this prompt hash/dpi
+    else:
+        sectionizer = SectionizerAgent(pdf_path, mode=sectionizer_mode)
+        try:
+            section_map = await sectionizer.analyze_document_async(session, limiter)
+        finally:
+            if sectionizer.usage['requests']: sectionizer_usage = sectionizer.usage
+            if usage is not None and sectionizer_usage: usage.update(sectionizer_usage, sections={'sectionizer': sectionizer_usage})
+        if checkpoint is not None: checkpoint.sectionized(section_map)
+    orch = OrchestratorAgent(pdf_path, prompts=prompts, session=session, limiter=limiter, dpi=dpi)
+    try:
+        if checkpoint is not None:
+            final = await orch.run_workflow(section_map, on_result=checkpoint.save_partial, cached=checkpoint.partial)
+        else:
+            final = await orch.run_workflow(section_map)
+    finally:
+        if usage is not None:
+            usage.update(orch.usage)
+            if sectionizer_usage:
+                for k, v in sectionizer_usage.items(): usage[k] += v
+                usage["sections"]["sectionizer"] = sectionizer_usage
     final = apply_learnings(final, learnings)
     return section_map, final
 
+class LeaseLost(Exception):
+    """The job's lease expired and was claimed elsewhere; its result must not be stored."""
+
+async def _heartbeat(document_id, worker, lease_s, work):
+    # Renew at a third of the lease so one slow round trip never lets it lapse; on loss, stop the work
+    while True:
+        await asyncio.sleep(lease_s / 3)
+        if not await asyncio.to_thread(job_queue.heartbeat, document_id, worker, lease_s):
+            print(f"⚠️  Lease lost for {document_id}; abandoning it to the worker that now owns it")
+            work.cancel(); return False
+
 async def main_async(args):
     load_dotenv()
-    rows = fetch_docs(filter_sql=args.filter, limit=args.limit, offset=args.offset)
     Path(args.out).mkdir(parents=True, exist_ok=True)
     tmpdir = tempfile.mkdtemp(prefix="db_runner_")
-    prompt_hash = sha256_file(args.prompts)
-    learnings = fetch_learnings()
-    start = time.time(); done = 0
-    for row in rows:
+    registry = get_registry(args.prompts)
+    learnings = CompiledLearnings(); learnings.refresh(); last_refresh = time.time()
+    if args.metrics_port: metrics.serve(args.metrics_port); print(f"📈 Metrics on :{args.metrics_port}/metrics")
+    if args.checkpoints: checkpoints.ensure_schema()
+    if args.dedup: dedup.ensure_schema()
+    ensure_usage_schema()
+    start = time.time(); done = 0; seen = 0; skipped = 0; deduped = 0
+    reuse = {"reused_tasks": 0, "reuse_eligible": 0}  # page-index reuse across this run (ORCH_PAGE_REUSE)
+    # One connection pool and one in-flight cap for every sectionizer and orchestrator request of this run
+    session = aiohttp.ClientSession(); limiter = make_limiter(args.max_inflight)
+    batch_ids = []; done_before = {}
+
+    def already_done(did, prompt_hash):
+        # Idempotent restarts: a DONE extraction with the same prompt hash and dpi is not redone
+        if args.force: return False
+        if not batch_ids: return str(did) in checkpoints.done_ids([did], prompt_hash, args.dpi)
+        if prompt_hash not in done_before: done_before[prompt_hash] = checkpoints.done_ids(batch_ids, prompt_hash, args.dpi)
+        return str(did) in done_before[prompt_hash]
+
+    def reuse_duplicate(row, prompt_hash, owned=None):
+        # A byte-identical copy with a DONE extraction saves a full GPU pass. A near duplicate is only
+        # recorded as an alias and still extracted: its differing pages may carry corrected figures.
+        sha, pages = dedup.register(row["id"], row["pdf_bytes"])
+        hit = dedup.find_exact(row["id"], sha, prompt_hash, args.dpi)
+        if hit is None:
+            near = dedup.find_near(row["id"], sha, pages)
+            if near is not None:
+                dedup.record_alias(row["id"], near[0], "near", near[1])
+                print(f"≈  {row['id']}: near duplicate of {near[0]} (similarity {near[1]}); extracting anyway")
+            return None
+        canonical, ext = hit
+        if owned is not None and not owned(): raise LeaseLost(row["id"])
+        store_extraction(row["id"], ext["section_map"], ext["final_json"], status="DONE", prompt_hash=prompt_hash, dpi=args.dpi,
+                         message=f"reused exact duplicate of {canonical}")
+        dedup.record_alias(row["id"], canonical, "exact", 1.0)
+        return canonical, "exact"
+
+    async def handle(row, owned=None):
+        # owned(): in queue mode, renews the lease and says whether this worker still holds it; checked before any store
+        nonlocal last_refresh, done, skipped, deduped
+        if time.time() - last_refresh >= args.learnings_refresh:
+            learnings.refresh(); last_refresh = time.time()
+        prompts, prompt_hash = registry.prompts, registry.content_hash  # hot-reloads if registry/templates changed
+        if already_done(row["id"], prompt_hash):
+            skipped += 1; metrics.DOCS.inc(status="skipped"); return None
+        if args.dedup and not args.force:
+            try: hit = await asyncio.to_thread(reuse_duplicate, row, prompt_hash, owned)
+            except LeaseLost as e: return e
+            except Exception as e: hit = None; print(f"⚠️  Dedup check failed for {row['id']}: {e}")
+            if hit:
+                deduped += 1; metrics.DOCS.inc(status="deduped")
+                print(f"♻️  {row['id']}: {hit[1]} duplicate of {hit[0]}, extraction reused"); return None
+        ckpt = None; usage = {}; t0 = time.time()
+        retries = max(int(row.get("attempts") or 1) - 1, 0)
         try:
-            sm, fj = await process_doc(row, tmpdir, args.prompts, args.sectionizer_mode, args.dpi, learnings)
+            if args.checkpoints: ckpt = checkpoints.Checkpoint(row["id"], prompt_hash, args.dpi)
+            sm, fj = await process_doc(row, tmpdir, prompts, args.sectionizer_mode, args.dpi, learnings, ckpt, usage, session, limiter)
+            if owned is not None and not await asyncio.to_thread(owned): raise LeaseLost(row["id"])
             store_extraction(row["id"], sm, fj, status="DONE", prompt_hash=prompt_hash, dpi=args.dpi)
+            store_usage(row["id"], {**usage, "wall_s": time.time() - t0}, "DONE", prompt_hash, args.dpi, retries)
+            for k in reuse: reuse[k] += usage.get(k, 0)
+            if ckpt: ckpt.finish("DONE")
+            metrics.DOCS.inc(status="done")
             done += 1
-            if done % 10 == 0: print(f"Processed {done}/{len(rows)}")
+            if done % 10 == 0: print(f"Processed {done}/{seen}")
+            return None
+        except LeaseLost as e:
+            print(f"⚠️  Lease lost for {row['id']}; result discarded"); return e
         except Exception as e:
+            if owned is not None and not await asyncio.to_thread(owned):
+                print(f"⚠️  Lease lost for {row['id']}; failure not recorded"); return LeaseLost(row["id"])
             store_extraction(row["id"], {}, {}, status="FAILED", message=str(e), prompt_hash=prompt_hash, dpi=args.dpi)
+            if usage: store_usage(row["id"], {**usage, "wall_s": time.time() - t0}, "FAILED", prompt_hash, args.dpi, retries)
+            if ckpt: ckpt.finish("FAILED", str(e))
+            metrics.DOCS.inc(status="failed")
             print(f"FAILED {row['id']}: {e}")
-    print(f"✅ Complete. {done}/{len(rows)} processed in {round(time.time()-start,2)}s.")
+            return e
+
+    try:
+        if not args.queue:
+            rows = fetch_docs(filter_sql=args.filter, limit=args.limit, offset=args.offset); seen = len(rows)
+            batch_ids.extend(r["id"] for r in rows)
+            for i, row in enumerate(rows):
+                metrics.QUEUE_DEPTH.set(len(rows) - i)
+                await handle(row)
+                if args.metrics_file: metrics.dump(args.metrics_file)
+            metrics.QUEUE_DEPTH.set(0)
+        else:
+            # Queue mode: lease jobs one at a time; runners on other hosts pull from the same table
+            worker = job_queue.worker_id(); idle = 0
+            while args.limit <= 0 or seen < args.limit:
+                rows = await asyncio.to_thread(job_queue.claim, worker, 1, args.lease)
+                metrics.QUEUE_DEPTH.set(await asyncio.to_thread(job_queue.depth))
+                if not rows:
+                    if not args.follow: break
+                    idle += 1; await asyncio.sleep(min(args.poll * idle, 60)); continue
+                idle = 0; row = rows[0]; seen += 1
+                owned = lambda did=row["id"]: job_queue.heartbeat(did, worker, args.lease)
+                work = asyncio.create_task(handle(row, owned))
+                hb = asyncio.create_task(_heartbeat(row["id"], worker, args.lease, work))
+                try:
+                    err = await work
+                except asyncio.CancelledError:
+                    if not (hb.done() and not hb.cancelled() and hb.result() is False): raise
+                    err = LeaseLost(row["id"])  # cancelled by the heartbeat
+                finally:
+                    hb.cancel()
+                if args.metrics_file: metrics.dump(args.metrics_file)
+                if isinstance(err, LeaseLost): continue  # the job belongs to another worker now
+                if err is None:
+                    if not await asyncio.to_thread(job_queue.complete, row["id"], worker):
+                        print(f"⚠️  Lease lost for {row['id']} after its result was stored; the new owner will redo it")
+                else:
+                    status = await asyncio.to_thread(job_queue.fail, row["id"], worker, err)
+                    if status == "PENDING": print(f"↻ {row['id']} will be retried (attempt {row['attempts']})")
+    finally:
+        await session.close()
+    if args.metrics_file: metrics.dump(args.metrics_file)
+    print(f"✅ Complete. {done}/{seen} processed, {skipped} already stored, {deduped} reused from duplicates, in {round(time.time()-start,2)}s.")
+    if reuse["reuse_eligible"]:
+        print(f"♻️  Page reuse: {reuse['reused_tasks']}/{reuse['reuse_eligible']} eligible tasks ({reuse['reused_tasks'] / reuse['reuse_eligible']:.1%}) taken from the page index")
 
 def main():
     ap = argparse.ArgumentParser(description="DB-backed runner")
@@ -79,6 +281,17 @@ def main():
     ap.add_argument("--prompts", required=True)
     ap.add_argument("--sectionizer-mode", default=os.getenv("SECTIONIZER_MODE","heuristic"))
     ap.add_argument("--dpi", type=int, default=int(os.getenv("ORCH_DPI","200")))
+    ap.add_argument("--queue", action="store_true", help="pull documents from extraction_jobs (see db/job_queue.py) instead of --filter/--offset; --limit caps jobs, 0 = no cap")
+    ap.add_argument("--follow", action="store_true", help="with --queue, keep polling when the queue is empty")
+    ap.add_argument("--poll", type=float, default=5.0, help="seconds between polls of an empty queue (backs off to 60s)")
+    ap.add_argument("--lease", type=int, default=job_queue.LEASE_S, help="job lease seconds; renewed every lease/3")
+    ap.add_argument("--max-inflight", type=int, default=int(os.getenv("ORCH_MAX_INFLIGHT","16")), help="cap on concurrent VLM requests (sectionizer + extraction); 0 = no cap")
+    ap.add_argument("--force", action="store_true", help="re-extract documents already stored with the same prompt hash and dpi")
+    ap.add_argument("--no-checkpoints", dest="checkpoints", action="store_false", help="don't persist/resume per-document checkpoints")
+    ap.add_argument("--no-dedup", dest="dedup", action="store_false", help="extract exact duplicates (db/dedup.py) instead of reusing their twin's extraction, and skip recording aliases")
+    ap.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT","0")), help="serve Prometheus metrics on this port (0 = off)")
+    ap.add_argument("--metrics-file", default=os.getenv("METRICS_FILE"), help="rewrite metrics exposition to this file after every document")
+    ap.add_argument("--learnings-refresh", type=float, default=float(os.getenv("LEARNINGS_REFRESH_S","60")), help="seconds between incremental learning_memory refreshes")
     args = ap.parse_args()
     asyncio.run(main_async(args))
 
@@ -1,23 +1,26 @@
 
 #!/usr/bin/env python3
-import os, json, argparse, tempfile, sys, shutil, subprocess
+import os, json, argparse, tempfile, sys, shutil
 from pathlib import Path
 from dotenv import load_dotenv
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from db.db import fetch_docs, latest_extraction
+from qa.score_final_vs_golden import score, load_golds, write_metrics, field_accuracy, SCORER_VERSION
 
 def export_db_preds(filter_sql, out_root):
     tmp = Path(out_root) / "pred_export"
     if tmp.exists(): shutil.rmtree(tmp)
     tmp.mkdir(parents=True, exist_ok=True)
     rows = fetch_docs(filter_sql=filter_sql, limit=100000, offset=0)
+    preds = {}
     for r in rows:
         last = latest_extraction(r["id"])
         if not last or last.get("status") != "DONE": continue
         stem = r["stem"] or str(r["id"])
         d = tmp / stem; d.mkdir(parents=True, exist_ok=True)
-        (d / "final_extraction.json").write_text(json.dumps(last.get("final_json") or {}, ensure_ascii=False, indent=2), encoding="utf-8")
-    return str(tmp)
+        preds[stem] = last.get("final_json") or {}
+        (d / "final_extraction.json").write_text(json.dumps(preds[stem], ensure_ascii=False, indent=2), encoding="utf-8")
+    return str(tmp), preds
 
 def main():
     load_dotenv()
@@ -32,20 +35,29 @@ def main():
     args=ap.parse_args()
 
     Path(args.out).mkdir(parents=True, exist_ok=True)
-    pred_root = export_db_preds(args.filter, args.out)
+    pred_root, preds = export_db_preds(args.filter, args.out)
     metrics_dir = os.path.join(args.out, "metrics")
-    subprocess.check_call(['python','src/qa/score_final_vs_golden.py','--pred-root',pred_root,'--gold-root',args.gold_root,'--out',metrics_dir])
+    result = score(preds, load_golds(args.gold_root))
+    write_metrics(result, metrics_dir)
 
-    summary = json.load(open(os.path.join(metrics_dir,'metrics_summary.json'),'r',encoding='utf-8'))
+    summary = dict(result['summary'], fields=field_accuracy(result))
     base_dir='metrics/baselines'; Path(base_dir).mkdir(parents=True, exist_ok=True)
     base_path=os.path.join(base_dir,'latest.json'); baseline=json.load(open(base_path,'r',encoding='utf-8')) if os.path.exists(base_path) else None
+    if baseline and baseline.get('scorer_version') != SCORER_VERSION: baseline=None  # not comparable across scorer versions
 
     gate={'coverage_ok': summary['coverage_pct']>=args.coverage_thresh, 'accuracy_ok': summary['accuracy_pct']>=args.accuracy_thresh}
-    regression_ok=True
+    regression_ok=True; field_regressions={}
     if baseline:
         regression_ok = (baseline['accuracy_pct'] - summary['accuracy_pct']) <= args.max_field_regression
+        for field, base_acc in (baseline.get('fields') or {}).items():
+            acc = summary['fields'].get(field)
+            if acc is not None and base_acc - acc > args.max_field_regression: field_regressions[field] = {'baseline': base_acc, 'current': acc}
+        regression_ok = regression_ok and not field_regressions
     gate['regression_ok']=regression_ok
-    open(os.path.join(args.out,'report.md'),'w',encoding='utf-8').write(json.dumps({'summary':summary,'gate':gate,'baseline':baseline}, indent=2))
+    totals=lambda d: {k:v for k,v in d.items() if k!='fields'} if d else None
+    open(os.path.join(args.out,'report.md'),'w',encoding='utf-8').write(json.dumps({'summary':totals(summary),'gate':gate,'field_regressions':field_regressions,'baseline':totals(baseline)}, indent=2))
+    for field, r in sorted(field_regressions.items(), key=lambda kv: kv[1]['current']-kv[1]['baseline']):
+        print(f"  ↓ {field}: {r['baseline']}% -> {r['current']}%")
 
     if not baseline or (summary['accuracy_pct']>baseline['accuracy_pct']) or (summary['coverage_pct']>baseline['coverage_pct']):
         open(base_path,'w',encoding='utf-8').write(json.dumps(summary,indent=2))
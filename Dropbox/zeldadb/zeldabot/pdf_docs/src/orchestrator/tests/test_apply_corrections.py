@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""apply_corrections must apply each review finding once: a second run inserts nothing.
+Runs against the Postgres in db.DSN on session-local temp tables (which shadow the real ones); skipped without one."""
+import os, sys, json
+import pytest
+psycopg2 = pytest.importorskip('psycopg2')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from db.db import DSN
+from reviewer.apply_corrections import apply_corrections
+
+TEMP_SCHEMA = """
+CREATE TEMP TABLE documents (id text PRIMARY KEY, training_set boolean);
+CREATE TEMP TABLE review_findings (id text PRIMARY KEY, document_id text, suggested_corrections jsonb);
+CREATE TEMP TABLE extractions (document_id text, section_map jsonb, final_json jsonb, status text, message text,
+                               prompt_hash text, dpi int, created_at timestamptz DEFAULT clock_timestamp());
+CREATE TEMP TABLE learning_memory (lesson_type text, pattern jsonb, action jsonb, source_review_id text);
+"""
+
+@pytest.fixture
+def conn():
+    try:
+        c = psycopg2.connect(**DSN, connect_timeout=3)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f'no Postgres: {e}')
+    try:
+        with c.cursor() as cur:
+            cur.execute(TEMP_SCHEMA)
+            cur.execute("INSERT INTO documents VALUES ('d1', true), ('d2', true)")
+            cur.execute("""INSERT INTO extractions (document_id, section_map, final_json, status, prompt_hash, dpi)
+                           VALUES ('d1', '{}', '{"a": 1}', 'DONE', 'h', 200), ('d2', '{}', '{"a": 2}', 'DONE', 'h', 200)""")
+            cur.execute("""INSERT INTO review_findings VALUES ('r1', 'd1', '{"b": 1}'), ('r2', 'd1', '{"a": 9}'),
+                                                             ('r3', 'd2', '{"c": 3}')""")
+        c.commit()
+        yield c
+    finally:
+        c.close()
+
+def counts(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT (SELECT count(*) FROM extractions), (SELECT count(*) FROM learning_memory)")
+        return cur.fetchone()
+
+def latest(conn, doc_id):
+    with conn.cursor() as cur:
+        cur.execute("SELECT final_json FROM extractions WHERE document_id = %s ORDER BY created_at DESC LIMIT 1", (doc_id,))
+        return cur.fetchone()[0]
+
+def test_second_run_applies_nothing(conn):
+    assert apply_corrections(conn) == (3, 2)
+    assert counts(conn) == (4, 3) and latest(conn, 'd1') == {'a': 9, 'b': 1}
+    assert apply_corrections(conn) == (0, 0)
+    assert counts(conn) == (4, 3)
+
+def test_only_new_findings_are_applied(conn):
+    apply_corrections(conn)
+    with conn.cursor() as cur:
+        cur.execute("""INSERT INTO review_findings VALUES ('r4', 'd1', '{"d": 4}')""")
+    conn.commit()
+    assert apply_corrections(conn) == (1, 1)
+    assert counts(conn) == (5, 4) and latest(conn, 'd1') == {'a': 9, 'b': 1, 'd': 4}
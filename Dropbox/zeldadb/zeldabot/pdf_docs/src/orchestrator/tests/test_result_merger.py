@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""ResultMerger must give the same document, provenance and errors whatever order tasks complete in."""
+import os, sys, json, random, itertools
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from result_merger import ResultMerger
+
+def merged(adds, order, schemas=None):
+    m = ResultMerger(schemas)
+    for i in order: m.add(*adds[i])
+    return json.dumps([m.result(), m.provenance_table()['fields']], sort_keys=True, default=str)
+
+def assert_order_independent(adds, schemas=None):
+    outs = {merged(adds, p, schemas) for p in itertools.permutations(range(len(adds)))}
+    assert len(outs) == 1, outs
+    return json.loads(outs.pop())[0]
+
+def test_scalar_vs_object_keeps_lowest_slot():
+    out = assert_order_independent([(0, 't0', 'k', 1, 1, {'x': 5}), (1, 't1', 'k', 2, 2, {'x': {'a': 1}})])
+    assert out['x'] == 5 and 'type conflict at x' in out['errors'][0]['error']
+
+def test_lists_around_a_scalar():
+    out = assert_order_independent([(0, 't0', 'k', 1, 1, {'x': [1]}), (1, 't1', 'k', 2, 2, {'x': 's'}), (2, 't2', 'k', 3, 3, {'x': [2]})])
+    assert out['x'] == [1, 2] and len(out['errors']) == 1
+
+def test_late_lower_slot_restores_held_values():
+    adds = [(0, 't0', 'k', 1, 1, {'x': {'a': 1}}), (1, 't1', 'k', 2, 2, {'x': 's'}), (2, 't2', 'k', 3, 3, {'x': {'b': 2}, 'y': [2]}),
+            (3, 't3', 'k', 4, 4, {'y': [3]}), (4, 't4', 'k', 5, 5, {'y': [1]})]
+    out = assert_order_independent(adds)
+    assert out['x'] == {'a': 1, 'b': 2} and out['y'] == [2, 3, 1] and len(out['errors']) == 1
+    m = ResultMerger(); data = m.data
+    for i in (2, 1, 0): m.add(*adds[i])
+    assert m.data is data and m.provenance_table()['fields'] == {'x': 0, 'x.a': 0, 'x.b': 2, 'y': (2,)}
+
+def test_schema_lists_scalars_and_failures():
+    schemas = {'k': {'a': 'list', 'b': 'scalar', 'd': {'x': 'scalar'}}}
+    out = assert_order_independent([(0, 't0', 'k', 1, 1, {'a': [1, 1], 'b': 'zero', 'd': {'x': 0}}),
+                                    (1, 't1', 'k', 2, 2, {'a': '2', 'b': 'one'}),
+                                    (2, 't2', 'k', 3, 3, {'a': [3], 'b': None, 'd': {'x': 2}}),
+                                    (3, 't3', 'k', 4, 4, {'error': 'boom'}), (4, 't4', 'k', 4, 4, {'error': 'bang'})], schemas)
+    assert out == {'a': [1, 1, '2', 3], 'b': 'one', 'd': {'x': 2},
+                   'errors': [{'task': 't3', 'prompt_key': 'k', 'pages': [4, 4], 'error': 'boom'},
+                              {'task': 't4', 'prompt_key': 'k', 'pages': [4, 4], 'error': 'bang'}]}
+
+def test_random_mixed_types():
+    rng = random.Random(7)
+    def value(depth=0):
+        r = rng.random()
+        if depth < 2 and r < 0.3: return {rng.choice('xyz'): value(depth + 1) for _ in range(2)}
+        if r < 0.5: return [rng.randint(0, 9) for _ in range(rng.randint(0, 2))]
+        return rng.choice([None, '', 0, 1, 's', {}, []])
+    for _ in range(200):
+        adds = [(s, f't{s}', 'k', s, s, {rng.choice('abc'): value() for _ in range(2)}) for s in range(4)]
+        assert_order_independent(adds)
+
+if __name__ == '__main__':
+    for name, fn in list(globals().items()):
+        if name.startswith('test_'): fn(); print(f'✅ {name}')
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import os, sys, argparse, json, csv
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from db.db import get_conn
+
+METRICS = ['request_s','wall_s','prompt_tokens','completion_tokens','image_bytes','pixels','pages_rendered','requests','failed_requests','retries']
+
+# Latest usage row per document (a re-run supersedes earlier accounting)
+LATEST = """SELECT DISTINCT ON (u.document_id) u.*, d.stem FROM extraction_usage u
+            LEFT JOIN documents d ON d.id::text = u.document_id
+            WHERE u.created_at >= now() - make_interval(days => %s)
+            ORDER BY u.document_id, u.created_at DESC"""
+
+# Section counters are numeric: a packed request is shared between its prompt keys in fractions
+SECTIONS = f"""SELECT s.key AS section, count(*) AS docs,
+                   round(sum((s.value->>'requests')::numeric), 2)::float AS requests, round(sum((s.value->>'failed_requests')::numeric), 2)::float AS failed_requests,
+                   sum((s.value->>'request_s')::float) AS request_s, sum((s.value->>'prompt_tokens')::numeric)::bigint AS prompt_tokens,
+                   sum((s.value->>'completion_tokens')::numeric)::bigint AS completion_tokens, sum((s.value->>'image_bytes')::numeric)::bigint AS image_bytes
+               FROM ({LATEST}) u, jsonb_each(u.sections) s GROUP BY s.key"""
+
+def fetch(days):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(LATEST, (days,)); cols = [c.name for c in cur.description]
+            docs = [dict(zip(cols, r)) for r in cur.fetchall()]
+            cur.execute(SECTIONS, (days,)); cols = [c.name for c in cur.description]
+            sections = [dict(zip(cols, r)) for r in cur.fetchall()]
+    return docs, sections
+
+def tail_share(values, frac):
+    """Share of the total contributed by the most expensive `frac` of items."""
+    v = sorted((x or 0 for x in values), reverse=True); total = sum(v)
+    k = max(1, int(round(len(v) * frac))) if v else 0
+    return round(sum(v[:k]) / total * 100, 1) if total else 0.0
+
+def report(docs, sections, by='request_s', top=20):
+    docs = sorted(docs, key=lambda d: d.get(by) or 0, reverse=True)
+    sections = sorted(sections, key=lambda s: s.get(by) or 0, reverse=True) if sections and by in sections[0] else sections
+    totals = {m: sum(d.get(m) or 0 for d in docs) for m in METRICS}
+    return {'docs': len(docs), 'by': by, 'totals': totals,
+            'tail_share_pct': {f'top_{int(f*100)}pct': tail_share([d.get(by) for d in docs], f) for f in (0.01, 0.05, 0.10)},
+            'top_docs': docs[:top], 'sections': sections}
+
+def main():
+    ap = argparse.ArgumentParser(description='Rank documents and sections by recorded extraction cost')
+    ap.add_argument('--by', choices=METRICS, default='request_s', help='cost metric to rank on (GPU time ~ request_s)')
+    ap.add_argument('--top', type=int, default=20); ap.add_argument('--days', type=int, default=30)
+    ap.add_argument('--csv', help='write the full per-document ranking to this CSV')
+    ap.add_argument('--json', action='store_true', help='print the report as JSON')
+    a = ap.parse_args()
+    docs, sections = fetch(a.days); r = report(docs, sections, a.by, a.top)
+    if a.csv:
+        cols = ['document_id','stem','status','pages'] + METRICS
+        with open(a.csv, 'w', newline='', encoding='utf-8') as f:
+            w = csv.writer(f); w.writerow(cols); [w.writerow([d.get(c) for c in cols]) for d in sorted(docs, key=lambda d: d.get(a.by) or 0, reverse=True)]
+    if a.json:
+        print(json.dumps({**r, 'top_docs': [{k: v for k, v in d.items() if k != 'sections'} for d in r['top_docs']]}, indent=2, default=str)); return
+    print(f"📊 {r['docs']} documents over {a.days}d, ranked by {a.by} (total {r['totals'][a.by]:.1f})")
+    print('   tail share: ' + ', '.join(f'{k}={v}%' for k, v in r['tail_share_pct'].items()))
+    print(f"\n{'document':<40} {'pages':>5} {'req_s':>9} {'prompt_tok':>11} {'compl_tok':>10} {'img_MB':>8} {'retries':>7}")
+    for d in r['top_docs']:
+        print(f"{str(d.get('stem') or d['document_id'])[:40]:<40} {d.get('pages') or 0:>5} {d.get('request_s') or 0:>9.1f} "
+              f"{d.get('prompt_tokens') or 0:>11} {d.get('completion_tokens') or 0:>10} {(d.get('image_bytes') or 0)/1e6:>8.1f} {d.get('retries') or 0:>7}")
+    print(f"\n{'section':<32} {'docs':>6} {'requests':>8} {'failed':>6} {'req_s':>9} {'prompt_tok':>11} {'img_MB':>8}")
+    for s in r['sections']:
+        print(f"{s['section'][:32]:<32} {s['docs']:>6} {s['requests'] or 0:>8g} {s['failed_requests'] or 0:>6g} {s['request_s'] or 0:>9.1f} "
+              f"{s['prompt_tokens'] or 0:>11} {(s['image_bytes'] or 0)/1e6:>8.1f}")
+
+if __name__ == '__main__': main()
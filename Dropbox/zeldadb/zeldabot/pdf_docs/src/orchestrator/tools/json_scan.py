@@ -0,0 +1,40 @@
+
+#!/usr/bin/env python3
+"""Find JSON objects embedded in prompt text (shared by prompt_linter and prompt_optimizer)."""
+import json, argparse
+_DECODER = json.JSONDecoder()
+_WS = ' \t\n\r'
+
+def iter_json_objects(text):
+    """Yield (start, end, obj) for each top-level JSON object in text, left to right.
+
+    Single pass: each '{' is tried at most once with raw_decode, which matches braces while it
+    parses, and a decoded object's span is skipped. Braces that cannot open an object (next
+    non-space char is not '"' or '}') are rejected without parsing."""
+    pos = 0; n = len(text)
+    while True:
+        start = text.find('{', pos)
+        if start < 0: return
+        j = start + 1
+        while j < n and text[j] in _WS: j += 1
+        if j < n and text[j] in '"}':
+            try:
+                obj, end = _DECODER.raw_decode(text, start)
+                yield start, end, obj; pos = end; continue
+            except ValueError:
+                pass
+        pos = start + 1
+
+def find_json_objects(text):
+    return list(iter_json_objects(text))
+
+def first_json(text):
+    """(start, end, obj) of the first embedded JSON object, or None."""
+    return next(iter_json_objects(text), None)
+
+def main():
+    ap = argparse.ArgumentParser(description='List JSON objects embedded in a prompt/template file')
+    ap.add_argument('path'); a = ap.parse_args()
+    for s, e, obj in iter_json_objects(open(a.path, 'r', encoding='utf-8').read()):
+        print(f'{s}-{e}: {json.dumps(obj, ensure_ascii=False)[:200]}')
+if __name__ == '__main__': main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""JSON request bodies with base64 images spliced in as bytes.
+
+Images are base64-encoded once, straight to bytes (binascii), and wrapped in Blob. dumps()
+serializes the envelope with orjson (stdlib json if it is not installed), with a short
+placeholder where each Blob goes. The base64 bytes are then joined into that output in one
+pass. Base64 and data-URL prefixes need no JSON escaping, so image data is never turned into
+a Python str, re-scanned by the JSON encoder or re-encoded to UTF-8. Send the result with
+data=body, headers=JSON_HEADERS."""
+import re, json, binascii
+from typing import Any, List, Union
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback; same output, slower envelope
+    orjson = None
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+# U+E000 (private use) brackets the placeholder index; orjson and ensure_ascii=False emit it as raw UTF-8
+_MARK = '\ue000'
+_SPLIT = re.compile(re.escape(_MARK.encode('utf-8')) + rb'(\d+)' + re.escape(_MARK.encode('utf-8')))
+
+def encode_image(raw: bytes) -> bytes:
+    """Base64 of an encoded image, as ASCII bytes."""
+    return binascii.b2a_base64(raw, newline=False)
+
+class Blob:
+    """Base64 image data (optionally behind a prefix such as a data: URL) standing in for a JSON string."""
+    __slots__ = ('b64', 'prefix')
+    def __init__(self, b64: Union[bytes, str], prefix: bytes = b''):
+        self.b64 = b64.encode('ascii') if isinstance(b64, str) else b64; self.prefix = prefix
+    def __len__(self) -> int:
+        return len(self.b64)
+
+def data_url(b64: Union[bytes, str], mime: str = 'image/jpeg') -> Blob:
+    """OpenAI-style image_url.url value."""
+    return Blob(b64, f'data:{mime};base64,'.encode('ascii'))
+
+def _envelope(obj: Any, blobs: List[Blob]) -> Any:
+    if isinstance(obj, Blob):
+        blobs.append(obj); return f'{_MARK}{len(blobs) - 1}{_MARK}'
+    if isinstance(obj, dict): return {k: _envelope(v, blobs) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)): return [_envelope(v, blobs) for v in obj]
+    return obj
+
+def dumps(payload: Any) -> bytes:
+    """Serialize payload (dicts/lists/scalars/Blobs) to a JSON request body."""
+    blobs: List[Blob] = []
+    env = _envelope(payload, blobs)
+    head = orjson.dumps(env) if orjson is not None else json.dumps(env, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if not blobs: return head
+    parts = _SPLIT.split(head)  # text, index, text, index, ..., text
+    out = []
+    for i, piece in enumerate(parts):
+        if i % 2 == 0: out.append(piece)
+        else:
+            blob = blobs[int(piece)]
+            if blob.prefix: out.append(blob.prefix)
+            out.append(blob.b64)
+    return b''.join(out)
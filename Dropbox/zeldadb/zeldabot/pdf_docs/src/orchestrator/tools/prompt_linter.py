@@ -1,24 +1,25 @@
 
 #!/usr/bin/env python3
-import os, json, argparse
+import os, json, argparse, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from tools.json_scan import first_json
 REQUIRED='Respond ONLY with a SINGLE minified JSON object'
 def last_json(text):
-    opens=[i for i,ch in enumerate(text) if ch=='{']; closes=[i for i,ch in enumerate(text) if ch=='}']
-    best=None
-    for i in opens:
-        for j in reversed(closes):
-            if j>i:
-                cand=text[i:j+1]
-                try: json.loads(cand); best=cand; break
-                except: pass
-        if best: break
-    return best
+    m=first_json(text)
+    return text[m[0]:m[1]] if m else None
+def lint(text):
+    return REQUIRED in text and first_json(text) is not None
 def main():
     ap=argparse.ArgumentParser(description='Prompt linter')
-    ap.add_argument('--prompts',required=True); a=ap.parse_args()
-    repo=json.load(open(a.prompts,'r',encoding='utf-8')); errs=0
-    for k,v in repo.items():
-        if REQUIRED not in v or last_json(v) is None:
-            errs+=1; print(f'❌ {k}: missing required directive or JSON example not parseable')
+    ap.add_argument('--prompts',required=True,nargs='+'); a=ap.parse_args(); errs=0
+    for path in a.prompts:
+        repo=json.load(open(path,'r',encoding='utf-8')); base=os.path.dirname(os.path.dirname(os.path.abspath(path))); templates={}
+        for k,v in repo.items():
+            if isinstance(v,dict) and 'template_path' in v:
+                tp=os.path.join(base,v['template_path'])
+                if tp not in templates: templates[tp]=open(tp,'r',encoding='utf-8').read() if os.path.exists(tp) else ''
+                v=templates[tp]
+            if not lint(str(v)):
+                errs+=1; print(f'❌ {k}: missing required directive or JSON example not parseable')
     print('✅ All prompts passed.' if errs==0 else f'❌ {errs} prompt(s) need attention.')
 if __name__=='__main__': main()
@@ -1,16 +1,126 @@
 
 #!/usr/bin/env python3
-import json, argparse, os
-from jsonschema import Draft202012Validator
-SCHEMA_PATH=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'schemas','final_extraction.schema.json')
+import json, argparse, os, re, sys, glob, itertools
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+try:
+    from jsonschema import Draft202012Validator
+except ImportError:
+    Draft202012Validator = None
+SCHEMA_PATH=os.environ.get('FINAL_SCHEMA_PATH') or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'schemas','final_extraction.schema.json')
+
+def _path(parts, fold=True):
+    """JSON path; with fold, list indices become [] so errors aggregate across items (same form as the scorer's fields)."""
+    out=''
+    for p in parts: out += ('[]' if fold else f'[{p}]') if isinstance(p, int) else (f'.{p}' if out else str(p))
+    return out or '<root>'
+
+class SchemaValidator:
+    """A schema compiled once. fastjsonschema (when installed) answers valid/invalid; jsonschema
+    is only consulted to list every error of a document that failed."""
+    def __init__(self, schema):
+        self.schema=schema
+        self._fast=None
+        if fastjsonschema:
+            try: self._fast=fastjsonschema.compile(schema)
+            except fastjsonschema.JsonSchemaDefinitionException: pass  # drafts/keywords it cannot compile
+        self._full=Draft202012Validator(schema) if Draft202012Validator else None
+        if not (self._fast or self._full): raise ImportError('fastjsonschema or jsonschema is required')
+
+    def errors(self, doc, fold=True):
+        """[(path, message)] for doc; empty when it validates."""
+        if self._fast:
+            try: self._fast(doc); return []
+            except fastjsonschema.JsonSchemaValueException as e:
+                if not self._full: return [(_path(_name_parts(e.name), fold), e.message)]
+        return [(_path(e.path, fold), e.message) for e in sorted(self._full.iter_errors(doc), key=lambda e: list(map(str, e.path)))]
+
+def _name_parts(name):
+    # fastjsonschema names the failing value 'data.items[0].x'
+    return [int(i) if i else k for i, k in re.findall(r'\[(\d+)\]|\.([^.\[]+)', name[len('data'):])]
+
+_VALIDATORS = {}
+
+def get_validator(schema_path=SCHEMA_PATH):
+    """Compiled validator for schema_path, cached per process; None if the schema file does not exist."""
+    key=os.path.abspath(schema_path)
+    if key not in _VALIDATORS:
+        _VALIDATORS[key]=SchemaValidator(json.load(open(key,'r',encoding='utf-8'))) if os.path.exists(key) else None
+    return _VALIDATORS[key]
+
+def schema_errors(doc, schema_path=SCHEMA_PATH):
+    v=get_validator(schema_path)
+    return v.errors(doc) if v else []
+
+# ---- bulk validation ----
+_WORKER_SCHEMA = None
+def _init_worker(schema_path):
+    global _WORKER_SCHEMA
+    _WORKER_SCHEMA=schema_path; get_validator(schema_path)
+
+def _validate_item(item):
+    key, doc = item
+    if isinstance(doc, (str, bytes)): doc=json.loads(doc)
+    return key, get_validator(_WORKER_SCHEMA).errors(doc)
+
+def iter_dir(root):
+    """(name, json text) for every final_extraction.json under root, or every *.json directly in it."""
+    paths=glob.glob(os.path.join(root,'**','final_extraction.json'), recursive=True) or glob.glob(os.path.join(root,'*.json'))
+    for p in sorted(paths): yield os.path.relpath(p, root), open(p,'r',encoding='utf-8').read()
+
+LATEST_SQL = """SELECT DISTINCT ON (document_id) document_id, final_json FROM extractions
+                WHERE status = 'DONE' ORDER BY document_id, created_at DESC"""
+
+def iter_db(fetch_size=500):
+    """(document_id, final_json) of every document's latest DONE extraction, streamed."""
+    from db.db import get_conn
+    with get_conn() as conn, conn.cursor(name='validate_output') as cur:
+        cur.itersize=fetch_size; cur.execute(LATEST_SQL)
+        for did, fj in cur: yield str(did), fj if fj is not None else {}
+
+def validate_bulk(items, schema_path=SCHEMA_PATH, workers=None, chunksize=64):
+    """Validate (key, doc) pairs in a process pool; each worker compiles the schema once.
+
+    Returns {'docs', 'invalid', 'paths': Counter(path -> error count), 'failed': {key: [(path, message)]}}."""
+    if get_validator(schema_path) is None: raise FileNotFoundError(schema_path)
+    workers=workers or min(os.cpu_count() or 1, 8)
+    res={'docs':0,'invalid':0,'paths':Counter(),'failed':{}}
+    def collect(results):
+        for key, errs in results:
+            res['docs']+=1
+            if errs:
+                res['invalid']+=1; res['failed'][key]=errs; res['paths'].update(p for p,_ in errs)
+    if workers>1:
+        items=iter(items); batch=workers*chunksize*4  # Executor.map submits eagerly; feed it in slices to bound memory
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(schema_path,)) as ex:
+            while chunk:=list(itertools.islice(items, batch)):
+                collect(ex.map(_validate_item, chunk, chunksize=chunksize))
+    else:
+        _init_worker(schema_path); collect(map(_validate_item, items))
+    return res
+
 def main():
-    p=argparse.ArgumentParser(description='Validate final_extraction.json against schema')
-    p.add_argument('--final',required=True); p.add_argument('--schema',default=SCHEMA_PATH)
-    a=p.parse_args(); schema=json.load(open(a.schema,'r',encoding='utf-8')); data=json.load(open(a.final,'r',encoding='utf-8'))
-    v=Draft202012Validator(schema); errs=sorted(v.iter_errors(data), key=lambda e: e.path)
-    if errs:
-        print('❌ Validation errors:')
-        for e in errs:
-            path='/'.join(str(x) for x in e.path) or '<root>'; print(f'- {path}: {e.message}'); exit(1)
-    print('✅ Validation passed.')
+    p=argparse.ArgumentParser(description='Validate final_extraction.json against schema (one file, a directory, or the latest extractions in the DB)')
+    src=p.add_mutually_exclusive_group(required=True)
+    src.add_argument('--final'); src.add_argument('--dir'); src.add_argument('--from-db', action='store_true')
+    p.add_argument('--schema',default=SCHEMA_PATH); p.add_argument('--workers',type=int,default=None); p.add_argument('--top',type=int,default=20)
+    a=p.parse_args()
+    if a.final:
+        v=get_validator(a.schema)
+        if v is None: print(f'❌ Schema not found: {a.schema}'); exit(2)
+        errs=v.errors(json.load(open(a.final,'r',encoding='utf-8')), fold=False)
+        if errs:
+            print('❌ Validation errors:')
+            for path, msg in errs: print(f'- {path}: {msg}')
+            exit(1)
+        print('✅ Validation passed.'); return
+    res=validate_bulk(iter_db() if a.from_db else iter_dir(a.dir), a.schema, a.workers)
+    print(f"{'✅' if not res['invalid'] else '❌'} {res['docs']-res['invalid']}/{res['docs']} documents valid")
+    for path, n in res['paths'].most_common(a.top): print(f'  {n:6d}  {path}')
+    if res['invalid']: exit(1)
 if __name__=='__main__': main()
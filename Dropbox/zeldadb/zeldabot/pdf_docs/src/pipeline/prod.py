@@ -6,11 +6,21 @@ Real implementation with twin agents, receipts, coaching, and acceptance gates.
 import os
 import sys
 import json
+import time
+import queue
+import hashlib
 import psycopg2
+import psycopg2.pool
 import tempfile
 import asyncio
+import threading
+import traceback
+import multiprocessing as mp
+import aiohttp
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 # Add paths for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -18,25 +28,86 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "orchestrator"))
 
 from utils.receipt_logger import ReceiptLogger
 from utils.coaching_system import CoachingSystem
-from utils.acceptance_tests import run_acceptance_gates
+from utils.acceptance_tests import GateEngine, load_expectations, CANARY_GATES
 from agents.qwen_agent import QwenAgent
 from agents.gemini_agent import GeminiAgent
 
 # Import orchestrator components
 try:
-    from agent_orchestrator import OrchestratorAgent, load_prompts
+    from agent_orchestrator import OrchestratorAgent, get_registry, make_limiter
     from agent_sectionizer import SectionizerAgent
+    from validators.validate_output import schema_errors
+    import metrics
     ORCHESTRATOR_AVAILABLE = True
     ORCHESTRATOR_ACTIVE = False  # Temporarily disabled for smoke test
 except ImportError as e:
     print(f"❌ CRITICAL: Orchestrator import failed: {e}")
     sys.exit(1)
 
-# Import constants from acceptance_tests module
-from utils.acceptance_tests import CANARY_GATES, TOLERANCE_PERCENT, TOLERANCE_SEK
+# Per-document expectations (.json/.csv/'db'); without them every document is gated against the Sjöstaden 2 canary
+ACCEPTANCE_EXPECTATIONS = os.environ.get("ACCEPTANCE_EXPECTATIONS")
+
+_COACHING = None
+_POOL = None
+
+def _coaching():
+    """Coaching memory applied to prompts at build time, when COACHING_MEMORY points at an NDJSON file"""
+    global _COACHING
+    if _COACHING is None and os.environ.get("COACHING_MEMORY"):
+        _COACHING = CoachingSystem(os.environ["COACHING_MEMORY"])
+    return _COACHING
+
+# Corpus size without scanning the blob table: planner estimate, floored by an exact count capped at 100
+# (the threshold), so a never-analyzed table (reltuples -1/0) still passes when it really has the rows
+CORPUS_SIZE_SQL = """
+    SELECT GREATEST(c.reltuples::bigint, (SELECT count(*) FROM (SELECT 1 FROM arsredovisning_documents LIMIT 100) t))
+    FROM pg_class c WHERE c.oid = 'arsredovisning_documents'::regclass
+"""
+PREFLIGHT_TTL_S = int(os.environ.get("PREFLIGHT_TTL_S", "300"))
+PREFLIGHT_CACHE = os.environ.get("PREFLIGHT_CACHE", "artifacts/.preflight_cache.json")
+REGISTRY_PATH = Path(__file__).parent.parent.parent / "prompts" / "registry.json"
+
+def _check_corpus(database_url: str):
+    try:
+        with psycopg2.connect(database_url, connect_timeout=10) as conn, conn.cursor() as cursor:
+            cursor.execute(CORPUS_SIZE_SQL)
+            doc_count = cursor.fetchone()[0]
+        conn.close()
+    except Exception as e:
+        return False, f"❌ Database check failed: {e}"
+    if doc_count < 100:
+        return False, f"❌ Expected ≥100 docs in production DB, found: {doc_count}"
+    return True, f"✅ Document corpus: ~{doc_count} docs"
+
+def _check_orchestrator():
+    if not ORCHESTRATOR_AVAILABLE:
+        return False, "❌ Orchestrator not available"
+    return True, "✅ Orchestrator active" if ORCHESTRATOR_ACTIVE else "⚠️  Orchestrator available but using fallback mode"
+
+def _check_prompts():
+    if not REGISTRY_PATH.exists():
+        return False, "❌ Prompts registry missing"
+    try:
+        registry = get_registry(str(REGISTRY_PATH), coaching=_coaching())
+        prompts = registry.prompts
+        if registry.problems:
+            return False, f"❌ Prompts registry problems: {registry.problems}"
+        if len(prompts) < 7:
+            return False, f"❌ Expected ≥7 prompts in registry, found: {len(prompts)}"
+        return True, f"✅ Prompts registry: {len(prompts)} prompts loaded"
+    except Exception as e:
+        return False, f"❌ Prompts registry check failed: {e}"
+
+def _preflight_key(database_url: str) -> str:
+    """What a cached pass depends on: the DB, the registry and its templates (by mtime), coaching memory"""
+    files = [REGISTRY_PATH, *sorted((REGISTRY_PATH.parent / "sections").glob("*"))]
+    if os.environ.get("COACHING_MEMORY"): files.append(Path(os.environ["COACHING_MEMORY"]))
+    stamp = [(str(f), f.stat().st_mtime_ns) for f in files if f.exists()]
+    return hashlib.sha256(json.dumps([database_url, ORCHESTRATOR_ACTIVE, stamp]).encode()).hexdigest()
 
 def preflight():
-    """Hard preflight checks - exits non-zero if invariants fail"""
+    """Hard preflight checks - exits non-zero if invariants fail.
+    DB, orchestrator and prompt checks run concurrently; a pass is cached for PREFLIGHT_TTL_S seconds (0 = off)."""
     print("🔍 PRODUCTION PREFLIGHT CHECKS")
     
     # Check environment
@@ -51,69 +122,63 @@ def preflight():
         print("❌ Faux/local DB detected. Production must use H100 DB only")
         sys.exit(1)
     
-    # Check document count
-    try:
-        conn = psycopg2.connect(database_url)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM arsredovisning_documents;")
-        doc_count = cursor.fetchone()[0]
-        conn.close()
-        
-        if doc_count < 100:
-            print(f"❌ Expected ≥100 docs in production DB, found: {doc_count}")
-            sys.exit(1)
-        print(f"✅ Document corpus: {doc_count} docs")
-        
-    except Exception as e:
-        print(f"❌ Database check failed: {e}")
-        sys.exit(1)
-    
-    # Check orchestrator
-    if not ORCHESTRATOR_AVAILABLE:
-        print("❌ Orchestrator not available")
-        sys.exit(1)
-    if ORCHESTRATOR_ACTIVE:
-        print("✅ Orchestrator active")
-    else:
-        print("⚠️  Orchestrator available but using fallback mode")
+    key = _preflight_key(database_url)
+    if PREFLIGHT_TTL_S > 0:
+        try:
+            with open(PREFLIGHT_CACHE) as f:
+                cached = json.load(f)
+            age = time.time() - cached["at"]
+            if cached["key"] == key and 0 <= age < PREFLIGHT_TTL_S:
+                print(f"✅ Preflight passed {age:.0f}s ago (cached, TTL {PREFLIGHT_TTL_S}s)")
+                return
+        except (OSError, ValueError, KeyError):
+            pass
     
-    # Check prompts registry
-    registry_path = Path(__file__).parent.parent.parent / "prompts" / "registry.json"
-    if not registry_path.exists():
-        print("❌ Prompts registry missing")
-        sys.exit(1)
-    
-    try:
-        prompts = load_prompts(str(registry_path))
-        if len(prompts) < 7:
-            print(f"❌ Expected ≥7 prompts in registry, found: {len(prompts)}")
-            sys.exit(1)
-        print(f"✅ Prompts registry: {len(prompts)} prompts loaded")
-    except Exception as e:
-        print(f"❌ Prompts registry check failed: {e}")
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(_check_corpus, database_url), pool.submit(_check_orchestrator), pool.submit(_check_prompts)]
+        checks = [f.result() for f in futures]
+    for _, message in checks:
+        print(message)
+    if not all(ok for ok, _ in checks):
         sys.exit(1)
     
+    if PREFLIGHT_TTL_S > 0:
+        os.makedirs(os.path.dirname(PREFLIGHT_CACHE) or ".", exist_ok=True)
+        tmp = f"{PREFLIGHT_CACHE}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"key": key, "at": time.time()}, f)
+        os.replace(tmp, PREFLIGHT_CACHE)
     print("✅ All preflight checks passed")
 
-def fetch_docs_from_db(limit: int) -> List[Dict]:
-    """Fetch documents from H100 database"""
-    conn = psycopg2.connect(os.environ["DATABASE_URL"])
-    cursor = conn.cursor()
-    
-    query = """
-        SELECT id, filename, pdf_binary
-        FROM arsredovisning_documents
-        WHERE pdf_binary IS NOT NULL
-          AND processing_status LIKE '%complete%'
-        ORDER BY created_at DESC
-        LIMIT %s
-    """
-    cursor.execute(query.replace('%s', str(int(limit))))
-    
-    rows = cursor.fetchall()
-    conn.close()
-    
-    return [{"id": row[0], "filename": row[1], "pdf_binary": row[2]} for row in rows]
+@contextmanager
+def _conn():
+    """Connection from this process's pool (created lazily, so each worker process gets its own)"""
+    global _POOL
+    if _POOL is None:
+        _POOL = psycopg2.pool.ThreadedConnectionPool(1, int(os.environ.get("PROD_DB_POOL_MAX", "4")), os.environ["DATABASE_URL"])
+    conn = _POOL.getconn()
+    try:
+        yield conn
+    finally:
+        _POOL.putconn(conn)
+
+def fetch_doc_ids(limit: int) -> List[int]:
+    """Ids of the newest `limit` completed documents that have a stored PDF, newest first (PDFs are fetched per id by fetch_doc)"""
+    with _conn() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT id FROM arsredovisning_documents
+            WHERE pdf_binary IS NOT NULL
+              AND processing_status LIKE '%%complete%%'
+            ORDER BY created_at DESC
+            LIMIT %s
+        """, (int(limit),))
+        return [row[0] for row in cursor.fetchall()]
+
+def fetch_doc(doc_id: int) -> Optional[Dict]:
+    with _conn() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT id, filename, pdf_binary FROM arsredovisning_documents WHERE id = %s", (doc_id,))
+        row = cursor.fetchone()
+    return {"id": row[0], "filename": row[1], "pdf_binary": bytes(row[2])} if row else None
 
 def materialize_pdf(pdf_binary: bytes) -> str:
     """Create temporary PDF file from binary data"""
@@ -123,6 +188,11 @@ def materialize_pdf(pdf_binary: bytes) -> str:
 
 def validate_and_schema_enforce(results: Dict[str, Any]) -> Dict[str, Any]:
     """Validate extraction results against schema"""
+    # Full schema check against the compiled final_extraction schema (compiled once per process; skipped if absent)
+    errors = schema_errors(results)
+    if errors:
+        print(f"⚠️  Schema: {len(errors)} error(s), e.g. " + "; ".join(f"{p}: {m}" for p, m in errors[:3]))
+
     # Basic schema validation - ensure key sections exist
     expected_sections = ["balance_sheet", "income_statement", "brf_info"]
     validated = {}
@@ -135,44 +205,6 @@ def validate_and_schema_enforce(results: Dict[str, Any]) -> Dict[str, Any]:
     
     return validated
 
-def run_acceptance_gates(results: Dict[str, Any]) -> Dict[str, Any]:
-    """Run acceptance gates against Sjöstaden 2 canaries"""
-    gates_status = {"gates_passed": True, "failures": []}
-    
-    # Check financial values
-    if "balance_sheet" in results:
-        bs = results["balance_sheet"]
-        
-        # Assets check
-        actual_assets = bs.get("total_assets", 0)
-        if abs(actual_assets - CANARY_GATES["total_assets"]) / CANARY_GATES["total_assets"] > TOLERANCE_PERCENT:
-            gates_status["failures"].append(f"Assets: expected {CANARY_GATES['total_assets']}, got {actual_assets}")
-            gates_status["gates_passed"] = False
-        
-        # Debt check
-        actual_debt = bs.get("loans", 0) or bs.get("total_debt", 0)
-        if abs(actual_debt - CANARY_GATES["total_debt"]) / CANARY_GATES["total_debt"] > TOLERANCE_PERCENT:
-            gates_status["failures"].append(f"Total debt: expected {CANARY_GATES['total_debt']}, got {actual_debt}")
-            gates_status["gates_passed"] = False
-    
-    # Check cash flow
-    if "cash_flow" in results:
-        cf = results["cash_flow"]
-        actual_cash = cf.get("cash_closing", 0)
-        if abs(actual_cash - CANARY_GATES["cash_closing"]) / CANARY_GATES["cash_closing"] > TOLERANCE_PERCENT:
-            gates_status["failures"].append(f"Cash: expected {CANARY_GATES['cash_closing']}, got {actual_cash}")
-            gates_status["gates_passed"] = False
-    
-    # Check org info
-    if "brf_info" in results:
-        brf = results["brf_info"]
-        org_no = str(brf.get("organization_number", ""))
-        if CANARY_GATES["org_number"] not in org_no:
-            gates_status["failures"].append(f"Org no: expected {CANARY_GATES['org_number']}, got {org_no}")
-            gates_status["gates_passed"] = False
-    
-    return gates_status
-
 def coach_if_needed(results: Dict[str, Any], gates: Dict[str, Any]):
     """Apply coaching if gates fail"""
     if not gates["gates_passed"]:
@@ -183,28 +215,25 @@ def coach_if_needed(results: Dict[str, Any], gates: Dict[str, Any]):
 
 def write_results_and_receipts(doc_id: int, results: Dict[str, Any], gates: Dict[str, Any], run_id: str):
     """Write results to database and receipts to files"""
-    conn = psycopg2.connect(os.environ["DATABASE_URL"])
-    cursor = conn.cursor()
-    
-    # Update document with results
-    cursor.execute("""
-        UPDATE arsredovisning_documents 
-        SET extraction_data = %s,
-            processing_status = %s,
-            extraction_completed_at = NOW()
-        WHERE id = %s
-    """, (
-        json.dumps(results), 
-        "extracted_prod" if gates["gates_passed"] else "extracted_gates_failed",
-        doc_id
-    ))
-    
-    conn.commit()
-    conn.close()
+    with _conn() as conn:
+        with conn.cursor() as cursor:
+            # Update document with results
+            cursor.execute("""
+                UPDATE arsredovisning_documents 
+                SET extraction_data = %s,
+                    processing_status = %s,
+                    extraction_completed_at = NOW()
+                WHERE id = %s
+            """, (
+                json.dumps(results), 
+                "extracted_prod" if gates["gates_passed"] else "extracted_gates_failed",
+                doc_id
+            ))
+        conn.commit()
     
-    # Write acceptance results
+    # Write acceptance results (one file per document; workers share the run directory)
     os.makedirs(f"artifacts/acceptance/{run_id}", exist_ok=True)
-    with open(f"artifacts/acceptance/{run_id}/summary.json", "w") as f:
+    with open(f"artifacts/acceptance/{run_id}/summary_{doc_id}.json", "w") as f:
         json.dump({
             "run_id": run_id,
             "doc_id": doc_id,
@@ -213,106 +242,226 @@ def write_results_and_receipts(doc_id: int, results: Dict[str, Any], gates: Dict
             "results_sections": list(results.keys())
         }, f, indent=2)
 
-def run_from_db(run_id: str, limit: int = 1) -> int:
+async def process_document(doc: Dict, registry, gate_engine, logger, run_id: str, session=None, limiter=None) -> Dict[str, Any]:
+    """Sectionize, extract, gate and store one document -> outcome record (never raises).
+    VLM requests go through the worker's shared session/limiter when given."""
+    doc_id, filename, pdf_binary = doc["id"], doc["filename"], doc["pdf_binary"]
+    print(f"🔍 Processing: {filename}")
+    outcome = {"doc_id": doc_id, "filename": filename, "worker": os.getpid(), "status": "error", "failures": []}
+    t0 = time.perf_counter()
+    pdf_path = materialize_pdf(pdf_binary)
+    try:
+        # Orchestrated extraction
+        print(f"   🎯 Using orchestrator for {filename}")
+        
+        section_map = await SectionizerAgent(pdf_path).analyze_document_async(session, limiter)
+        print(f"   📄 Identified sections: {list(section_map.keys())}")
+        
+        orchestrator = OrchestratorAgent(pdf_path, registry.prompts, session=session, limiter=limiter)
+        results = await orchestrator.run_workflow(section_map)
+        outcome.update(reused_tasks=orchestrator.usage["reused_tasks"], reuse_eligible=orchestrator.usage["reuse_eligible"])
+        
+        # Validation and gates
+        results = validate_and_schema_enforce(results)
+        gates = gate_engine.evaluate({str(doc_id): results}).gates_status(str(doc_id))
+        
+        # Coaching if needed
+        coach_if_needed(results, gates)
+        
+        # Write results and receipts
+        await asyncio.to_thread(write_results_and_receipts, doc_id, results, gates, run_id)
+        
+        # Log success
+        logger.log_model_call(
+            section="orchestrator",
+            model="qwen-vl-chat",
+            transport="http",
+            http_status=200,
+            json_ok=True,
+            schema_ok=gates["gates_passed"],
+            latency_ms=int((time.perf_counter() - t0) * 1000),
+            pages_used=list(range(1, len(section_map) + 1)),
+            pdf_path=filename,
+            additional_metadata={
+                "document_id": str(doc_id), 
+                "agent": "orchestrator",
+                "gates_passed": gates["gates_passed"]
+            }
+        )
+        
+        if gates["gates_passed"]:
+            print(f"   ✅ {filename} processed successfully")
+            metrics.DOCS.inc(status="done")
+            outcome["status"] = "done"
+        else:
+            print(f"   ❌ {filename} failed acceptance gates")
+            metrics.DOCS.inc(status="failed")
+            outcome.update(status="gates_failed", failures=gates.get("failures", []))
+    except Exception as e:
+        metrics.DOCS.inc(status="failed")
+        print(f"   ❌ {filename} errored: {e}\n{traceback.format_exc()}")
+        outcome["error"] = str(e)
+    finally:
+        if os.environ.get("METRICS_FILE"): metrics.dump(os.environ["METRICS_FILE"])
+        # Clean up temporary PDF
+        if os.path.exists(pdf_path):
+            os.unlink(pdf_path)
+    outcome["seconds"] = round(time.perf_counter() - t0, 3)
+    return outcome
+
+async def _run_docs(run_id: str, next_id, emit, stop: threading.Event, fail_fast: bool, concurrency: int):
+    """One worker: an event loop pulling document ids from next_id() until it returns None.
+    emit(outcome) is called per document; with fail_fast the first non-done outcome sets stop."""
+    logger = ReceiptLogger(run_id)
+    registry = get_registry(str(REGISTRY_PATH), coaching=_coaching())
+    
+    twin_agents = os.environ.get("TWIN_AGENTS", "0") == "1"
+    # Initialize agents
+    qwen_agent = QwenAgent()
+    gemini_agent = GeminiAgent() if twin_agents else None
+    
+    # Prod extractions carry no cash_flow section (see validate_and_schema_enforce): checks of absent sections are skipped
+    gate_engine = GateEngine(load_expectations(ACCEPTANCE_EXPECTATIONS) if ACCEPTANCE_EXPECTATIONS else None,
+                             default=None if ACCEPTANCE_EXPECTATIONS else CANARY_GATES, skip_missing=True)
+    
+    # Documents in flight on this worker share one connection pool and one cap on VLM requests
+    session = aiohttp.ClientSession(); limiter = make_limiter()
+    
+    async def loop():
+        while not stop.is_set():
+            doc_id = await asyncio.to_thread(next_id)
+            if doc_id is None: return
+            doc = await asyncio.to_thread(fetch_doc, doc_id)
+            if doc is None: continue
+            outcome = await process_document(doc, registry, gate_engine, logger, run_id, session, limiter)
+            emit(outcome)
+            if fail_fast and outcome["status"] != "done": stop.set()
+    
+    try:
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    finally:
+        await session.close()
+    return logger.get_run_summary()
+
+def _worker_main(run_id: str, jobs, results, stop, fail_fast: bool, concurrency: int):
+    """Worker process entry point: own event loop and DB pool; outcomes and a final summary go to results"""
+    def next_id():
+        while not stop.is_set():
+            try: return jobs.get(timeout=1)
+            except queue.Empty: continue
+        return None
+    if os.environ.get("METRICS_FILE"):
+        os.environ["METRICS_FILE"] = f"{os.environ['METRICS_FILE']}.{os.getpid()}"  # the supervisor owns the main file
+    try:
+        summary = asyncio.run(_run_docs(run_id, next_id, results.put, stop, fail_fast, concurrency))
+        results.put({"worker_summary": summary, "worker": os.getpid()})
+    except Exception as e:
+        results.put({"worker_error": str(e), "worker": os.getpid()}); stop.set()
+
+def summarize_run(run_id: str, doc_ids: List[int], outcomes: List[Dict[str, Any]], worker_info: List[Dict[str, Any]], wall_s: float) -> Dict[str, Any]:
+    by_status = {s: [o for o in outcomes if o["status"] == s] for s in ("done", "gates_failed", "error")}
+    per_worker: Dict[str, int] = {}
+    for o in outcomes: per_worker[str(o["worker"])] = per_worker.get(str(o["worker"]), 0) + 1
+    eligible = sum(o.get("reuse_eligible", 0) for o in outcomes); reused = sum(o.get("reused_tasks", 0) for o in outcomes)
+    return {
+        "run_id": run_id,
+        "docs": len(doc_ids),
+        "processed": len(outcomes),
+        "done": len(by_status["done"]),
+        "gates_failed": len(by_status["gates_failed"]),
+        "errors": len(by_status["error"]),
+        "not_processed": len(doc_ids) - len(outcomes),
+        "wall_s": round(wall_s, 2),
+        "docs_per_min": round(len(outcomes) / wall_s * 60, 2) if wall_s else None,
+        "per_worker": per_worker,
+        "page_reuse": {"eligible_tasks": eligible, "reused_tasks": reused, "rate": round(reused / eligible, 4) if eligible else None},
+        "failures": [{k: o.get(k) for k in ("doc_id", "filename", "status", "failures", "error")} for o in outcomes if o["status"] != "done"],
+        "workers": worker_info,
+    }
+
+def run_from_db(run_id: str, limit: int = 1, workers: int = 1, continue_on_failure: bool = False, concurrency: int = 1) -> int:
     """
     Unified production pipeline runner.
+    Documents are sharded over `workers` processes (each its own event loop and DB pool, `concurrency`
+    documents in flight per worker). By default the run stops at the first document that fails its
+    gates or errors; with continue_on_failure every document is attempted.
     Returns 0 for success, 1 for failure.
     """
     print(f"🚀 UNIFIED PRODUCTION PIPELINE: {run_id}")
-    print(f"📊 Processing {limit} documents from H100 database")
+    print(f"📊 Processing {limit} documents from H100 database ({workers} worker(s) x {concurrency})")
     
     try:
         # Step 1: Preflight checks
         preflight()
         
-        # Step 2: Fetch documents
-        docs = fetch_docs_from_db(limit)
-        if not docs:
+        # Step 2: Fetch document ids (workers load the PDFs themselves)
+        doc_ids = fetch_doc_ids(limit)
+        if not doc_ids:
             print("❌ No documents found")
             return 1
         
-        print(f"📋 Found {len(docs)} documents to process")
-        
-        # Step 3: Initialize agents and prompts
-        logger = ReceiptLogger(run_id)
-        prompts_path = Path(__file__).parent.parent.parent / "prompts" / "registry.json"
-        prompts = load_prompts(str(prompts_path))
+        print(f"📋 Found {len(doc_ids)} documents to process")
+        if os.environ.get("METRICS_PORT"):
+            metrics.serve(int(os.environ["METRICS_PORT"])); print(f"📈 Metrics on :{os.environ['METRICS_PORT']}/metrics")
+        metrics.QUEUE_DEPTH.set(len(doc_ids))
+        print(f"🤖 Twin agents mode: {os.environ.get('TWIN_AGENTS', '0') == '1'}")
+        fail_fast = not continue_on_failure
+        outcomes: List[Dict[str, Any]] = []; worker_info: List[Dict[str, Any]] = []
+        t0 = time.perf_counter()
         
-        twin_agents = os.environ.get("TWIN_AGENTS", "0") == "1"
-        print(f"🤖 Twin agents mode: {twin_agents}")
-        
-        # Initialize agents
-        qwen_agent = QwenAgent()
-        gemini_agent = GeminiAgent() if twin_agents else None
-        
-        success_count = 0
-        
-        # Step 4: Process each document
-        for doc in docs:
-            doc_id, filename, pdf_binary = doc["id"], doc["filename"], doc["pdf_binary"]
-            print(f"🔍 Processing: {filename}")
-            
-            pdf_path = materialize_pdf(pdf_binary)
-            
-            try:
-                # Orchestrated extraction
-                print(f"   🎯 Using orchestrator for {filename}")
-                
-                section_map = SectionizerAgent(pdf_path).analyze_document()
-                print(f"   📄 Identified sections: {list(section_map.keys())}")
-                
-                orchestrator = OrchestratorAgent(pdf_path, prompts)
-                results = asyncio.run(orchestrator.run_workflow(section_map))
-                
-                # Validation and gates
-                results = validate_and_schema_enforce(results)
-                gates = run_acceptance_gates(results)
-                
-                # Coaching if needed
-                coach_if_needed(results, gates)
-                
-                # Write results and receipts
-                write_results_and_receipts(doc_id, results, gates, run_id)
-                
-                # Log success
-                logger.log_model_call(
-                    section="orchestrator",
-                    model="qwen-vl-chat",
-                    transport="http",
-                    http_status=200,
-                    json_ok=True,
-                    schema_ok=gates["gates_passed"],
-                    latency_ms=0,  # TODO: Time this
-                    pages_used=list(range(1, len(section_map) + 1)),
-                    pdf_path=filename,
-                    additional_metadata={
-                        "document_id": str(doc_id), 
-                        "agent": "orchestrator",
-                        "gates_passed": gates["gates_passed"]
-                    }
-                )
-                
-                if gates["gates_passed"]:
-                    print(f"   ✅ {filename} processed successfully")
-                    success_count += 1
+        # Step 3-4: Process documents
+        if workers <= 1:
+            ids = iter(doc_ids); lock = threading.Lock(); stop = threading.Event()
+            def next_id():
+                with lock: return next(ids, None)
+            def emit(outcome):
+                # QUEUE_DEPTH is only moved here and in the supervisor; worker processes have their own gauge at 0
+                outcomes.append(outcome); metrics.QUEUE_DEPTH.dec()
+            summary = asyncio.run(_run_docs(run_id, next_id, emit, stop, fail_fast, concurrency))
+            worker_info.append({"worker": os.getpid(), "summary": summary})
+        else:
+            # spawn, not fork: workers must not inherit the parent's sockets, pool or event loop
+            ctx = mp.get_context("spawn")
+            jobs, results, stop = ctx.Queue(), ctx.Queue(), ctx.Event()
+            for doc_id in doc_ids: jobs.put(doc_id)
+            for _ in range(workers * concurrency): jobs.put(None)
+            procs = [ctx.Process(target=_worker_main, args=(run_id, jobs, results, stop, fail_fast, concurrency), name=f"prod-worker-{i}")
+                     for i in range(workers)]
+            for p in procs: p.start()
+            def drain(timeout):
+                try: msg = results.get(timeout=timeout)
+                except queue.Empty: return False
+                if "status" in msg:
+                    outcomes.append(msg); metrics.QUEUE_DEPTH.dec()
+                    metrics.DOCS.inc(status="done" if msg["status"] == "done" else "failed")
+                    if os.environ.get("METRICS_FILE"): metrics.dump(os.environ["METRICS_FILE"])
+                    print(f"   [{len(outcomes)}/{len(doc_ids)}] {msg['filename']}: {msg['status']} ({msg['seconds']}s, worker {msg['worker']})")
                 else:
-                    print(f"   ❌ {filename} failed acceptance gates")
-                    return 1  # Fail fast on gate failures
-                    
-            finally:
-                # Clean up temporary PDF
-                if os.path.exists(pdf_path):
-                    os.unlink(pdf_path)
+                    worker_info.append(msg)
+                    if "worker_error" in msg: print(f"❌ Worker {msg['worker']} crashed: {msg['worker_error']}")
+                return True
+            while any(p.is_alive() for p in procs): drain(1)
+            while drain(0.1): pass
+            jobs.cancel_join_thread()  # ids left behind after a fail-fast stop must not block exit
+            for p in procs:
+                p.join()
+                if p.exitcode: worker_info.append({"worker": p.pid, "exitcode": p.exitcode})
         
         # Step 5: Summary
-        summary = logger.get_run_summary()
-        print(f"📈 Run Summary: {summary}")
+        summary = summarize_run(run_id, doc_ids, outcomes, worker_info, time.perf_counter() - t0)
+        os.makedirs(f"artifacts/acceptance/{run_id}", exist_ok=True)
+        with open(f"artifacts/acceptance/{run_id}/run_summary.json", "w") as f:
+            json.dump(summary, f, indent=2, default=str)
+        print(f"📈 Run Summary: {json.dumps({k: v for k, v in summary.items() if k not in ('failures', 'workers')})}")
+        for fail in summary["failures"][:10]:
+            print(f"   ❌ {fail['filename']}: {fail['status']} {fail.get('error') or fail.get('failures')}")
         
-        print(f"✅ UNIFIED PIPELINE COMPLETED: {success_count}/{len(docs)} documents processed")
-        return 0 if success_count > 0 else 1
+        print(f"✅ UNIFIED PIPELINE COMPLETED: {summary['done']}/{len(doc_ids)} documents processed")
+        if fail_fast and summary["done"] < summary["processed"]:
+            return 1  # Fail fast on gate failures
+        return 0 if summary["done"] > 0 else 1
         
     except Exception as e:
-        import traceback
         print(f"❌ Pipeline error: {str(e)}")
         print(f"📋 Full traceback:\n{traceback.format_exc()}")
         return 1
@@ -320,4 +469,4 @@ def run_from_db(run_id: str, limit: int = 1) -> int:
 if __name__ == "__main__":
     import uuid
     test_run_id = f"PROD_{uuid.uuid4().hex[:8].upper()}"
-    sys.exit(run_from_db(test_run_id, 1))
\ No newline at end of file
+    sys.exit(run_from_db(test_run_id, 1))
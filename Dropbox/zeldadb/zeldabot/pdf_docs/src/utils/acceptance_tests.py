@@ -5,9 +5,12 @@ Numeric validation with tolerances, fail-fast policy
 """
 import os
 import sys
+import csv
 import json
 import psycopg2
 import argparse
+import numpy as np
+from datetime import datetime
 from typing import Dict, Any, List, Optional
 from pathlib import Path
 
@@ -29,6 +32,21 @@ CANARY_GATES = {
 TOLERANCE_PERCENT = 0.01  # ±1%
 TOLERANCE_SEK = 5000      # ±5k SEK
 
+# Gate checks: name -> (label, sections tried in order, field fallbacks, kind)
+GATE_CHECKS = {
+    "total_assets": ("Total Assets", ("balance_sheet",), ("total_assets",), "numeric"),
+    "total_debt": ("Total Debt", ("balance_sheet",), ("loans", "total_debt", "long_term_debt"), "numeric"),
+    "cash_closing": ("Cash Closing", ("cash_flow",), ("cash_closing", "cash_and_equivalents"), "numeric"),
+    "org_number": ("Org number", ("brf_info", "governance"), ("organization_number", "org_number"), "org"),
+    "chairman": ("Chairman", ("brf_info", "governance"), ("chairman",), "name"),
+    "auditor_name": ("Auditor", ("brf_info", "governance"), ("auditor_name",), "name"),
+}
+SECTION_MISSING = {
+    ("balance_sheet",): "Balance sheet section missing",
+    ("cash_flow",): "Cash flow section missing",
+    ("brf_info", "governance"): "Organization/governance info missing",
+}
+
 def normalize_name(name: str) -> str:
     """Normalize names for comparison"""
     if not name:
@@ -55,80 +73,183 @@ def check_numeric_tolerance(actual: float, expected: float, label: str) -> Optio
     
     return None
 
-def run_acceptance_gates(results: Dict[str, Any]) -> Dict[str, Any]:
-    """Run acceptance gates against extraction results"""
-    gates_status = {
-        "gates_passed": True,
-        "failures": [],
-        "checks_performed": 0,
-        "timestamp": "2025-08-27T12:00:00Z"  # Would use actual timestamp
-    }
-    
-    # Financial checks
-    if "balance_sheet" in results:
-        bs = results["balance_sheet"]
-        gates_status["checks_performed"] += 1
-        
-        # Assets check
-        actual_assets = float(bs.get("total_assets", 0))
-        error = check_numeric_tolerance(actual_assets, CANARY_GATES["total_assets"], "Total Assets")
-        if error:
-            gates_status["failures"].append(error)
-            gates_status["gates_passed"] = False
-        
-        # Debt check (try multiple field names)
-        actual_debt = float(bs.get("loans", 0) or bs.get("total_debt", 0) or bs.get("long_term_debt", 0))
-        error = check_numeric_tolerance(actual_debt, CANARY_GATES["total_debt"], "Total Debt")
-        if error:
-            gates_status["failures"].append(error)
-            gates_status["gates_passed"] = False
-    else:
-        gates_status["failures"].append("Balance sheet section missing")
-        gates_status["gates_passed"] = False
-    
-    # Cash flow check
-    if "cash_flow" in results:
-        cf = results["cash_flow"]
-        gates_status["checks_performed"] += 1
-        
-        actual_cash = float(cf.get("cash_closing", 0) or cf.get("cash_and_equivalents", 0))
-        error = check_numeric_tolerance(actual_cash, CANARY_GATES["cash_closing"], "Cash Closing")
-        if error:
-            gates_status["failures"].append(error)
-            gates_status["gates_passed"] = False
-    else:
-        gates_status["failures"].append("Cash flow section missing")
-        gates_status["gates_passed"] = False
-    
-    # Organization info check
-    if "brf_info" in results or "governance" in results:
-        org_info = results.get("brf_info", {}) or results.get("governance", {})
-        gates_status["checks_performed"] += 1
-        
-        # Organization number
-        org_no = str(org_info.get("organization_number", "") or org_info.get("org_number", ""))
-        if CANARY_GATES["org_number"] not in org_no:
-            gates_status["failures"].append(f"Org number: expected {CANARY_GATES['org_number']}, got '{org_no}'")
-            gates_status["gates_passed"] = False
-        
-        # Chairman
-        chairman = normalize_name(str(org_info.get("chairman", "")))
-        expected_chairman = normalize_name(CANARY_GATES["chairman"])
-        if expected_chairman not in chairman and chairman not in expected_chairman:
-            gates_status["failures"].append(f"Chairman: expected '{CANARY_GATES['chairman']}', got '{org_info.get('chairman', '')}'")
-            gates_status["gates_passed"] = False
-        
-        # Auditor
-        auditor = normalize_name(str(org_info.get("auditor_name", "")))
-        expected_auditor = normalize_name(CANARY_GATES["auditor_name"])
-        if expected_auditor not in auditor and auditor not in expected_auditor:
-            gates_status["failures"].append(f"Auditor: expected '{CANARY_GATES['auditor_name']}', got '{org_info.get('auditor_name', '')}'")
-            gates_status["gates_passed"] = False
+def _to_float(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return float("nan")
+
+def _section(results: Dict[str, Any], sections: tuple) -> Optional[Dict[str, Any]]:
+    """First present section, mirroring results.get("brf_info", {}) or results.get("governance", {})"""
+    if not any(s in results for s in sections):
+        return None
+    for s in sections:
+        if results.get(s):
+            return results[s] if isinstance(results[s], dict) else {}
+    return {}
+
+def _field(section: Dict[str, Any], fields: tuple) -> Any:
+    for f in fields:
+        if section.get(f):
+            return section[f]
+    return section.get(fields[-1], "")
+
+def load_expectations(source: str) -> Dict[str, Dict[str, Any]]:
+    """Load per-document expectations keyed by document id.
+
+    source: a .json file ({id: {...}} or [{"document_id": ...}, ...]), a .csv file with a
+    document_id column plus GATE_CHECKS columns, or "db" for the acceptance_expectations table
+    (document_id, expected jsonb).
+    """
+    rows: List[Dict[str, Any]] = []
+    if source == "db":
+        conn = psycopg2.connect(os.environ["DATABASE_URL"])
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT document_id, expected FROM acceptance_expectations")
+            rows = [dict(expected or {}, document_id=doc_id) for doc_id, expected in cursor.fetchall()]
+        finally:
+            conn.close()
+    elif source.endswith(".csv"):
+        with open(source, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                rows.append({k: v for k, v in row.items() if v not in (None, "")})
     else:
-        gates_status["failures"].append("Organization/governance info missing")
-        gates_status["gates_passed"] = False
-    
-    return gates_status
+        with open(source, encoding="utf-8") as f:
+            data = json.load(f)
+        rows = [dict(v, document_id=k) for k, v in data.items()] if isinstance(data, dict) else data
+    expectations = {}
+    for row in rows:
+        key = str(row.pop("document_id"))
+        for name, (_, _, _, kind) in GATE_CHECKS.items():
+            if kind == "numeric" and name in row:
+                row[name] = float(row[name])
+        expectations[key] = row
+    return expectations
+
+class GateReport:
+    """Result of one vectorized gate pass: a docs x checks failure matrix plus messages"""
+    def __init__(self, keys: List[str], checks: List[str], failed: np.ndarray, evaluated: np.ndarray,
+                 messages: Dict[str, List[str]], checks_performed: np.ndarray):
+        self.keys, self.checks = keys, checks
+        self.failed, self.evaluated = failed, evaluated
+        self.messages, self.checks_performed = messages, checks_performed
+
+    @property
+    def passed(self) -> np.ndarray:
+        return ~self.failed.any(axis=1)
+
+    def gates_status(self, key: str) -> Dict[str, Any]:
+        i = self.keys.index(key)
+        return {
+            "gates_passed": bool(self.passed[i]),
+            "failures": self.messages.get(key, []),
+            "checks_performed": int(self.checks_performed[i]),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.keys),
+            "passed": int(self.passed.sum()),
+            "failed": int((~self.passed).sum()),
+            "failures_per_check": {c: int(n) for c, n in zip(self.checks, self.failed.sum(axis=0))},
+        }
+
+    def write_matrix(self, path: str):
+        """Write the failure matrix as CSV: one row per document, 1 = failed, blank = not evaluated"""
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["document_id", "gates_passed"] + self.checks)
+            for i, key in enumerate(self.keys):
+                w.writerow([key, int(self.passed[i])] + [int(self.failed[i, j]) if self.evaluated[i, j] else "" for j in range(len(self.checks))])
+
+class GateEngine:
+    """Evaluate acceptance gates for many extractions at once.
+
+    expectations maps document id -> {check name: expected value}; documents without an entry
+    use `default` (None = no gates, so they pass). A section absent from an extraction fails its
+    checks, unless skip_missing is set: its checks are then not performed (prod's behaviour).
+    """
+    def __init__(self, expectations: Optional[Dict[str, Dict[str, Any]]] = None, default: Optional[Dict[str, Any]] = None,
+                 tolerance_percent: float = TOLERANCE_PERCENT, tolerance_sek: float = TOLERANCE_SEK, skip_missing: bool = False):
+        self.expectations = expectations or {}
+        self.default = default
+        self.skip_missing = skip_missing
+        self.tolerance_percent = tolerance_percent
+        self.tolerance_sek = tolerance_sek
+
+    def evaluate(self, extractions: Dict[str, Dict[str, Any]]) -> GateReport:
+        keys = [str(k) for k in extractions]
+        docs = list(extractions.values())
+        checks = list(GATE_CHECKS)
+        n, m = len(keys), len(checks)
+        failed = np.zeros((n, m), dtype=bool)
+        evaluated = np.zeros((n, m), dtype=bool)
+        missing = np.zeros((n, m), dtype=bool)
+        messages: Dict[str, List[str]] = {}
+        exps = [self.expectations.get(k, self.default) or {} for k in keys]
+
+        # Gather actual values column by column (one Python pass), then compare vectorized
+        actual: Dict[str, List[Any]] = {}
+        groups_present: Dict[tuple, np.ndarray] = {}
+        for group in SECTION_MISSING:
+            sections = [_section(d or {}, group) for d in docs]
+            groups_present[group] = np.array([s is not None for s in sections], dtype=bool)
+            for j, name in enumerate(checks):
+                _, sec_keys, fields, _ = GATE_CHECKS[name]
+                if sec_keys == group:
+                    actual[name] = [_field(s, fields) if s is not None else None for s in sections]
+                    evaluated[:, j] = [name in e for e in exps]
+                    if self.skip_missing:
+                        evaluated[:, j] &= groups_present[group]
+                    missing[:, j] = evaluated[:, j] & ~groups_present[group]
+
+        for j, name in enumerate(checks):
+            label, _, _, kind = GATE_CHECKS[name]
+            ev = evaluated[:, j] & ~missing[:, j]
+            if not ev.any():
+                continue
+            if kind == "numeric":
+                a = np.array([_to_float(v) for v in actual[name]])
+                e = np.array([float(x.get(name, np.nan)) for x in exps])
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    diff = np.abs(a - e)
+                    pct = np.where(e != 0, diff / np.abs(e), 0.0)
+                    bad = ((a == 0) & (e != 0)) | ((e == 0) & (a != 0)) | ((pct > self.tolerance_percent) & (diff > self.tolerance_sek)) | np.isnan(a)
+                failed[:, j] = ev & bad
+                for i in np.flatnonzero(failed[:, j]):
+                    msg = check_numeric_tolerance(a[i], exps[i][name], label) if not np.isnan(a[i]) else f"{label}: not numeric: {actual[name][i]!r}"
+                    messages.setdefault(keys[i], []).append(msg or f"{label}: expected {exps[i][name]:,}, got {a[i]:,}")
+            elif kind == "org":
+                for i in np.flatnonzero(ev):
+                    got = str(actual[name][i] or "")
+                    if str(exps[i][name]) not in got:
+                        failed[i, j] = True
+                        messages.setdefault(keys[i], []).append(f"{label}: expected {exps[i][name]}, got '{got}'")
+            else:
+                for i in np.flatnonzero(ev):
+                    got = normalize_name(str(actual[name][i] or ""))
+                    want = normalize_name(str(exps[i][name]))
+                    if not got or (want not in got and got not in want):
+                        failed[i, j] = True
+                        messages.setdefault(keys[i], []).append(f"{label}: expected '{exps[i][name]}', got '{actual[name][i] or ''}'")
+
+        # A missing section fails every gated check in it, with one message per section
+        failed |= missing
+        checks_performed = np.zeros(n, dtype=int)
+        for group, msg in SECTION_MISSING.items():
+            cols = [j for j, name in enumerate(checks) if GATE_CHECKS[name][1] == group]
+            gated = evaluated[:, cols].any(axis=1)
+            checks_performed += gated & groups_present[group]
+            for i in np.flatnonzero(gated & ~groups_present[group]):
+                messages.setdefault(keys[i], []).append(msg)
+        return GateReport(keys, checks, failed, evaluated, messages, checks_performed)
+
+def run_acceptance_gates(results: Dict[str, Any], expected: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Run acceptance gates against one extraction (Sjöstaden 2 canary unless `expected` is given)"""
+    report = GateEngine(default=expected or CANARY_GATES).evaluate({"_": results})
+    return report.gates_status("_")
 
 def test_canary_document() -> int:
     """Test against the actual Sjöstaden 2 document in database"""
@@ -179,16 +300,46 @@ def test_canary_document() -> int:
         if 'conn' in locals():
             conn.close()
 
+def gate_corpus(expectations_source: str, out_dir: str) -> int:
+    """Gate every extracted document that has expectations, in one pass"""
+    expectations = load_expectations(expectations_source)
+    print(f"🎯 Gating {len(expectations)} documents with expectations")
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    try:
+        cursor = conn.cursor(name="gate_corpus")  # server-side cursor: stream, don't buffer the corpus
+        cursor.itersize = 500
+        cursor.execute("""
+            SELECT id, extraction_data
+            FROM arsredovisning_documents
+            WHERE extraction_data IS NOT NULL
+        """)
+        extractions = {str(doc_id): data for doc_id, data in cursor if str(doc_id) in expectations}
+    finally:
+        conn.close()
+    
+    report = GateEngine(expectations).evaluate(extractions)
+    os.makedirs(out_dir, exist_ok=True)
+    report.write_matrix(os.path.join(out_dir, "failure_matrix.csv"))
+    summary = dict(report.summary(), missing_extractions=sorted(set(expectations) - set(extractions)))
+    with open(os.path.join(out_dir, "gates_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"✅ {summary['passed']}/{summary['documents']} documents passed; failures per check: {summary['failures_per_check']}")
+    return 0 if summary["failed"] == 0 else 1
+
 def main():
     parser = argparse.ArgumentParser(description="Run acceptance gate tests")
     parser.add_argument("--canary", choices=["sjostaden_2_2024"], 
                        help="Run canary test against specific document")
+    parser.add_argument("--expectations", help="Per-document expectations: .json, .csv or 'db'")
+    parser.add_argument("--out", default="artifacts/acceptance/corpus", help="Output dir for the failure matrix")
     args = parser.parse_args()
     
     if args.canary == "sjostaden_2_2024":
         return test_canary_document()
+    elif args.expectations:
+        return gate_corpus(args.expectations, args.out)
     else:
-        print("No test specified. Use --canary sjostaden_2_2024")
+        print("No test specified. Use --canary sjostaden_2_2024 or --expectations <file|db>")
         return 1
 
 if __name__ == "__main__":
@@ -5,38 +5,145 @@ Applies coaching deltas at runtime without modifying base templates
 """
 import os
 import json
+import heapq
 import hashlib
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+# Rewrite the append-only file once it holds this many more lines than unique deltas
+COMPACT_SLACK = int(os.getenv("COACHING_COMPACT_SLACK", "1000"))
 
 class CoachingSystem:
-    def __init__(self, memory_path: str = "coaching/memory.ndjson"):
+    def __init__(self, memory_path: str = "coaching/memory.ndjson", compact_slack: int = COMPACT_SLACK):
         self.memory_path = Path(memory_path)
         self.memory_path.parent.mkdir(parents=True, exist_ok=True)
-        self.deltas = self._load_memory()
+        self.compact_slack = compact_slack
+        self.deltas: List[Dict[str, Any]] = []
+        self._hashes = set()
+        self._by_section: Dict[str, List[Tuple[int, str]]] = {}  # section -> [(seq, prompt_addition)]
+        self._suffix_cache: Dict[str, str] = {}
+        self._file_lines = 0
+        self._offset = 0  # bytes of the memory file read into self.deltas
+        self._inode = None  # that file's inode; compaction elsewhere replaces it
+        self.load_errors = 0  # unreadable lines seen at load; the file is then never compacted
+        self.version = 0  # bumped on every new delta so prompt builders can cache
+        for delta in self._load_memory():
+            self._index(delta)
+        if self._file_lines - len(self.deltas) > self.compact_slack:
+            self.compact()
+    
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock shared by every process using this memory file (appends and compaction)."""
+        if fcntl is None:
+            yield; return
+        with open(self.memory_path.with_suffix(self.memory_path.suffix + ".lock"), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
     
     def _load_memory(self) -> List[Dict[str, Any]]:
-        """Load coaching deltas from NDJSON file"""
+        """Load coaching deltas from NDJSON file past self._offset (duplicates are dropped by _index).
+        Corrupt lines are skipped and counted in load_errors; the rest of the file still loads.
+        A trailing line without newline (an append in progress) is left for the next read."""
         deltas = []
         if self.memory_path.exists():
             try:
-                with open(self.memory_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if line:
-                            deltas.append(json.loads(line))
-            except Exception as e:
+                with open(self.memory_path, 'rb') as f:
+                    self._inode = os.fstat(f.fileno()).st_ino
+                    f.seek(self._offset)
+                    for raw in f:
+                        if not raw.endswith(b'\n'):
+                            break
+                        self._offset += len(raw)
+                        line = raw.decode('utf-8', errors='replace').strip()
+                        if not line:
+                            continue
+                        self._file_lines += 1
+                        try:
+                            delta = json.loads(line)
+                        except ValueError as e:
+                            self.load_errors += 1
+                            print(f"⚠️  Skipping corrupt coaching memory line {self._file_lines}: {e}")
+                            continue
+                        if isinstance(delta, dict):
+                            deltas.append(delta)
+                        else:
+                            self.load_errors += 1
+            except OSError as e:
+                self.load_errors += 1
                 print(f"⚠️  Error loading coaching memory: {e}")
         return deltas
     
+    def _index(self, delta: Dict[str, Any]) -> bool:
+        """Add delta to the in-memory indexes; returns False if its hash is already known"""
+        h = delta.get("delta_hash")
+        if h is not None:
+            if h in self._hashes:
+                return False
+            self._hashes.add(h)
+        seq = len(self.deltas)
+        self.deltas.append(delta)
+        section = delta.get("section", "unknown")
+        if "prompt_addition" in delta:
+            self._by_section.setdefault(section, []).append((seq, delta["prompt_addition"]))
+            # "general" deltas apply to every section
+            if section == "general":
+                self._suffix_cache.clear()
+            else:
+                self._suffix_cache.pop(section, None)
+        self.version += 1
+        return True
+    
     def _save_delta(self, delta: Dict[str, Any]):
-        """Append delta to NDJSON memory file"""
+        """Append delta to NDJSON memory file (under the lock, so a concurrent compaction can't drop it)"""
+        line = (json.dumps(delta, ensure_ascii=False) + '\n').encode('utf-8')
         try:
-            with open(self.memory_path, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(delta, ensure_ascii=False) + '\n')
+            with self._locked(), open(self.memory_path, 'ab') as f:
+                if os.fstat(f.fileno()).st_ino == self._inode and f.tell() == self._offset:  # nothing unread before our line
+                    self._offset += len(line)
+                f.write(line)
+            self._file_lines += 1
         except Exception as e:
             print(f"❌ Error saving coaching delta: {e}")
+            return
+        if self._file_lines - len(self.deltas) > self.compact_slack and not self.load_errors:
+            self.compact()
+    
+    def compact(self):
+        """Rewrite the memory file with one line per unique delta (atomic replace).
+        Runs under the file lock after reading deltas other processes appended since our last read,
+        so none are lost. If another process compacted meanwhile (the file was replaced), it is
+        re-read from the start. Skipped when a load hit errors: self.deltas may not
+        hold everything in the file."""
+        if self.load_errors:
+            print(f"⚠️  Not compacting {self.memory_path}: {self.load_errors} unreadable line(s) at load")
+            return
+        tmp_path = self.memory_path.with_suffix(self.memory_path.suffix + ".tmp")
+        try:
+            with self._locked():
+                if self.memory_path.exists() and self.memory_path.stat().st_ino != self._inode:
+                    self._offset = 0; self._file_lines = 0
+                for delta in self._load_memory():
+                    self._index(delta)
+                if self.load_errors:
+                    print(f"⚠️  Not compacting {self.memory_path}: {self.load_errors} unreadable line(s)")
+                    return
+                data = ''.join(json.dumps(delta, ensure_ascii=False) + '\n' for delta in self.deltas).encode('utf-8')
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.memory_path)
+                self._file_lines = len(self.deltas); self._offset = len(data)
+        except Exception as e:
+            print(f"❌ Error compacting coaching memory: {e}")
     
     def _delta_hash(self, section: str, pattern: str, action: str) -> str:
         """Generate hash for delta deduplication"""
@@ -102,27 +209,28 @@ class CoachingSystem:
                 }
             
             # Check for duplicates
-            if not any(d.get("delta_hash") == delta["delta_hash"] for d in self.deltas):
+            if self._index(delta):
                 new_deltas.append(delta)
                 self._save_delta(delta)
-                self.deltas.append(delta)
                 print(f"🧠 New coaching delta created: {delta['coaching_action']}")
             else:
                 print(f"🔄 Coaching delta already exists: {delta['coaching_action']}")
         
         return new_deltas
     
+    def prompt_suffix(self, section: str) -> str:
+        """Concatenated prompt additions for a section (plus general ones), in memory order"""
+        suffix = self._suffix_cache.get(section)
+        if suffix is None:
+            own = self._by_section.get(section, [])
+            general = self._by_section.get("general", []) if section != "general" else []
+            suffix = "".join(addition for _, addition in heapq.merge(own, general))
+            self._suffix_cache[section] = suffix
+        return suffix
+    
     def load_prompt_with_coaching(self, section: str, base_prompt: str) -> str:
         """Apply coaching deltas to base prompt at runtime"""
-        enhanced_prompt = base_prompt
-        
-        # Apply relevant deltas for this section
-        for delta in self.deltas:
-            if delta.get("section") == section or delta.get("section") == "general":
-                if "prompt_addition" in delta:
-                    enhanced_prompt += delta["prompt_addition"]
-        
-        return enhanced_prompt
+        return base_prompt + self.prompt_suffix(section)
     
     def get_coaching_stats(self) -> Dict[str, Any]:
         """Get statistics about coaching memory"""
@@ -136,5 +244,6 @@ class CoachingSystem:
         return {
             "total_deltas": len(self.deltas),
             "sections": sections,
+            "memory_file_lines": self._file_lines,
             "memory_file_size": self.memory_path.stat().st_size if self.memory_path.exists() else 0
         }
\ No newline at end of file